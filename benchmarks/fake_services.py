@@ -0,0 +1,388 @@
+"""
+Local stand-ins for every external service the API calls, served by one FastAPI app.
+
+- `/llm/v1/chat/completions`: OpenAI-compatible chat completions, used for OpenAI and Groq
+- `/serpapi/search`: SerpAPI google_flights results
+- `/serper/search`: Serper organic results pointing at `/pages/...`
+- `/pages/{page_id}`: HTML pages to scrape
+- `/getimg/text-to-image`: getimg images
+- `/mcp/{server}/{tool}`: results of the stub Google Maps and Airbnb MCP servers (stub_mcp.py)
+- `/stats`: calls per service since the last `POST /stats/reset`
+
+Latencies are set with env vars: FAKE_LLM_TTFT_SECONDS and FAKE_LLM_TOKENS_PER_SECOND for
+models, FAKE_SERVICE_LATENCY_SECONDS for everything else. Model answers are generated from
+the response schema of the request, so structured outputs parse; FAKE_LLM_TOOL_CALLS tools
+matching FAKE_LLM_TOOL_PATTERN are called on the first turn of a run that has tools.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from collections import Counter
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+
+LLM_TTFT_SECONDS = float(os.getenv("FAKE_LLM_TTFT_SECONDS", "0.3"))
+LLM_TOKENS_PER_SECOND = float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "100"))
+SERVICE_LATENCY_SECONDS = float(os.getenv("FAKE_SERVICE_LATENCY_SECONDS", "0.1"))
+LLM_TOOL_CALLS = int(os.getenv("FAKE_LLM_TOOL_CALLS", "1"))
+LLM_TOOL_PATTERN = re.compile(
+    os.getenv(
+        "FAKE_LLM_TOOL_PATTERN",
+        r"^(maps_|airbnb_|get_top_internet_search_results|research_destination|search_flights|FlightsSearchTool)",
+    )
+)
+ARRAY_LENGTH = 2
+FLIGHT_OPTIONS = 12
+ORGANIC_RESULTS = 5
+
+app = FastAPI(title="Fake external services")
+calls: Counter = Counter()
+
+DATE_PATTERN = re.compile(r"\b(20\d\d-\d\d-\d\d)\b")
+
+
+async def _service_latency() -> None:
+    if SERVICE_LATENCY_SECONDS > 0:
+        await asyncio.sleep(SERVICE_LATENCY_SECONDS)
+
+
+@app.get("/stats")
+async def stats() -> Dict[str, int]:
+    return dict(calls)
+
+
+@app.post("/stats/reset")
+async def reset_stats() -> Dict[str, int]:
+    snapshot = dict(calls)
+    calls.clear()
+    return snapshot
+
+
+# Models
+
+
+class _Context:
+    """What the sample values are derived from: dates mentioned in the conversation."""
+
+    def __init__(self, messages: List[Dict[str, Any]]):
+        text = " ".join(_message_text(message) for message in messages)
+        self.dates = DATE_PATTERN.findall(text) or [date.today().isoformat()]
+        self._next_date = 0
+
+    def date(self) -> str:
+        value = self.dates[min(self._next_date, len(self.dates) - 1)]
+        self._next_date += 1
+        return value
+
+
+def _message_text(message: Dict[str, Any]) -> str:
+    content = message.get("content")
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def _sample_string(name: str, context: _Context) -> str:
+    lowered = name.lower()
+    if "date" in lowered or lowered in ("checkin", "checkout"):
+        return context.date()
+    if "airport" in lowered or lowered.endswith("_id"):
+        return "CDG"
+    if any(word in lowered for word in ("city", "location", "destination", "address", "origin")):
+        return "Paris"
+    if "query" in lowered:
+        return "things to do in Paris"
+    if "kind" in lowered:
+        return "attractions"
+    return f"Sample {name.replace('_', ' ')}"
+
+
+def sample(schema: Dict[str, Any], defs: Dict[str, Any], context: _Context, name: str = "value", depth: int = 0) -> Any:
+    """
+    Value that satisfies a JSON schema, either a full one (OpenAI response_format, tool
+    parameters) or the flattened field properties agno puts in prompts for json mode.
+    """
+    if "$ref" in schema:
+        definition = defs.get(schema["$ref"].split("/")[-1], {})
+        if not any(key in definition for key in ("type", "properties", "enum", "anyOf")):
+            # agno lists the fields of a definition without wrapping them in "properties"
+            definition = {"type": "object", "properties": definition}
+        return sample(definition, defs, context, name, depth)
+    for combinator in ("anyOf", "oneOf", "allOf"):
+        if combinator in schema:
+            options = [option for option in schema[combinator] if option.get("type") != "null"]
+            return sample(options[0], defs, context, name, depth) if options else None
+    if "enum" in schema:
+        return schema["enum"][0]
+    kind = schema.get("type")
+    if isinstance(kind, list):
+        kind = next((item for item in kind if item != "null"), None)
+    if kind == "object" or (kind is None and "properties" in schema):
+        if depth > 6:
+            return {}
+        return {
+            field: sample(properties, defs, context, field, depth + 1)
+            for field, properties in (schema.get("properties") or {}).items()
+        }
+    if kind == "array":
+        return [sample(schema.get("items") or {}, defs, context, name, depth + 1) for _ in range(ARRAY_LENGTH)]
+    if kind == "integer":
+        return 1
+    if kind == "number":
+        return 4.5
+    if kind == "boolean":
+        return False
+    if kind == "null":
+        return None
+    return _sample_string(name, context)
+
+
+def _json_mode_schema(messages: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """The field properties agno adds to the system prompt of models without structured outputs."""
+    for message in messages:
+        match = re.search(r"<json_field_properties>(.*?)</json_field_properties>", _message_text(message), re.S)
+        if match:
+            properties = json.loads(match.group(1))
+            defs = properties.pop("$defs", {})
+            return {"type": "object", "properties": properties, "$defs": defs}
+    return None
+
+
+def _answer(body: Dict[str, Any], context: _Context) -> str:
+    response_format = body.get("response_format") or {}
+    schema = (response_format.get("json_schema") or {}).get("schema") or _json_mode_schema(body.get("messages", []))
+    if schema is None:
+        return "Here is a sample answer from the fake model."
+    return json.dumps(sample(schema, schema.get("$defs", {}), context))
+
+
+def _tool_calls(body: Dict[str, Any], context: _Context) -> List[Dict[str, Any]]:
+    messages = body.get("messages", [])
+    if LLM_TOOL_CALLS <= 0 or any(message.get("role") == "tool" for message in messages):
+        return []
+    functions = [tool["function"] for tool in body.get("tools") or [] if LLM_TOOL_PATTERN.search(tool["function"]["name"])]
+    return [
+        {
+            "id": f"call_{uuid.uuid4().hex[:12]}",
+            "type": "function",
+            "function": {
+                "name": function["name"],
+                "arguments": json.dumps(sample(function.get("parameters") or {}, {}, context)),
+            },
+        }
+        for function in functions[:LLM_TOOL_CALLS]
+    ]
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+@app.post("/llm/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    calls[f"llm:{body.get('model')}"] += 1
+    messages = body.get("messages", [])
+    context = _Context(messages)
+    tool_calls = _tool_calls(body, context)
+    content = None if tool_calls else _answer(body, context)
+    prompt_tokens = sum(_estimate_tokens(_message_text(message)) for message in messages)
+    completion_tokens = _estimate_tokens(content or json.dumps(tool_calls))
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:16]}"
+    generation_seconds = completion_tokens / LLM_TOKENS_PER_SECOND if LLM_TOKENS_PER_SECOND > 0 else 0
+    await asyncio.sleep(LLM_TTFT_SECONDS)
+
+    if body.get("stream"):
+        return StreamingResponse(
+            _stream(completion_id, body.get("model"), content, tool_calls, usage, generation_seconds),
+            media_type="text/event-stream",
+        )
+    await asyncio.sleep(generation_seconds)
+    message: Dict[str, Any] = {"role": "assistant", "content": content}
+    if tool_calls:
+        message["tool_calls"] = tool_calls
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model"),
+        "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_calls else "stop"}],
+        "usage": usage,
+        "service_tier": "default",
+    }
+
+
+async def _stream(completion_id: str, model: str, content: Optional[str], tool_calls: List[Dict[str, Any]], usage: Dict[str, int], generation_seconds: float):
+    def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None, **extra: Any) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            **extra,
+        }
+        return f"data: {json.dumps(payload)}\n\n"
+
+    if tool_calls:
+        await asyncio.sleep(generation_seconds)
+        yield chunk({"role": "assistant", "tool_calls": [{"index": index, **call} for index, call in enumerate(tool_calls)]})
+        yield chunk({}, "tool_calls")
+    else:
+        pieces = [content[i:i + 64] for i in range(0, len(content or ""), 64)] or [""]
+        for piece in pieces:
+            await asyncio.sleep(generation_seconds / len(pieces))
+            yield chunk({"role": "assistant", "content": piece})
+        yield chunk({}, "stop")
+    yield f"data: {json.dumps({'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model, 'choices': [], 'usage': usage})}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+# Flights, search, scraping and images
+
+
+def _flight_option(departure_id: str, arrival_id: str, day: str, index: int) -> Dict[str, Any]:
+    departure_id = departure_id.split(",")[0]
+    arrival_id = arrival_id.split(",")[0]
+    segments = [
+        {
+            "departure_airport": {"name": f"{departure_id} Airport", "id": departure_id, "time": f"{day} {8 + index % 10:02d}:00"},
+            "arrival_airport": {"name": f"{arrival_id} Airport", "id": arrival_id, "time": f"{day} {10 + index % 10:02d}:30"},
+            "duration": 150,
+            "airplane": "Airbus A320",
+            "airline": ["Fake Air", "Mock Airways", "Stub Jet"][index % 3],
+            "flight_number": f"FK {100 + index}",
+            "travel_class": "Economy",
+        }
+    ]
+    return {
+        "flights": segments,
+        "total_duration": 150,
+        "price": 80 + index * 15,
+        "type": "One way",
+        "booking_token": f"token-{departure_id}-{arrival_id}-{index}",
+        "carbon_emissions": {"this_flight": 90000, "typical_for_this_route": 95000},
+    }
+
+
+@app.get("/serpapi/search")
+async def serpapi_search(request: Request):
+    calls["serpapi"] += 1
+    await _service_latency()
+    params = request.query_params
+    day = params.get("outbound_date") or date.today().isoformat()
+    options = [_flight_option(params.get("departure_id", "AAA"), params.get("arrival_id", "BBB"), day, index) for index in range(FLIGHT_OPTIONS)]
+    return {
+        "search_metadata": {"status": "Success", "google_flights_url": "https://www.google.com/travel/flights?fake=1"},
+        "search_parameters": {key: value for key, value in params.items() if key != "api_key"},
+        "best_flights": options[:3],
+        "other_flights": options[3:],
+        "price_insights": {"lowest_price": 80, "typical_price_range": [80, 250]},
+    }
+
+
+@app.post("/serper/search")
+async def serper_search(request: Request):
+    calls["serper"] += 1
+    await _service_latency()
+    body = await request.json()
+    query = body.get("q", "")
+    base_url = str(request.base_url).rstrip("/")
+    digest = hashlib.sha256(query.encode("utf-8")).hexdigest()[:8]
+    return {
+        "organic": [
+            {
+                "title": f"Result {index} for {query}",
+                "link": f"{base_url}/pages/{digest}-{index}",
+                "snippet": f"Everything about {query}, part {index}.",
+            }
+            for index in range(min(int(body.get("num", ORGANIC_RESULTS)), ORGANIC_RESULTS))
+        ]
+    }
+
+
+@app.get("/pages/{page_id}", response_class=HTMLResponse)
+async def page(page_id: str):
+    calls["scrape"] += 1
+    await _service_latency()
+    paragraphs = "".join(
+        f"<p>Paragraph {index} of page {page_id}: a museum, a park, a local restaurant and a view point worth a visit.</p>"
+        for index in range(60)
+    )
+    return f"<html><head><title>Page {page_id}</title></head><body><nav>Menu</nav><article>{paragraphs}</article></body></html>"
+
+
+@app.post("/getimg/text-to-image")
+async def text_to_image(request: Request):
+    calls["getimg"] += 1
+    await _service_latency()
+    body = await request.json()
+    # A JPEG header and a body unique to the prompt, the image store only cares about the bytes
+    image = b"\xff\xd8\xff\xe0" + hashlib.sha256(json.dumps(body, sort_keys=True).encode("utf-8")).digest() * 64 + b"\xff\xd9"
+    return {"image": base64.b64encode(image).decode("ascii"), "seed": 1}
+
+
+# MCP stand-ins
+
+
+def _airbnb_search(arguments: Dict[str, Any]) -> Dict[str, Any]:
+    location = arguments.get("location", "Somewhere")
+    return {
+        "searchUrl": f"https://www.airbnb.com/s/{location}/homes",
+        "searchResults": [
+            {
+                "id": str(1000 + index),
+                "url": f"https://www.airbnb.com/rooms/{1000 + index}",
+                "demandStayListing": {
+                    "description": {"name": {"localizedStringWithTranslationPreference": f"{location} apartment {index}"}},
+                    "location": {"coordinate": {"latitude": 48.85, "longitude": 2.35}},
+                },
+                "badges": ["Guest favorite"] if index % 2 == 0 else [],
+                "structuredContent": {"primaryLine": ["1 bedroom", "2 beds"], "secondaryLine": ["Free cancellation"]},
+                "avgRatingA11yLabel": f"{4.9 - index * 0.05:.2f} out of 5 average rating, {50 + index} reviews",
+                "structuredDisplayPrice": {"primaryLine": {"accessibilityLabel": f"${90 + index * 10} per night"}},
+            }
+            for index in range(18)
+        ],
+    }
+
+
+def _maps_result(tool: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    if tool == "maps_search_places":
+        return {
+            "places": [
+                {
+                    "name": f"Place {index} for {arguments.get('query', '')}",
+                    "formatted_address": f"{index} Sample Street",
+                    "location": {"lat": 48.85 + index / 100, "lng": 2.35},
+                    "place_id": f"place-{index}",
+                    "rating": 4.5,
+                    "types": ["tourist_attraction"],
+                }
+                for index in range(10)
+            ]
+        }
+    if tool in ("maps_distance_matrix", "maps_directions"):
+        return {"routes": [{"summary": "Sample route", "distance": {"text": "2.4 km"}, "duration": {"text": "12 mins"}}]}
+    return {"location": {"lat": 48.85, "lng": 2.35}, "formatted_address": "Sample address", "place_id": "place-0", "name": "Sample place"}
+
+
+@app.post("/mcp/{server}/{tool}")
+async def mcp_tool(server: str, tool: str, request: Request):
+    calls[f"mcp:{server}"] += 1
+    await _service_latency()
+    arguments = await request.json()
+    if server == "airbnb":
+        result = _airbnb_search(arguments) if tool == "airbnb_search" else {"listingUrl": f"https://www.airbnb.com/rooms/{arguments.get('id')}", "details": []}
+    else:
+        result = _maps_result(tool, arguments)
+    return JSONResponse(result)
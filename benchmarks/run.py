@@ -0,0 +1,287 @@
+"""
+Offline load test of deploy/api.py against local stand-ins for every external service.
+
+    python benchmarks/run.py --concurrency 8 --requests-per-scenario 32 --json results.json
+    python benchmarks/run.py --compare results.json
+
+Boots the fake services (fake_services.py) and the API with every integration pointed at
+them, then drives each scenario of the request file at the given concurrency. Reports
+p50/p95/p99 latency, throughput, errors and outbound calls per request for every scenario.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+JOB_POLL_SECONDS = 0.2
+
+
+@dataclass
+class Scenario:
+    name: str
+    path: str
+    body: Dict[str, Any]
+    method: str = "POST"
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    requests: int
+    errors: int
+    seconds: float
+    p50: float
+    p95: float
+    p99: float
+    mean_ttfb: float
+    throughput: float
+    outbound_per_request: Dict[str, float] = field(default_factory=dict)
+
+
+def load_scenarios(path: str, only: Optional[List[str]] = None) -> List[Scenario]:
+    scenarios = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                scenario = Scenario(**json.loads(line))
+                if not only or scenario.name in only:
+                    scenarios.append(scenario)
+    return scenarios
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start(module: str, port: int, env: Dict[str, str], log_path: str) -> subprocess.Popen:
+    log = open(log_path, "w")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", module, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=REPO_DIR,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+
+async def _wait_ready(url: str, process: subprocess.Popen, timeout: float) -> float:
+    started = time.perf_counter()
+    async with httpx.AsyncClient() as client:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"{url} exited with code {process.returncode}")
+            try:
+                await client.get(url)
+                return time.perf_counter() - started
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise TimeoutError(f"{url} did not start within {timeout}s")
+
+
+def service_env(fake_url: str, cache_dir: str, args: argparse.Namespace) -> Dict[str, str]:
+    """Environment of the API process with every integration pointed at the fake services."""
+    stub = f"{sys.executable} {os.path.join(BENCHMARKS_DIR, 'stub_mcp.py')}"
+    return {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join([os.path.join(REPO_DIR, "src"), REPO_DIR]),
+        "FAKE_SERVICES_URL": fake_url,
+        "OPENAI_BASE_URL": f"{fake_url}/llm/v1",
+        "OPENAI_API_KEY": "fake",
+        "GROQ_API_BASE": f"{fake_url}/llm/v1",
+        "GROQ_API_KEY": "fake",
+        "SERPAPI_URL": f"{fake_url}/serpapi/search",
+        "SERPAPI_KEY": "fake",
+        "SERPER_URL": f"{fake_url}/serper/search",
+        "SERPER_API_KEY": "fake",
+        "GETIMG_URL": f"{fake_url}/getimg/text-to-image",
+        "GETIMG_API_KEY": "fake",
+        "GOOGLE_MAPS_MCP_COMMAND": f"{stub} maps",
+        "AIRBNB_MCP_COMMAND": f"{stub} airbnb",
+        "TRIP_PLANNER_CACHE_DIR": cache_dir,
+        "LITELLM_LOCAL_MODEL_COST_MAP": "True",
+        # Spans would be exported to a collector that is not running
+        "TRACING": "off",
+        # The fake LLM has no limits, measure the service rather than time spent queued for the default ones
+        "LLM_RATE_LIMITS": os.getenv("LLM_RATE_LIMITS", "{}"),
+        "FAKE_LLM_TTFT_SECONDS": str(args.llm_ttft),
+        "FAKE_LLM_TOKENS_PER_SECOND": str(args.llm_tokens_per_second),
+        "FAKE_SERVICE_LATENCY_SECONDS": str(args.service_latency),
+        "FAKE_LLM_TOOL_CALLS": str(args.llm_tool_calls),
+    }
+
+
+async def _send(client: httpx.AsyncClient, scenario: Scenario) -> tuple[bool, float, float]:
+    """Whether one request succeeded, its latency and time to first byte; jobs are followed until they finish."""
+    started = time.perf_counter()
+    ttfb = 0.0
+    chunks = []
+    async with client.stream(scenario.method, scenario.path, json=scenario.body) as response:
+        async for chunk in response.aiter_raw():
+            if not chunks:
+                ttfb = time.perf_counter() - started
+            chunks.append(chunk)
+    ok = response.status_code < 400
+    if ok and scenario.method == "POST" and scenario.path.startswith("/jobs/"):
+        job_id = json.loads(b"".join(chunks))["job_id"]
+        while True:
+            job = (await client.get(f"/jobs/{job_id}")).json()
+            if job["status"] in ("succeeded", "failed"):
+                ok = job["status"] == "succeeded"
+                break
+            await asyncio.sleep(JOB_POLL_SECONDS)
+    return ok, time.perf_counter() - started, ttfb
+
+
+async def run_scenario(
+    api: httpx.AsyncClient,
+    fake: httpx.AsyncClient,
+    scenario: Scenario,
+    requests: int,
+    concurrency: int,
+) -> ScenarioResult:
+    await fake.post("/stats/reset")
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    ttfbs: List[float] = []
+    errors = 0
+
+    async def one() -> None:
+        nonlocal errors
+        async with semaphore:
+            try:
+                ok, latency, ttfb = await _send(api, scenario)
+            except httpx.HTTPError:
+                ok, latency, ttfb = False, 0.0, 0.0
+        if ok:
+            latencies.append(latency)
+            ttfbs.append(ttfb)
+        else:
+            errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    seconds = time.perf_counter() - started
+    outbound = (await fake.post("/stats/reset")).json()
+    return ScenarioResult(
+        name=scenario.name,
+        requests=requests,
+        errors=errors,
+        seconds=seconds,
+        p50=percentile(latencies, 50),
+        p95=percentile(latencies, 95),
+        p99=percentile(latencies, 99),
+        mean_ttfb=sum(ttfbs) / len(ttfbs) if ttfbs else float("nan"),
+        throughput=len(latencies) / seconds if seconds else 0.0,
+        outbound_per_request={service: count / requests for service, count in sorted(outbound.items())},
+    )
+
+
+def print_results(results: List[ScenarioResult], baseline: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+    header = f"{'scenario':<24}{'reqs':>6}{'errs':>6}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'ttfb s':>9}{'req/s':>8}  outbound calls per request"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        outbound = ", ".join(f"{service}={count:g}" for service, count in result.outbound_per_request.items())
+        print(
+            f"{result.name:<24}{result.requests:>6}{result.errors:>6}{result.p50:>9.2f}{result.p95:>9.2f}"
+            f"{result.p99:>9.2f}{result.mean_ttfb:>9.2f}{result.throughput:>8.2f}  {outbound}"
+        )
+        previous = (baseline or {}).get(result.name)
+        if previous:
+            deltas = []
+            for metric in ("p50", "p95", "p99", "throughput"):
+                if previous[metric]:
+                    deltas.append(f"{metric} {(getattr(result, metric) / previous[metric] - 1) * 100:+.0f}%")
+            before = sum(previous["outbound_per_request"].values())
+            after = sum(result.outbound_per_request.values())
+            deltas.append(f"outbound {before:g} -> {after:g}")
+            print(f"{'  vs baseline':<24}{', '.join(deltas)}")
+
+
+async def main(args: argparse.Namespace) -> None:
+    scenarios = load_scenarios(args.requests, args.scenario)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {result["name"]: result for result in json.load(f)["results"]}
+
+    workdir = tempfile.mkdtemp(prefix="trip_planner_bench_")
+    fake_port, api_port = _free_port(), _free_port()
+    fake_url, api_url = f"http://127.0.0.1:{fake_port}", f"http://127.0.0.1:{api_port}"
+    env = service_env(fake_url, args.cache_dir or os.path.join(workdir, "cache"), args)
+    fake_process = _start("benchmarks.fake_services:app", fake_port, env, os.path.join(workdir, "fake_services.log"))
+    api_process = None
+    try:
+        await _wait_ready(f"{fake_url}/stats", fake_process, timeout=30)
+        api_process = _start("deploy.api:app", api_port, env, os.path.join(workdir, "api.log"))
+        startup_seconds = await _wait_ready(f"{api_url}/openapi.json", api_process, timeout=args.startup_timeout)
+        print(f"API ready in {startup_seconds:.1f}s, logs in {workdir}")
+
+        results = []
+        timeout = httpx.Timeout(args.request_timeout)
+        limits = httpx.Limits(max_connections=args.concurrency * 2)
+        async with httpx.AsyncClient(base_url=api_url, timeout=timeout, limits=limits) as api, httpx.AsyncClient(base_url=fake_url) as fake:
+            for scenario in scenarios:
+                if args.warmup:
+                    await run_scenario(api, fake, scenario, args.warmup, args.concurrency)
+                results.append(await run_scenario(api, fake, scenario, args.requests_per_scenario, args.concurrency))
+        print_results(results, baseline)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(
+                    {"startup_seconds": startup_seconds, "settings": vars(args), "results": [asdict(result) for result in results]},
+                    f,
+                    indent=2,
+                )
+    finally:
+        for process in (api_process, fake_process):
+            if process is not None:
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", default=os.path.join(BENCHMARKS_DIR, "requests.jsonl"), help="JSONL file of scenarios: name, path, body")
+    parser.add_argument("--scenario", action="append", help="Run only this scenario, can be repeated")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests-per-scenario", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=0, help="Requests per scenario sent before measuring, e.g. to measure warm caches")
+    parser.add_argument("--llm-ttft", type=float, default=0.3, help="Fake model time to first token, seconds")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=100)
+    parser.add_argument("--llm-tool-calls", type=int, default=1, help="Tool calls the fake model makes on the first turn of a run")
+    parser.add_argument("--service-latency", type=float, default=0.1, help="Latency of SerpAPI, Serper, pages, getimg and MCP calls, seconds")
+    parser.add_argument("--cache-dir", help="Cache directory of the API, a fresh one by default so caches start cold")
+    parser.add_argument("--request-timeout", type=float, default=300)
+    parser.add_argument("--startup-timeout", type=float, default=120)
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--compare", help="Results file of another build to compare with")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,129 @@
+"""
+Cold start of the API: import time of deploy.api and time to the first request.
+
+    python benchmarks/startup.py --runs 5 --scenario flights --json startup.json
+
+Import time is measured in fresh interpreters. For the time to first request the API is
+started against the fake services (see run.py), which answer instantly, and the clock runs
+from process start until it first answers and until the first request of the scenario
+completes. --importtime lists the slowest modules imported by deploy.api.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.run import BENCHMARKS_DIR, REPO_DIR, _free_port, _send, _start, _wait_ready, load_scenarios, service_env
+
+IMPORT_SNIPPET = "import time; started = time.perf_counter(); import deploy.api; print(time.perf_counter() - started)"
+
+
+def measure_import(env: Dict[str, str]) -> float:
+    output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=REPO_DIR, env=env, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(env: Dict[str, str], count: int) -> List[Tuple[str, float]]:
+    """Modules imported by deploy.api, directly or one level down, by cumulative import time in seconds."""
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import deploy.api"], cwd=REPO_DIR, env=env, capture_output=True, text=True)
+    modules = []
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        if 1 <= depth <= 2:
+            modules.append((name.strip(), int(cumulative) / 1e6))
+    return sorted(modules, key=lambda module: module[1], reverse=True)[:count]
+
+
+async def measure_first_request(env: Dict[str, str], scenario, log_path: str, timeout: float) -> Tuple[float, float]:
+    """Seconds from starting the API until it answers, and until the first scenario request completed."""
+    port = _free_port()
+    started = time.perf_counter()
+    process = _start("deploy.api:app", port, env, log_path)
+    try:
+        await _wait_ready(f"http://127.0.0.1:{port}/openapi.json", process, timeout=timeout)
+        ready = time.perf_counter() - started
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=timeout) as client:
+            ok, _, _ = await _send(client, scenario)
+        if not ok:
+            raise RuntimeError(f"First {scenario.name} request failed, see {log_path}")
+        return ready, time.perf_counter() - started
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    return {"median": statistics.median(values), "min": min(values), "max": max(values)}
+
+
+async def main(args: argparse.Namespace) -> None:
+    scenario = load_scenarios(args.requests, [args.scenario])[0]
+    workdir = tempfile.mkdtemp(prefix="trip_planner_startup_")
+    fake_port = _free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    # The fake services answer right away, so the first request measures startup rather than model latency
+    fake_settings = argparse.Namespace(llm_ttft=0.0, llm_tokens_per_second=1e6, llm_tool_calls=0, service_latency=0.0)
+    env = service_env(fake_url, os.path.join(workdir, "cache"), fake_settings)
+    fake_process = _start("benchmarks.fake_services:app", fake_port, env, os.path.join(workdir, "fake_services.log"))
+    try:
+        await _wait_ready(f"{fake_url}/stats", fake_process, timeout=30)
+        imports, ready, first_request = [], [], []
+        for run in range(args.runs):
+            imports.append(measure_import(env))
+            # A fresh cache directory per run, so the first request is not answered from an earlier run's cache
+            run_env = {**env, "TRIP_PLANNER_CACHE_DIR": os.path.join(workdir, f"cache-{run}")}
+            run_ready, run_first_request = await measure_first_request(run_env, scenario, os.path.join(workdir, f"api-{run}.log"), args.timeout)
+            ready.append(run_ready)
+            first_request.append(run_first_request)
+    finally:
+        fake_process.terminate()
+        fake_process.wait(timeout=10)
+
+    results = {
+        "import_seconds": _summary(imports),
+        "ready_seconds": _summary(ready),
+        "first_request_seconds": _summary(first_request),
+    }
+    print(f"{'':<28}{'median':>9}{'min':>9}{'max':>9}")
+    for label, key in (("import deploy.api", "import_seconds"), ("ready", "ready_seconds"), (f"first {scenario.name} request", "first_request_seconds")):
+        print(f"{label:<28}{results[key]['median']:>9.2f}{results[key]['min']:>9.2f}{results[key]['max']:>9.2f}")
+    if args.importtime:
+        results["slowest_imports"] = slowest_imports(env, args.importtime)
+        print("\nslowest imports")
+        for module, seconds in results["slowest_imports"]:
+            print(f"  {seconds:>7.3f}s  {module}")
+    print(f"logs in {workdir}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"settings": vars(args), **results}, f, indent=2)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", default=os.path.join(BENCHMARKS_DIR, "requests.jsonl"), help="JSONL file of scenarios: name, path, body")
+    parser.add_argument("--scenario", default="flights", help="Scenario of the first request")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--importtime", type=int, default=0, metavar="N", help="Also list the N slowest modules imported by deploy.api")
+    parser.add_argument("--json", help="Write the results to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,95 @@
+"""
+Stub Google Maps and Airbnb MCP servers speaking stdio, like the npx servers they replace.
+
+    python benchmarks/stub_mcp.py maps|airbnb
+
+Tool calls are forwarded to the fake services at FAKE_SERVICES_URL, which count them,
+apply the configured latency and build the results.
+"""
+import json
+import os
+import sys
+from typing import Any, Dict, Optional
+
+import httpx
+from mcp.server.fastmcp import FastMCP
+
+FAKE_SERVICES_URL = os.getenv("FAKE_SERVICES_URL", "http://127.0.0.1:8900")
+
+server_name = sys.argv[1] if len(sys.argv) > 1 else "maps"
+mcp = FastMCP(f"stub-{server_name}")
+client = httpx.AsyncClient(base_url=FAKE_SERVICES_URL, timeout=60)
+
+
+async def _call(tool: str, arguments: Dict[str, Any]) -> str:
+    response = await client.post(f"/mcp/{server_name}/{tool}", json={key: value for key, value in arguments.items() if value is not None})
+    response.raise_for_status()
+    return json.dumps(response.json())
+
+
+if server_name == "airbnb":
+
+    @mcp.tool()
+    async def airbnb_search(
+        location: str,
+        placeId: Optional[str] = None,
+        checkin: Optional[str] = None,
+        checkout: Optional[str] = None,
+        adults: Optional[int] = None,
+        children: Optional[int] = None,
+        infants: Optional[int] = None,
+        pets: Optional[int] = None,
+        minPrice: Optional[int] = None,
+        maxPrice: Optional[int] = None,
+        cursor: Optional[str] = None,
+        ignoreRobotsText: Optional[bool] = None,
+    ) -> str:
+        """Search for Airbnb listings with various filters and pagination."""
+        return await _call("airbnb_search", dict(locals()))
+
+    @mcp.tool()
+    async def airbnb_listing_details(
+        id: str,
+        checkin: Optional[str] = None,
+        checkout: Optional[str] = None,
+        adults: Optional[int] = None,
+        ignoreRobotsText: Optional[bool] = None,
+    ) -> str:
+        """Get detailed information about a specific Airbnb listing."""
+        return await _call("airbnb_listing_details", dict(locals()))
+
+else:
+
+    @mcp.tool()
+    async def maps_geocode(address: str) -> str:
+        """Convert an address into geographic coordinates."""
+        return await _call("maps_geocode", dict(locals()))
+
+    @mcp.tool()
+    async def maps_reverse_geocode(latitude: float, longitude: float) -> str:
+        """Convert coordinates into an address."""
+        return await _call("maps_reverse_geocode", dict(locals()))
+
+    @mcp.tool()
+    async def maps_search_places(query: str, location: Optional[Dict[str, float]] = None, radius: Optional[float] = None) -> str:
+        """Search for places using Google Places API."""
+        return await _call("maps_search_places", dict(locals()))
+
+    @mcp.tool()
+    async def maps_place_details(place_id: str) -> str:
+        """Get detailed information about a specific place."""
+        return await _call("maps_place_details", dict(locals()))
+
+    @mcp.tool()
+    async def maps_distance_matrix(origins: list[str], destinations: list[str], mode: Optional[str] = None) -> str:
+        """Calculate travel distance and time for multiple origins and destinations."""
+        return await _call("maps_distance_matrix", dict(locals()))
+
+    @mcp.tool()
+    async def maps_directions(origin: str, destination: str, mode: Optional[str] = None) -> str:
+        """Get directions between two points."""
+        return await _call("maps_directions", dict(locals()))
+
+
+if __name__ == "__main__":
+    mcp.run()
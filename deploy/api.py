@@ -1,28 +1,86 @@
 import asyncio
-from textwrap import dedent
+import importlib
+import json
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Any, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException
-from phoenix.otel import register
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 
-from trip_planner.itinerary_crew import run_team
-from trip_planner.flights_crew import run as run_flights_team
-from trip_planner.hotels_crew import run as run_hotels_team
+from trip_planner.http_clients import close_clients
+from trip_planner.image_store import get_image_store, media_type
+from trip_planner.mcp_pool import start_pools, stop_pools
+from trip_planner.metrics import EndpointMetricsMiddleware, render as render_metrics
 from trip_planner.models.itinerary import Itinerary
 
 from trip_planner.models.flights import FlightsPlannerResponse
 from trip_planner.models.hotels import HotelsPlannerResponse
-from .models.api import PlanItineraryRequest, PlanItineraryResponse, FlightsRequest, FlightsResponse, RefineItineraryRequest, HotelsResponse, HotelsRequest, HotelsAndFlightsResponse, HotelsAndFlightsRequest
-from trip_planner.preliminary_variations_crew import PreliminaryPlanInputArgs, ProposedPlans, run_agent, PreliminaryPlan
+from .jobs import Job, JobRunner, JobStore, SUCCEEDED
+from .models.api import PlanItineraryRequest, PlanItineraryResponse, FlightsRequest, FlightsResponse, RefineItineraryRequest, HotelsResponse, HotelsRequest, HotelsAndFlightsResponse, HotelsAndFlightsRequest, JobResponse
+from trip_planner.singleflight import canonical_key, crew_calls
+from trip_planner.models.preliminary import PreliminaryPlanInputArgs, ProposedPlans
+from trip_planner.tracing import setup_tracing, shutdown_tracing
 
+# The crews pull in agno, litellm and the model SDKs, they are imported by the endpoints on first use.
+# With PRELOAD_CREWS on they are also imported in the background as soon as the API is up.
+CREW_MODULES = [
+    "trip_planner.itinerary_crew",
+    "trip_planner.flights_crew",
+    "trip_planner.hotels_crew",
+    "trip_planner.refinement",
+    "trip_planner.preliminary_variations_crew",
+]
+PRELOAD_CREWS = os.getenv("PRELOAD_CREWS", "1") == "1"
+# Wait for the MCP servers before taking requests instead of starting them in the background
+MCP_POOLS_BLOCK_STARTUP = os.getenv("MCP_POOLS_BLOCK_STARTUP", "0") == "1"
 
-# # configure the Phoenix tracer
-tracer_provider = register(
-    endpoint="http://localhost:6006/v1/traces",
-    project_name="agno_trip_planner",
-    auto_instrument=True
-)
 
-app = FastAPI(title="Trip Planner API", version="0.1.0")
+job_runner = JobRunner(JobStore())
+
+
+def _preload_crews() -> None:
+    for module in CREW_MODULES:
+        importlib.import_module(module)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    setup_tracing()
+    # Keep the Google Maps and Airbnb MCP servers warm instead of spawning npx per request
+    await start_pools(wait=MCP_POOLS_BLOCK_STARTUP)
+    await job_runner.start()
+    preload = asyncio.create_task(asyncio.to_thread(_preload_crews)) if PRELOAD_CREWS else None
+    try:
+        yield
+    finally:
+        if preload is not None:
+            await asyncio.gather(preload, return_exceptions=True)
+        await job_runner.stop()
+        await stop_pools()
+        await close_clients()
+        shutdown_tracing()
+
+
+app = FastAPI(title="Trip Planner API", version="0.1.0", lifespan=lifespan)
+app.add_middleware(EndpointMetricsMiddleware)
+
+
+# Group members often ask for the same itinerary at once, identical crew runs in flight are shared
+def _coalesced_hotels_team(cities: list[str], dates: list[str]):
+    from trip_planner.hotels_crew import run as run_hotels_team
+
+    key = canonical_key("hotels", {"cities": cities, "dates": dates})
+    return crew_calls.do(key, lambda: run_hotels_team(cities, dates))
+
+
+def _coalesced_flights_team(flight_cities: list[str], flight_dates: list[str]):
+    from trip_planner.flights_crew import run as run_flights_team
+
+    key = canonical_key("flights", {"cities": flight_cities, "dates": flight_dates})
+    return crew_calls.do(key, lambda: run_flights_team(flight_cities, flight_dates))
+
 @app.post("/get_hotels_and_flights", response_model=HotelsAndFlightsResponse)
 async def get_hotels_and_flights(request: HotelsAndFlightsRequest):
     """Get hotels and flights for a given itinerary."""
@@ -37,8 +95,8 @@ async def get_hotels_and_flights(request: HotelsAndFlightsRequest):
     flight_dates.append(request.itinerary.city_plans[-1].departure_date)
 
     hotels_plan, flights_plan = await asyncio.gather(
-        run_hotels_team(cities, dates),
-        run_flights_team([request.departure_city] + cities, flight_dates)
+        _coalesced_hotels_team(cities, dates),
+        _coalesced_flights_team([request.departure_city] + cities, flight_dates)
     )
 
     hotels_plan: HotelsPlannerResponse = hotels_plan
@@ -53,7 +111,7 @@ async def get_hotels_and_flights(request: HotelsAndFlightsRequest):
 
 @app.post("/hotels", response_model=HotelsResponse)
 async def get_hotels(request: HotelsRequest):
-    """Get hotels for a given itinerary. This shit can fail in response parsing."""
+    """Get hotels for a given itinerary, a city whose search fails or times out comes back without listings."""
 
     cities = []
     dates = []
@@ -61,12 +119,12 @@ async def get_hotels(request: HotelsRequest):
         cities.append(plan.city)
         dates.append(f"{plan.arrival_date} to {plan.departure_date}")
     
-    hotels_plan: HotelsPlannerResponse = await run_hotels_team(cities, dates)
+    hotels_plan: HotelsPlannerResponse = await _coalesced_hotels_team(cities, dates)
     return HotelsResponse(hotels_plan=hotels_plan, message="Hotels found successfully")
 
 @app.post("/flights", response_model=FlightsResponse)
 async def get_flights(request: FlightsRequest):
-    """Get flights for a given itinerary. This shit can fail in response parsing."""
+    """Get flights for a given itinerary."""
     
     flight_cities = [request.departure_city]
     flight_dates = []
@@ -75,7 +133,7 @@ async def get_flights(request: FlightsRequest):
         flight_dates.append(plan.arrival_date)
     flight_dates.append(request.itinerary.city_plans[-1].departure_date)
 
-    flights_plan: FlightsPlannerResponse = await run_flights_team(flight_cities, flight_dates)
+    flights_plan: FlightsPlannerResponse = await _coalesced_flights_team(flight_cities, flight_dates)
    
     return FlightsResponse(
         flights_plan=flights_plan, 
@@ -84,10 +142,11 @@ async def get_flights(request: FlightsRequest):
 
 @app.post("/plan_itinerary", response_model=PlanItineraryResponse)
 async def plan_itinerary(request: PlanItineraryRequest):
-    """Plan a trip using the itinerary planner crew"""    
+    """Plan a trip using the itinerary planner crew"""
+    from trip_planner.itinerary_crew import plan_itinerary as run_itinerary_planning
+
     try:
-        input_query = f"Plan a trip with parameters: {request.traveler_input.model_dump_json()}"
-        itinerary: Itinerary = await run_team(input_query)
+        itinerary: Itinerary = await run_itinerary_planning(request.traveler_input)
 
         return PlanItineraryResponse(
             itinerary=itinerary,
@@ -102,21 +161,43 @@ async def plan_itinerary(request: PlanItineraryRequest):
         )
     
 
-@app.post("/refine_itinerary", response_model=PlanItineraryResponse)
-async def refine_itinerary(request: RefineItineraryRequest):
-    """Refine the itinerary using the itinerary planner crew"""
+@app.post("/plan_itinerary/stream")
+async def plan_itinerary_stream(request: PlanItineraryRequest):
+    """
+    Plan a trip and stream progress as server-sent events.
+
+    Runs the same planner as /plan_itinerary. Emits `progress` events while it works and
+    `city_plan` events as soon as cities are planned (and `day_plan` events in the "team"
+    planning mode), then a final `itinerary` event (or `error`).
+    """
+    from trip_planner.itinerary_crew import stream_itinerary
+
+    async def events():
+        try:
+            async for event in stream_itinerary(request.traveler_input):
+                yield _sse(event["event"], event["data"])
+        except Exception as e:
+            print(e)
+            yield _sse("error", {"detail": f"Error processing itinerary: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Ask proxies not to buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
-    query = dedent(f"""\
-        Refine the itinerary with the following traveler input:
-        {request.traveler_input}
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
 
-        Itinerary:
-        {request.itinerary}
 
-        User feedback:
-        {request.user_feedback}
-    """)
-    refined_itinerary = await run_team(query)
+@app.post("/refine_itinerary", response_model=PlanItineraryResponse)
+async def refine_itinerary(request: RefineItineraryRequest):
+    """Refine the itinerary, only the days the feedback is about are re-planned"""
+    from trip_planner.refinement import refine_itinerary as run_refinement
+
+    refined_itinerary = await run_refinement(request.traveler_input, request.itinerary, request.user_feedback)
     return PlanItineraryResponse(
         itinerary=refined_itinerary,
         message="Itinerary refined successfully",
@@ -125,4 +206,141 @@ async def refine_itinerary(request: RefineItineraryRequest):
 
 @app.post("/preliminary_plan", response_model=ProposedPlans)
 async def plan_preliminary_activities(request: PreliminaryPlanInputArgs):
+    from trip_planner.preliminary_variations_crew import run_agent
+
     return await run_agent(request)
+
+
+@app.get("/images/{image_id}")
+async def get_image(image_id: str, request: Request):
+    """Serve a generated image by content ID, or by the ID a pending plan was given."""
+    store = get_image_store()
+    # Resolving touches the image on disk, keep it off the event loop like the read
+    content_id = await asyncio.to_thread(store.resolve, image_id)
+    if content_id is None:
+        raise _image_not_found()
+
+    etag = f'"{content_id}"'
+    headers = {
+        "ETag": etag,
+        # Content IDs always point to the same bytes, pending IDs must be revalidated
+        "Cache-Control": "public, max-age=31536000, immutable" if image_id == content_id else "public, no-cache",
+        "Accept-Ranges": "bytes",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        data = await asyncio.to_thread(store.read, content_id)
+    except FileNotFoundError:
+        # Evicted since it was resolved
+        raise _image_not_found()
+    content_type = media_type(data)
+    range_header = request.headers.get("range")
+    if range_header:
+        byte_range = _parse_byte_range(range_header, len(data))
+        if byte_range is None:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{len(data)}"})
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+        return Response(content=data[start:end + 1], status_code=206, media_type=content_type, headers=headers)
+
+    return Response(content=data, media_type=content_type, headers=headers)
+
+
+def _image_not_found() -> HTTPException:
+    return HTTPException(status_code=404, detail="Image not found or still generating", headers={"Retry-After": "5"})
+
+
+def _parse_byte_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single `bytes=start-end` range into inclusive offsets, None if it cannot be satisfied."""
+    unit, _, spec = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    start_text, _, end_text = spec.strip().partition("-")
+    try:
+        if start_text == "":
+            # Suffix range, the last N bytes
+            length = int(end_text)
+            if length <= 0:
+                return None
+            return max(size - length, 0), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Latency by stage and model tokens and cost, in the Prometheus text format."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+# Long-running crews can also be run as background jobs, handlers are the endpoints above
+job_runner.register("itinerary", PlanItineraryRequest, plan_itinerary, concurrency=2)
+job_runner.register("flights", FlightsRequest, get_flights, concurrency=4)
+job_runner.register("hotels", HotelsRequest, get_hotels, concurrency=2)
+job_runner.register("preliminary_plan", PreliminaryPlanInputArgs, plan_preliminary_activities, concurrency=4)
+
+
+def _job_response(job: Job) -> JobResponse:
+    def timestamp(value: Optional[float]) -> Optional[datetime]:
+        return datetime.fromtimestamp(value, tz=timezone.utc) if value is not None else None
+
+    return JobResponse(
+        job_id=job.id,
+        kind=job.kind,  # type: ignore[arg-type]
+        status=job.status,  # type: ignore[arg-type]
+        error=job.error,
+        created_at=timestamp(job.created_at),  # type: ignore[arg-type]
+        started_at=timestamp(job.started_at),
+        finished_at=timestamp(job.finished_at),
+    )
+
+
+@app.post("/jobs/itinerary", response_model=JobResponse, status_code=202)
+async def submit_itinerary_job(request: PlanItineraryRequest):
+    """Enqueue an itinerary planning job, the result has the shape of /plan_itinerary"""
+    return _job_response(await job_runner.submit("itinerary", request))
+
+
+@app.post("/jobs/flights", response_model=JobResponse, status_code=202)
+async def submit_flights_job(request: FlightsRequest):
+    """Enqueue a flights job, the result has the shape of /flights"""
+    return _job_response(await job_runner.submit("flights", request))
+
+
+@app.post("/jobs/hotels", response_model=JobResponse, status_code=202)
+async def submit_hotels_job(request: HotelsRequest):
+    """Enqueue a hotels job, the result has the shape of /hotels"""
+    return _job_response(await job_runner.submit("hotels", request))
+
+
+@app.post("/jobs/preliminary_plan", response_model=JobResponse, status_code=202)
+async def submit_preliminary_plan_job(request: PreliminaryPlanInputArgs):
+    """Enqueue a preliminary plan job, the result has the shape of /preliminary_plan"""
+    return _job_response(await job_runner.submit("preliminary_plan", request))
+
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    job = await asyncio.to_thread(job_runner.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_response(job)
+
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = await asyncio.to_thread(job_runner.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}", headers={"Retry-After": "5"})
+    return job.result
@@ -0,0 +1,271 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Type
+
+from pydantic import BaseModel
+
+from trip_planner.cache import CACHE_DIR
+from trip_planner.llm_scheduler import BACKGROUND, llm_priority
+from trip_planner.metrics import JOB_SECONDS, endpoint, timed
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(CACHE_DIR, "jobs.sqlite"))
+JOBS_POLL_INTERVAL_SECONDS = float(os.getenv("JOBS_POLL_INTERVAL_SECONDS", "1"))
+# A running job whose lease is not renewed in time is considered abandoned (crash, restart) and requeued
+JOBS_LEASE_SECONDS = float(os.getenv("JOBS_LEASE_SECONDS", "120"))
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "2"))
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    status: str
+    request: Dict[str, Any]
+    result: Optional[Dict[str, Any]]
+    error: Optional[str]
+    attempts: int
+    created_at: float
+    started_at: Optional[float]
+    finished_at: Optional[float]
+
+
+class JobStore:
+    """
+    Jobs, their requests and results persisted in SQLite.
+
+    Jobs are claimed with a lease that the running worker keeps renewing, so several
+    API processes can share one database and jobs left running by a process that died
+    are picked up again once their lease expires.
+    """
+
+    def __init__(self, path: str = JOBS_DB_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._lock:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    request TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_expires_at REAL,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_kind_status ON jobs (kind, status, created_at)")
+
+    def create(self, kind: str, request: Dict[str, Any]) -> Job:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, status, request, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, kind, QUEUED, json.dumps(request), time.time()),
+            )
+        return self.get(job_id)  # type: ignore[return-value]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, status, request, result, error, attempts, created_at, started_at, finished_at "
+                "FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return Job(
+            id=row[0],
+            kind=row[1],
+            status=row[2],
+            request=json.loads(row[3]),
+            result=json.loads(row[4]) if row[4] is not None else None,
+            error=row[5],
+            attempts=row[6],
+            created_at=row[7],
+            started_at=row[8],
+            finished_at=row[9],
+        )
+
+    def claim(self, kind: str) -> Optional[Job]:
+        """
+        Atomically take the oldest queued job of this kind, or an abandoned running one.
+
+        An abandoned job that has used up its attempts is failed instead, so a job that
+        takes its process down with it is not retried forever.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                abandoned = self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, finished_at = ?, lease_expires_at = NULL "
+                    "WHERE kind = ? AND status = ? AND lease_expires_at < ? AND attempts >= ?",
+                    (FAILED, f"Abandoned by its worker {JOBS_MAX_ATTEMPTS} times", now, kind, RUNNING, now, JOBS_MAX_ATTEMPTS),
+                ).rowcount
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE kind = ? AND "
+                    "(status = ? OR (status = ? AND lease_expires_at < ?)) "
+                    "ORDER BY created_at LIMIT 1",
+                    (kind, QUEUED, RUNNING, now),
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    if abandoned:
+                        logger.warning("Failed %d abandoned %s job(s) that used up their attempts", abandoned, kind)
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_expires_at = ?, "
+                    "started_at = COALESCE(started_at, ?) WHERE id = ?",
+                    (RUNNING, now + JOBS_LEASE_SECONDS, now, row[0]),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if abandoned:
+            logger.warning("Failed %d abandoned %s job(s) that used up their attempts", abandoned, kind)
+        return self.get(row[0])
+
+    def renew_lease(self, job_id: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND status = ?",
+                (time.time() + JOBS_LEASE_SECONDS, job_id, RUNNING),
+            )
+
+    def release(self, job_id: str) -> None:
+        """Put a job that was interrupted by shutdown back in the queue."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = MAX(attempts - 1, 0), lease_expires_at = NULL "
+                "WHERE id = ? AND status = ?",
+                (QUEUED, job_id, RUNNING),
+            )
+
+    def succeed(self, job_id: str, result: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = NULL, finished_at = ?, lease_expires_at = NULL WHERE id = ?",
+                (SUCCEEDED, json.dumps(result), time.time(), job_id),
+            )
+
+    def fail(self, job_id: str, error: str, retry: bool) -> None:
+        with self._lock:
+            if retry:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, lease_expires_at = NULL WHERE id = ?",
+                    (QUEUED, error, job_id),
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, finished_at = ?, lease_expires_at = NULL WHERE id = ?",
+                    (FAILED, error, time.time(), job_id),
+                )
+
+
+@dataclass
+class JobKind:
+    name: str
+    request_model: Type[BaseModel]
+    handler: Callable[[Any], Awaitable[BaseModel]]
+    concurrency: int
+
+
+class JobRunner:
+    """
+    Bounded worker pool per job kind.
+
+    Each kind gets `concurrency` worker tasks that claim jobs from the store, so a burst of
+    itinerary jobs cannot starve flights or hotels and every crew runs at a predictable rate.
+    """
+
+    def __init__(self, store: JobStore):
+        self.store = store
+        self.kinds: Dict[str, JobKind] = {}
+        self._wake: Dict[str, asyncio.Event] = {}
+        self._workers: List[asyncio.Task] = []
+
+    def register(
+        self,
+        name: str,
+        request_model: Type[BaseModel],
+        handler: Callable[[Any], Awaitable[BaseModel]],
+        concurrency: int,
+    ) -> None:
+        concurrency = int(os.getenv(f"JOBS_CONCURRENCY_{name.upper()}", str(concurrency)))
+        self.kinds[name] = JobKind(name, request_model, handler, concurrency)
+
+    async def submit(self, name: str, request: BaseModel) -> Job:
+        job = await asyncio.to_thread(self.store.create, name, request.model_dump(mode="json"))
+        if name in self._wake:
+            self._wake[name].set()
+        return job
+
+    async def start(self) -> None:
+        for kind in self.kinds.values():
+            self._wake[kind.name] = asyncio.Event()
+            for i in range(kind.concurrency):
+                self._workers.append(asyncio.create_task(self._worker(kind), name=f"job-worker-{kind.name}-{i}"))
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _worker(self, kind: JobKind) -> None:
+        wake = self._wake[kind.name]
+        while True:
+            job = await asyncio.to_thread(self.store.claim, kind.name)
+            if job is None:
+                wake.clear()
+                try:
+                    await asyncio.wait_for(wake.wait(), timeout=JOBS_POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(kind, job)
+
+    async def _run(self, kind: JobKind, job: Job) -> None:
+        heartbeat = asyncio.create_task(self._heartbeat(job.id))
+        try:
+            request = kind.request_model.model_validate(job.request)
+            # Nobody holds a connection open for a job, its model calls give way to interactive requests
+            with endpoint(f"job:{kind.name}"), llm_priority(BACKGROUND), timed(JOB_SECONDS, kind=kind.name):
+                result = await kind.handler(request)
+            await asyncio.to_thread(self.store.succeed, job.id, result.model_dump(mode="json"))
+        except asyncio.CancelledError:
+            await asyncio.to_thread(self.store.release, job.id)
+            raise
+        except Exception as e:
+            logger.exception("Job %s (%s) failed on attempt %d", job.id, kind.name, job.attempts)
+            await asyncio.to_thread(self.store.fail, job.id, str(e), job.attempts < JOBS_MAX_ATTEMPTS)
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(JOBS_LEASE_SECONDS / 3)
+            await asyncio.to_thread(self.store.renew_lease, job_id)
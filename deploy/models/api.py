@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import Literal, Optional
 from pydantic import BaseModel, Field
 
 from trip_planner.models.general import TravelerInput
@@ -53,3 +53,14 @@ class HotelsAndFlightsResponse(BaseModel):
     hotels_plan: HotelsPlannerResponse = Field(..., description="Hotels plan")
     flights_plan: FlightsPlannerResponse = Field(..., description="Flights plan")
     message: str = Field(..., description="Status message")
+
+
+class JobResponse(BaseModel):
+    """Response model for the job endpoints"""
+    job_id: str = Field(..., description="Job ID")
+    kind: Literal["itinerary", "flights", "hotels", "preliminary_plan"] = Field(..., description="Kind of job")
+    status: Literal["queued", "running", "succeeded", "failed"] = Field(..., description="Job status")
+    error: Optional[str] = Field(None, description="Error of the last failed attempt")
+    created_at: datetime = Field(..., description="When the job was submitted")
+    started_at: Optional[datetime] = Field(None, description="When the job first started running")
+    finished_at: Optional[datetime] = Field(None, description="When the job succeeded or failed for good")
@@ -0,0 +1,140 @@
+import csv
+import difflib
+import os
+import re
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+AIRPORTS_DATA_PATH = os.getenv(
+    "AIRPORTS_DATA_PATH",
+    os.path.join(os.path.dirname(__file__), "data", "airports.csv"),
+)
+# How many airports of a multi-airport city are searched at once, SerpAPI accepts comma separated codes
+FLIGHTS_AIRPORTS_PER_CITY = int(os.getenv("FLIGHTS_AIRPORTS_PER_CITY", "3"))
+FUZZY_MATCH_CUTOFF = 0.85
+
+
+@dataclass(frozen=True)
+class Airport:
+    iata: str
+    name: str
+    city: str
+    country: str
+    passengers: float  # Millions of passengers a year, used to rank the airports of a city
+
+
+def normalize_name(name: str) -> str:
+    """Case-fold, strip accents and punctuation so "São Paulo" and "sao-paulo" are the same key."""
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(char for char in name if not unicodedata.combining(char)).casefold()
+    name = re.sub(r"['.]", "", name)
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", name).split())
+
+
+class AirportIndex:
+    """
+    In-memory index from city names to their airports.
+
+    Every city is keyed by its normalized name and maps to its airports ranked by traffic,
+    so multi-airport cities like London resolve to LHR, LGW, STN, ... in that order.
+    Aliases (local spellings, old names, regions served by the airport) map only to the
+    airports listing them, "Newark" is EWR while "NYC" is listed on every New York airport.
+    Exact lookups are a dict access, misspellings fall back to a memoized fuzzy match.
+    """
+
+    def __init__(self, airports: List[Airport], aliases: Dict[str, List[str]]):
+        self.by_code: Dict[str, Airport] = {airport.iata: airport for airport in airports}
+        by_name: Dict[str, List[Airport]] = {}
+        for airport in airports:
+            for name in [airport.city, *aliases.get(airport.iata, [])]:
+                key = normalize_name(name)
+                if key and airport not in by_name.setdefault(key, []):
+                    by_name[key].append(airport)
+        self.by_name: Dict[str, Tuple[Airport, ...]] = {
+            key: tuple(sorted(matches, key=lambda airport: -airport.passengers))
+            for key, matches in by_name.items()
+        }
+        self._names = list(self.by_name)
+        self._fuzzy: Dict[str, Optional[str]] = {}
+
+    @classmethod
+    def from_csv(cls, path: str = AIRPORTS_DATA_PATH) -> "AirportIndex":
+        airports = []
+        aliases = {}
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                airport = Airport(
+                    iata=row["iata"],
+                    name=row["name"],
+                    city=row["city"],
+                    country=row["country"],
+                    passengers=float(row["passengers"] or 0),
+                )
+                airports.append(airport)
+                aliases[airport.iata] = [alias for alias in row["aliases"].split("|") if alias]
+        return cls(airports, aliases)
+
+    def lookup(self, city: str) -> Tuple[Airport, ...]:
+        """
+        Airports of a city ranked by traffic, empty if the city is unknown.
+
+        Accepts "City", "City, Country" (the country is used to pick between cities
+        with the same name when it is an ISO code) and misspelled names. A city that is
+        known only in other countries is unknown, "Paris, US" does not find Paris, FR.
+        """
+        name, _, country = city.partition(",")
+        country = country.strip().upper()
+        if len(country) == 2 and country.isalpha():
+            airports = tuple(airport for airport in self._match(normalize_name(name)) if airport.country == country)
+            # Not every ", XX" is a country, "Washington, DC" is a known name as a whole
+            return airports or self.by_name.get(normalize_name(city), ())
+        return self._match(normalize_name(name)) or self._match(normalize_name(city))
+
+    def _match(self, key: str) -> Tuple[Airport, ...]:
+        if not key:
+            return ()
+        airports = self.by_name.get(key)
+        if airports is not None:
+            return airports
+        if key not in self._fuzzy:
+            close = difflib.get_close_matches(key, self._names, n=1, cutoff=FUZZY_MATCH_CUTOFF)
+            self._fuzzy[key] = close[0] if close else None
+        match = self._fuzzy[key]
+        return self.by_name[match] if match is not None else ()
+
+    def airport_codes(self, city_or_code: str, limit: int = FLIGHTS_AIRPORTS_PER_CITY) -> Optional[str]:
+        """
+        Comma separated IATA codes to search for a city, busiest first.
+
+        Values that already are IATA codes (or comma separated lists of them) are returned
+        as they are. Returns None if the value is neither a code nor a known city.
+        """
+        value = city_or_code.strip()
+        codes = [code.strip().upper() for code in value.split(",")]
+        looks_like_codes = all(len(code) == 3 and code.isalpha() for code in codes)
+        # "GOA" is Genoa while "Goa" is the Indian state, only upper case input is taken as known codes first
+        if looks_like_codes and value.isupper() and all(code in self.by_code for code in codes):
+            return ",".join(codes)
+        airports = self.lookup(value)
+        if airports:
+            return ",".join(airport.iata for airport in airports[:max(limit, 1)])
+        if looks_like_codes:
+            return ",".join(codes)
+        return None
+
+
+@lru_cache(maxsize=1)
+def get_airport_index() -> AirportIndex:
+    return AirportIndex.from_csv()
+
+
+def resolve_airport_codes(city_or_code: str, limit: int = FLIGHTS_AIRPORTS_PER_CITY) -> str:
+    """
+    IATA codes for a city name or code, empty if it is neither.
+
+    Lets the flight search tools take "London" as well as "LHR" without a model call.
+    Unknown cities are not passed on as codes, callers fall back to asking for the IATA code.
+    """
+    return get_airport_index().airport_codes(city_or_code, limit) or ""
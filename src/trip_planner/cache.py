@@ -0,0 +1,193 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from trip_planner.metrics import CACHE_LOOKUPS
+
+CACHE_DIR = os.getenv("TRIP_PLANNER_CACHE_DIR", os.path.join(".cache", "trip_planner"))
+
+# Writes between eviction passes of a SQLite cache, a pass also runs once the writes since
+# the last one add up to 1% of its byte budget
+EVICT_EVERY_WRITES = 64
+
+
+class MemoryCache:
+    """Thread-safe in-memory LRU cache with a per-entry expiry time."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """
+    On-disk cache of JSON values in a SQLite file.
+
+    Survives restarts and can be shared by several worker processes on the same host.
+    Least recently used entries are evicted once `max_entries` or `max_bytes` is exceeded.
+    Counting the entries and bytes scans the table, so eviction runs every
+    EVICT_EVERY_WRITES writes rather than on each one, and the limits may be overshot
+    by that many writes in between.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10_000, max_bytes: Optional[int] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Writes and bytes written since the last eviction pass, starting with a pass on the first write
+        self._writes = EVICT_EVERY_WRITES
+        self._written_bytes = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # One connection per cache guarded by the lock, WAL lets other processes read concurrently
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._lock:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    size INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(cache)")}
+            if "size" not in columns:
+                self._conn.execute("ALTER TABLE cache ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)")
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.get_with_expiry(key)
+        return entry[0] if entry is not None else None
+
+    def get_with_expiry(self, key: str) -> Optional[tuple[Any, float]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at < now:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(value), expires_at
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        now = time.time()
+        serialized = json.dumps(value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at, size) VALUES (?, ?, ?, ?, ?)",
+                (key, serialized, now + ttl, now, len(serialized)),
+            )
+            self._writes += 1
+            self._written_bytes += len(serialized)
+            if self._writes >= EVICT_EVERY_WRITES or (self.max_bytes is not None and self._written_bytes * 100 >= self.max_bytes):
+                self._evict()
+                self._writes = 0
+                self._written_bytes = 0
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def _evict(self) -> None:
+        self._conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        excess = count - self.max_entries
+        if self.max_bytes is not None and total > self.max_bytes and count:
+            # Enough least recently used entries to free the excess bytes at the average entry size
+            excess = max(excess, -(-(total - self.max_bytes) * count // total))
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                (excess,),
+            )
+
+
+class TieredCache:
+    """
+    Two-tier TTL cache: a small in-memory LRU in front of a SQLite file.
+
+    Values must be JSON serializable. Disk hits are promoted to memory for the rest
+    of their remaining lifetime. Lookups are counted in the metrics under the cache name.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: float,
+        memory_entries: int = 1024,
+        disk_entries: int = 10_000,
+        disk_bytes: Optional[int] = None,
+        cache_dir: str = CACHE_DIR,
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.memory = MemoryCache(max_entries=memory_entries)
+        self.disk = SQLiteCache(
+            os.path.join(cache_dir, f"{name}.sqlite"),
+            max_entries=disk_entries,
+            max_bytes=disk_bytes,
+        )
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is not None:
+            CACHE_LOOKUPS.labels(cache=self.name, result="memory_hit").inc()
+            return value
+
+        entry = self.disk.get_with_expiry(key)
+        if entry is not None:
+            value, expires_at = entry
+            self.memory.set(key, value, ttl=expires_at - time.time())
+            CACHE_LOOKUPS.labels(cache=self.name, result="disk_hit").inc()
+            return value
+
+        CACHE_LOOKUPS.labels(cache=self.name, result="miss").inc()
+        return None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        self.memory.set(key, value, ttl)
+        self.disk.set(key, value, ttl)
+
+    def delete(self, key: str) -> None:
+        self.memory.delete(key)
+        self.disk.delete(key)
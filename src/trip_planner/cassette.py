@@ -0,0 +1,341 @@
+import asyncio
+import atexit
+import base64
+import contextvars
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import IO, Any, Awaitable, Callable, Deque, Dict, Iterator, List, Optional, TypeVar
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import httpx
+
+# "off", "record" (call the services and write every interaction) or "replay" (serve interactions from the cassette)
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off")
+CASSETTE_PATH = os.getenv("CASSETTE_PATH", "cassette.jsonl.gz")
+# "instant" serves replayed interactions right away, "recorded" takes as long as the recorded call did
+CASSETTE_REPLAY_SPEED = os.getenv("CASSETTE_REPLAY_SPEED", "instant")
+
+# Query parameters that are never written to a cassette or used in keys
+SECRET_PARAMS = {"api_key", "key", "token"}
+
+T = TypeVar("T")
+
+# Set while an interaction is being recorded, so the HTTP calls it makes itself are not recorded again
+_inside_interaction: contextvars.ContextVar[bool] = contextvars.ContextVar("cassette_inside_interaction", default=False)
+
+
+class CassetteMiss(LookupError):
+    """A replayed run made a call that is not on the cassette."""
+
+
+class ReplayedError(RuntimeError):
+    """An error that was recorded on the cassette, raised again on replay."""
+
+
+@dataclass
+class Interaction:
+    kind: str
+    key: str
+    request: Dict[str, Any]
+    response: Any
+    # Seconds since the recording started, and how long the call took
+    started: float
+    duration: float
+    error: Optional[str] = None
+
+
+def interaction_key(kind: str, payload: Any) -> str:
+    text = json.dumps(payload, sort_keys=True, default=str)
+    return f"{kind}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+
+def _open(path: str, mode: str) -> IO[str]:
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")  # type: ignore[return-value]
+    return open(path, mode, encoding="utf-8")
+
+
+class Cassette:
+    """
+    Recording of every outbound interaction of a run: model completions, HTTP calls and MCP tool calls.
+
+    In record mode interactions are appended to a JSON lines file (gzipped for `.gz` paths)
+    as they finish, with their start offset and duration. In replay mode calls are answered
+    from the file by key, in recorded order for repeated keys; once a key's recordings are
+    used up its last one keeps being served, so a recording can be replayed under load.
+    A call that was never recorded raises CassetteMiss.
+    """
+
+    def __init__(self, path: str, mode: str, speed: str = CASSETTE_REPLAY_SPEED):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._recorded: Dict[str, Deque[Interaction]] = defaultdict(deque)
+        self._last: Dict[str, Interaction] = {}
+        # Calls answered from the cassette so far
+        self.replayed = 0
+        self._file: Optional[IO[str]] = None
+        if mode == "record":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = _open(path, "w")
+        else:
+            with _open(path, "r") as f:
+                try:
+                    for line in f:
+                        if line.strip():
+                            interaction = Interaction(**json.loads(line))
+                            self._recorded[interaction.key].append(interaction)
+                except (EOFError, json.JSONDecodeError):
+                    # A recording that was cut short, keep the interactions written before that
+                    pass
+
+    def __len__(self) -> int:
+        return sum(len(interactions) for interactions in self._recorded.values())
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _write(self, interaction: Interaction) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.write(json.dumps(asdict(interaction), separators=(",", ":")) + "\n")
+                self._file.flush()
+
+    def _next(self, key: str) -> Interaction:
+        with self._lock:
+            recorded = self._recorded.get(key)
+            if recorded:
+                self._last[key] = recorded.popleft()
+            if key not in self._last:
+                raise CassetteMiss(f"No recorded interaction for {key}")
+            self.replayed += 1
+            return self._last[key]
+
+    @staticmethod
+    def _replayed(interaction: Interaction, load: Callable[[Any], T]) -> T:
+        if interaction.error is not None:
+            raise ReplayedError(interaction.error)
+        return load(interaction.response)
+
+    async def acall(
+        self,
+        kind: str,
+        key: str,
+        request: Dict[str, Any],
+        call: Callable[[], Awaitable[T]],
+        dump: Callable[[T], Any],
+        load: Callable[[Any], T],
+    ) -> T:
+        """Record `call` or replay its recording."""
+        if self.mode == "replay":
+            interaction = self._next(key)
+            if self.speed == "recorded":
+                await asyncio.sleep(interaction.duration)
+            return self._replayed(interaction, load)
+        if _inside_interaction.get():
+            return await call()
+        token = _inside_interaction.set(True)
+        started = time.monotonic()
+        try:
+            result = await call()
+        except Exception as e:
+            self._write(Interaction(kind, key, request, None, started - self._started, time.monotonic() - started, f"{type(e).__name__}: {e}"))
+            raise
+        finally:
+            _inside_interaction.reset(token)
+        self._write(Interaction(kind, key, request, dump(result), started - self._started, time.monotonic() - started))
+        return result
+
+    def call(
+        self,
+        kind: str,
+        key: str,
+        request: Dict[str, Any],
+        call: Callable[[], T],
+        dump: Callable[[T], Any],
+        load: Callable[[Any], T],
+    ) -> T:
+        """Blocking counterpart of `acall`."""
+        if self.mode == "replay":
+            interaction = self._next(key)
+            if self.speed == "recorded":
+                time.sleep(interaction.duration)
+            return self._replayed(interaction, load)
+        if _inside_interaction.get():
+            return call()
+        token = _inside_interaction.set(True)
+        started = time.monotonic()
+        try:
+            result = call()
+        except Exception as e:
+            self._write(Interaction(kind, key, request, None, started - self._started, time.monotonic() - started, f"{type(e).__name__}: {e}"))
+            raise
+        finally:
+            _inside_interaction.reset(token)
+        self._write(Interaction(kind, key, request, dump(result), started - self._started, time.monotonic() - started))
+        return result
+
+
+_cassette: Optional[Cassette] = Cassette(CASSETTE_PATH, CASSETTE_MODE) if CASSETTE_MODE != "off" else None
+if _cassette is not None:
+    atexit.register(_cassette.close)
+
+
+def active_cassette() -> Optional[Cassette]:
+    return _cassette
+
+
+@contextmanager
+def use_cassette(path: str, mode: str, speed: str = CASSETTE_REPLAY_SPEED) -> Iterator[Cassette]:
+    """Record or replay every outbound interaction made inside the block, e.g. in a regression test."""
+    global _cassette
+    previous = _cassette
+    _cassette = Cassette(path, mode, speed)
+    try:
+        yield _cassette
+    finally:
+        _cassette.close()
+        _cassette = previous
+
+
+# HTTP
+
+
+def _redacted_url(url: httpx.URL) -> str:
+    parts = urlsplit(str(url))
+    query = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True) if name not in SECRET_PARAMS]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(sorted(query)), ""))
+
+
+def _http_key(request: httpx.Request, body: bytes) -> str:
+    return interaction_key("http", [request.method, _redacted_url(request.url), hashlib.sha256(body).hexdigest()])
+
+
+def _dump_response(status_code: int, headers: List[List[str]], body: bytes) -> Dict[str, Any]:
+    return {"status": status_code, "headers": headers, "body": base64.b64encode(body).decode("ascii")}
+
+
+def _load_response(data: Dict[str, Any], request: httpx.Request) -> httpx.Response:
+    return httpx.Response(
+        data["status"],
+        headers=[tuple(header) for header in data["headers"]],
+        content=base64.b64decode(data["body"]),
+        request=request,
+    )
+
+
+def _raw_headers(response: httpx.Response) -> List[List[str]]:
+    # Headers of the raw, still content-encoded body, without the framing of the original connection
+    return [[name, value] for name, value in response.headers.multi_items() if name.lower() not in ("transfer-encoding", "connection")]
+
+
+class CassetteTransport(httpx.AsyncBaseTransport):
+    """Records or replays requests of the shared async client while a cassette is active, passes them through otherwise."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        cassette = active_cassette()
+        if cassette is None:
+            return await self._transport.handle_async_request(request)
+        body = await request.aread()
+
+        async def call() -> Dict[str, Any]:
+            response = await self._transport.handle_async_request(request)
+            try:
+                raw = b"".join([chunk async for chunk in response.stream])  # type: ignore[union-attr]
+            finally:
+                await response.aclose()
+            return _dump_response(response.status_code, _raw_headers(response), raw)
+
+        data = await cassette.acall(
+            "http",
+            _http_key(request, body),
+            {"method": request.method, "url": _redacted_url(request.url)},
+            call,
+            dump=lambda data: data,
+            load=lambda data: data,
+        )
+        return _load_response(data, request)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+class SyncCassetteTransport(httpx.BaseTransport):
+    """Blocking counterpart of CassetteTransport for the sync client."""
+
+    def __init__(self, transport: httpx.BaseTransport):
+        self._transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        cassette = active_cassette()
+        if cassette is None:
+            return self._transport.handle_request(request)
+        body = request.read()
+
+        def call() -> Dict[str, Any]:
+            response = self._transport.handle_request(request)
+            try:
+                raw = b"".join(response.stream)  # type: ignore[union-attr]
+            finally:
+                response.close()
+            return _dump_response(response.status_code, _raw_headers(response), raw)
+
+        data = cassette.call(
+            "http",
+            _http_key(request, body),
+            {"method": request.method, "url": _redacted_url(request.url)},
+            call,
+            dump=lambda data: data,
+            load=lambda data: data,
+        )
+        return _load_response(data, request)
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+# MCP
+
+
+def record_mcp_calls(server_name: str, session: Any) -> None:
+    """
+    Route the tool calls of an MCP client session through the active cassette.
+
+    agno's MCP functions look `session.call_tool` up on every call, so wrapping it on the
+    session covers agents as well as direct calls.
+    """
+    from mcp.types import CallToolResult
+
+    call_tool = session.call_tool
+
+    async def recorded_call_tool(name: str, arguments: Optional[Dict[str, Any]] = None, *args: Any, **kwargs: Any) -> CallToolResult:
+        cassette = active_cassette()
+        if cassette is None:
+            return await call_tool(name, arguments, *args, **kwargs)
+        return await cassette.acall(
+            "mcp",
+            interaction_key("mcp", [server_name, name, arguments or {}]),
+            {"server": server_name, "tool": name, "arguments": arguments or {}},
+            lambda: call_tool(name, arguments, *args, **kwargs),
+            dump=lambda result: result.model_dump(mode="json"),
+            load=CallToolResult.model_validate,
+        )
+
+    session.call_tool = recorded_call_tool
@@ -1,16 +1,20 @@
 import asyncio
+import json
 import os
 from textwrap import dedent
 from typing import List, Optional
 
 from agno.agent import Agent
 from agno.team import Team
-from mcp import StdioServerParameters
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from agno.models.litellm import LiteLLM
-from agno.models.openai import OpenAIChat
 
-from trip_planner.tools.agno.flights import get_flights
+from trip_planner.airports import get_airport_index
+from trip_planner.llm_cache import CachedOpenAIChat
+from trip_planner.metrics import AGENT_RUN_SECONDS, TOOL_CALL_SECONDS, time_tool_call, timed
+from trip_planner.tools.agno.flights import FlightType, get_flights, search_flights
+from trip_planner.tools.compaction import compact_tool_output
+from trip_planner.tools.flights_parser import parse_flights_plan
 from trip_planner.models.flights import Flight, FlightsPlan, FlightsPlannerResponse
 
 env = {
@@ -18,13 +22,168 @@ env = {
     "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY"),
 }
 
+# "legs" searches every leg of the trip concurrently, "agent" lets the model drive the searches tool call by tool call
+FLIGHTS_SEARCH_MODE = os.getenv("FLIGHTS_SEARCH_MODE", "legs")
+MAX_CONCURRENT_LEG_SEARCHES = int(os.getenv("FLIGHTS_MAX_CONCURRENT_LEG_SEARCHES", "8"))
+# "parser" keeps Google's ranking of the parsed results, "model" lets a model pick among them
+FLIGHTS_RANKING = os.getenv("FLIGHTS_RANKING", "parser")
+FLIGHTS_PER_ROUTE = int(os.getenv("FLIGHTS_PER_ROUTE", "5"))
+OPTIONS_PER_LEG_FOR_RANKING = 8
 
-async def run(flight_cities: list[str], flight_dates: list[str]):
+_leg_searches = asyncio.Semaphore(MAX_CONCURRENT_LEG_SEARCHES)
+
+
+class FlightLeg(BaseModel):
+    departure_city: str
+    arrival_city: str
+    date: str
+
+
+class CityAirport(BaseModel):
+    city: str = Field(..., description="City exactly as given in the input")
+    iata_code: str = Field(..., description="IATA code of the main airport of the city")
+
+
+class CityAirports(BaseModel):
+    airports: List[CityAirport]
+
+
+async def run(flight_cities: list[str], flight_dates: list[str]) -> FlightsPlannerResponse:
+    if FLIGHTS_SEARCH_MODE == "agent":
+        return await run_agent_search(flight_cities, flight_dates)
+    return await run_leg_search(flight_cities, flight_dates)
+
+
+def plan_legs(flight_cities: list[str], flight_dates: list[str]) -> List[FlightLeg]:
+    """
+    Legs of the trip: the departure city to each visited city in order and back home.
+
+    `flight_dates` holds the arrival date of every visited city followed by the departure
+    date from the last one, which is the date of the flight back.
+    """
+    legs = [
+        FlightLeg(departure_city=flight_cities[i], arrival_city=flight_cities[i + 1], date=flight_dates[i])
+        for i in range(len(flight_cities) - 1)
+    ]
+    legs.append(FlightLeg(departure_city=flight_cities[-1], arrival_city=flight_cities[0], date=flight_dates[-1]))
+    return legs
+
+
+async def resolve_airports(cities: List[str]) -> dict[str, str]:
+    """
+    Map every city to the IATA codes of its airports.
+
+    Cities are looked up in the offline airport index, the model is only asked about
+    cities the index does not know.
+    """
+    index = get_airport_index()
+    airports = {}
+    unknown = []
+    for city in set(cities):
+        codes = index.airport_codes(city)
+        if codes is not None:
+            airports[city] = codes
+        else:
+            unknown.append(city)
+    if unknown:
+        airports.update(await resolve_airports_with_model(unknown))
+    return airports
+
+
+async def resolve_airports_with_model(cities: List[str]) -> dict[str, str]:
+    """Map every city to the IATA code of its main airport with a single model call."""
+    agent = Agent(
+        name="AirportResolver",
+        model=CachedOpenAIChat("gpt-4.1-nano"),
+        instructions="For each input city return the IATA code of its main international airport.",
+        response_model=CityAirports,
+    )
+    with timed(AGENT_RUN_SECONDS, agent=agent.name):
+        response = await agent.arun(json.dumps(sorted(set(cities))))
+    resolved: CityAirports = response.content  # type: ignore
+    return {airport.city: airport.iata_code.upper() for airport in resolved.airports}
+
+
+async def search_leg(leg: FlightLeg, airports: dict[str, str]) -> dict:
+    async with _leg_searches:
+        # The SerpAPI client is blocking, run it on a thread so every leg is searched at once
+        with timed(TOOL_CALL_SECONDS, tool="search_flights"):
+            return await asyncio.to_thread(
+                search_flights,
+                airports.get(leg.departure_city, leg.departure_city),
+                airports.get(leg.arrival_city, leg.arrival_city),
+                leg.date,
+                FlightType.ONE_WAY,
+            )
+
+
+async def run_leg_search(flight_cities: list[str], flight_dates: list[str]) -> FlightsPlannerResponse:
+    """
+    Search every leg of the trip concurrently and map the results to flights plans.
+
+    The legs and their dates follow from the itinerary, so instead of an agent calling the
+    search tool leg by leg over several model turns, all searches run in one network round.
+    The SerpAPI responses are parsed directly, a model is only involved if FLIGHTS_RANKING is "model".
+    """
+    legs = plan_legs(flight_cities, flight_dates)
+    airports = await resolve_airports(flight_cities)
+    results = await asyncio.gather(*(search_leg(leg, airports) for leg in legs), return_exceptions=True)
+
+    rank_with_model = FLIGHTS_RANKING == "model"
+    flights_plans = []
+    for leg, result in zip(legs, results):
+        if isinstance(result, BaseException) or "error" in result:
+            print(f"Flight search failed for {leg.departure_city} -> {leg.arrival_city}: {result if isinstance(result, BaseException) else result['error']}")
+            result = {}
+        flights_plans.append(parse_flights_plan(
+            result,
+            departure_city=leg.departure_city,
+            arrival_city=leg.arrival_city,
+            limit=OPTIONS_PER_LEG_FOR_RANKING if rank_with_model else FLIGHTS_PER_ROUTE,
+        ))
+    if rank_with_model:
+        return await rank_flights(flights_plans)
+    return FlightsPlannerResponse(flights_plans=flights_plans)
+
+
+async def rank_flights(flights_plans: List[FlightsPlan]) -> FlightsPlannerResponse:
+    ranking_agent = Agent(
+        name="FlightsRankingAgent",
+        role="Flights ranking agent",
+        model=CachedOpenAIChat("gpt-4.1-nano"),
+        instructions=dedent(f"""\
+            You are given candidate flights for every route of a trip.
+            For each route pick up to {FLIGHTS_PER_ROUTE} of the best options, preferring cheaper, shorter flights with fewer stops.
+            Return the routes in the given order and the picked flights unchanged.
+            If a route has no options, return it with an empty list of flights.
+        """),
+        response_model=FlightsPlannerResponse,
+    )
+    candidates = FlightsPlannerResponse(flights_plans=flights_plans)
+    # Booking tokens are long and opaque, keep them out of the prompt and put them back afterwards
+    tokens = {
+        (flight.flight_number, flight.departure_timestamp): flight.booking_token
+        for plan in flights_plans
+        for flight in plan.flights
+    }
+    with timed(AGENT_RUN_SECONDS, agent=ranking_agent.name):
+        response = await ranking_agent.arun(
+            candidates.model_dump_json(exclude={"flights_plans": {"__all__": {"flights": {"__all__": {"booking_token"}}}}})
+        )
+    ranked: FlightsPlannerResponse = response.content  # type: ignore
+    for plan in ranked.flights_plans:
+        for flight in plan.flights:
+            flight.booking_token = tokens.get((flight.flight_number, flight.departure_timestamp))
+    return ranked
+
+
+async def run_agent_search(flight_cities: list[str], flight_dates: list[str]):
     flights_agent = Agent(
         name="FlightsFinderAgent",
         role="Flights search agent",
-        model=OpenAIChat("gpt-4.1-nano"),
+        model=CachedOpenAIChat("gpt-4.1-nano"),
         tools=[get_flights],
+        tool_hooks=[time_tool_call, compact_tool_output],
         instructions=dedent("""\
             You are the best at searching flights for user.
             You are an agent that can find flights for a given departure and arrival cities and an arrival date OR departure date. 
@@ -33,7 +192,7 @@ async def run(flight_cities: list[str], flight_dates: list[str]):
             - If there is no departure date, then the departure date is the day before the arrival date or the same day if plane leaves early and arrives in the morning.
             - If there is no arrival date, then the arrival date is the day after the departure date.
             
-            Use get_flights tool to find flights. Notice! You need to use the IATA code of the airports in the input cities in order to use the tool. 
+            Use get_flights tool to find flights. You can pass the input cities as they are, or the IATA codes of their airports. 
         """),
         add_datetime_to_instructions=True,
         show_tool_calls=True,
@@ -48,7 +207,8 @@ async def run(flight_cities: list[str], flight_dates: list[str]):
         query += f"\n- Departure city: {flight_cities[-1]}, Departure date: {flight_dates[-1]}, Arrival city: {flight_cities[0]}"
     else:
         query += f", Departure back date: {flight_dates[-1]}"
-    response = await flights_agent.arun(query)
+    with timed(AGENT_RUN_SECONDS, agent=flights_agent.name):
+        response = await flights_agent.arun(query)
     return response.content 
 
 
@@ -1,40 +1,121 @@
-from agno.tools.mcp import MCPTools
-from mcp import StdioServerParameters
-
 import asyncio
+import json
 import os
 from textwrap import dedent
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
 from agno.agent import Agent
 from agno.team import Team
-from mcp import StdioServerParameters
 from pydantic import BaseModel
 from agno.models.litellm import LiteLLM
-from agno.models.openai import OpenAIChat
-
-from trip_planner.models.hotels import HotelsPlannerResponse
-
-async def run(cities: list[str], dates: list[str]):
-    # Define server parameters
-    env = {
-        **os.environ, 
-    }
-    airbnb_server_params = StdioServerParameters(
-        command="npx",
-        args=["-y", "@openbnb/mcp-server-airbnb", "--ignore-robots-txt"],
-        env=env,
-    )
-
-    async with (
-        MCPTools(server_params=airbnb_server_params) as airbnb_tools,
-    ):
+
+from trip_planner.llm_cache import CachedOpenAIChat
+from trip_planner.mcp_pool import AIRBNB_SERVER, mcp_session
+from trip_planner.metrics import AGENT_RUN_SECONDS, timed
+from trip_planner.models.hotels import AirbnbListing, CityHotelListings, HotelsPlannerResponse
+from trip_planner.tools.compaction import (
+    HOTELS_TOOL_SORT,
+    airbnb_listing,
+    compact_tool_output,
+    rank_airbnb_listings,
+)
+
+# "cities" searches every city concurrently, "agent" lets one model search the cities turn by turn
+HOTELS_SEARCH_MODE = os.getenv("HOTELS_SEARCH_MODE", "cities")
+MAX_CONCURRENT_CITY_SEARCHES = int(os.getenv("HOTELS_MAX_CONCURRENT_CITY_SEARCHES", "4"))
+CITY_TIMEOUT_SECONDS = float(os.getenv("HOTELS_CITY_TIMEOUT_SECONDS", "45"))
+HOTELS_PER_CITY = int(os.getenv("HOTELS_PER_CITY", "5"))
+CITY_SEARCH_ATTEMPTS = 2
+
+_city_searches = asyncio.Semaphore(MAX_CONCURRENT_CITY_SEARCHES)
+
+
+async def run(cities: list[str], dates: list[str]) -> HotelsPlannerResponse:
+    if HOTELS_SEARCH_MODE == "agent":
+        return await run_agent_search(cities, dates)
+    return await run_city_search(cities, dates)
+
+
+async def run_city_search(cities: list[str], dates: list[str]) -> HotelsPlannerResponse:
+    """
+    Search every city concurrently with one Airbnb MCP call per city, no model involved.
+
+    Each city has its own timeout, a city that times out or fails comes back with no
+    listings while the others are still returned.
+    """
+    plans = await asyncio.gather(*(search_city_with_timeout(city, city_dates) for city, city_dates in zip(cities, dates)))
+    return HotelsPlannerResponse(hotels_plans=list(plans))
+
+
+async def search_city_with_timeout(city: str, dates: str) -> CityHotelListings:
+    try:
+        # The timeout starts once the city gets its slot, cities queued behind others are not cut short
+        async with _city_searches:
+            listings = await asyncio.wait_for(search_city(city, dates), timeout=CITY_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        print(f"Hotel search for {city} timed out after {CITY_TIMEOUT_SECONDS}s")
+        listings = []
+    except Exception as e:
+        print(f"Hotel search for {city} failed: {e!r}")
+        listings = []
+    return CityHotelListings(city=city, dates=dates, listings=listings)
+
+
+def _stay_dates(dates: str) -> Tuple[Optional[str], Optional[str]]:
+    """Check-in and check-out from "YYYY-MM-DD to YYYY-MM-DD"."""
+    checkin, _, checkout = dates.partition(" to ")
+    return checkin.strip() or None, checkout.strip() or None
+
+
+async def search_city(city: str, dates: str) -> List[AirbnbListing]:
+    checkin, checkout = _stay_dates(dates)
+    arguments = {"location": city}
+    if checkin:
+        arguments["checkin"] = checkin
+    if checkout:
+        arguments["checkout"] = checkout
+
+    last_error: Optional[str] = None
+    for _ in range(CITY_SEARCH_ATTEMPTS):
+        try:
+            async with mcp_session(AIRBNB_SERVER) as airbnb_tools:
+                result = await airbnb_tools.session.call_tool("airbnb_search", arguments)  # type: ignore[union-attr]
+        except Exception as e:
+            # A dead session is restarted by the pool, the next attempt gets a fresh one
+            last_error = repr(e)
+            continue
+        text = "".join(getattr(content, "text", "") for content in result.content)
+        if result.isError:
+            last_error = text
+            continue
+        try:
+            payload = json.loads(text)
+            items = payload["searchResults"]
+        except (ValueError, KeyError, TypeError):
+            last_error = f"unexpected airbnb_search response: {text[:200]}"
+            continue
+        listings = rank_airbnb_listings([airbnb_listing(item) for item in items if isinstance(item, dict)], HOTELS_TOOL_SORT)
+        return [
+            AirbnbListing(
+                name=listing["name"] or "Airbnb listing",
+                description=". ".join(part for part in [listing["description"], listing["rating"]] if part),
+                price=listing["price"],
+                url=listing["url"],
+            )
+            for listing in listings[:HOTELS_PER_CITY]
+        ]
+    raise RuntimeError(last_error or "airbnb_search failed")
+
+
+async def run_agent_search(cities: list[str], dates: list[str]):
+    async with mcp_session(AIRBNB_SERVER) as airbnb_tools:
         # Create all agents
         airbnb_agent = Agent(
             name="Airbnb",
             role="Airbnb Agent",
-            model=OpenAIChat("gpt-4.1-nano"),
+            model=CachedOpenAIChat("gpt-4.1-nano"),
             tools=[airbnb_tools],
+            tool_hooks=[compact_tool_output],
             instructions=dedent("""\
             You are the best at searching apartments for user.
             You are an agent that can find apartments for a given city and dates.
@@ -51,5 +132,6 @@ async def run(cities: list[str], dates: list[str]):
         query = f"Find hotels for the following cities and dates:"
         for i in range(len(cities)):
             query += f"\n- City: {cities[i]}, Dates: {dates[i]}"
-        response = await airbnb_agent.arun(query)
+        with timed(AGENT_RUN_SECONDS, agent=airbnb_agent.name):
+            response = await airbnb_agent.arun(query)
         return response.content 
@@ -0,0 +1,338 @@
+import asyncio
+import ipaddress
+import json
+import os
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import httpcore
+import httpx
+
+from trip_planner.cassette import CassetteTransport, SyncCassetteTransport
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "200"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "100"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "60"))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "32"))
+# Per-host caps that replace HTTP_MAX_CONNECTIONS_PER_HOST, 0 leaves a host uncapped. Model providers
+# are paced by the LLM rate limiter already, a second cap here would only queue their calls again.
+HTTP_MAX_CONNECTIONS_BY_HOST: Dict[str, int] = json.loads(
+    os.getenv("HTTP_MAX_CONNECTIONS_BY_HOST", '{"api.openai.com": 0, "api.groq.com": 0}')
+)
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+HTTP_READ_TIMEOUT_SECONDS = float(os.getenv("HTTP_READ_TIMEOUT_SECONDS", "60"))
+HTTP_DNS_CACHE_TTL_SECONDS = float(os.getenv("HTTP_DNS_CACHE_TTL_SECONDS", "300"))
+
+
+def _h2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+# HTTP/2 needs the optional h2 package, without it the clients speak HTTP/1.1 only
+HTTP2 = os.getenv("HTTP2", "auto") == "on" or (os.getenv("HTTP2", "auto") == "auto" and _h2_available())
+
+TIMEOUT = httpx.Timeout(HTTP_READ_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS)
+LIMITS = httpx.Limits(
+    max_connections=HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS,
+)
+
+
+class DNSCache:
+    """Resolved addresses by (host, port), so a new connection does not wait on getaddrinfo every time."""
+
+    def __init__(self, ttl: float = HTTP_DNS_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._entries: Dict[Tuple[str, int], Tuple[float, List[str]]] = {}
+
+    def get(self, host: str, port: int) -> Optional[List[str]]:
+        entry = self._entries.get((host, port))
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def set(self, host: str, port: int, addresses: List[str]) -> None:
+        if addresses:
+            self._entries[(host, port)] = (time.monotonic() + self.ttl, addresses)
+
+    def forget(self, host: str, port: int) -> None:
+        self._entries.pop((host, port), None)
+
+
+def _addresses(address_infos: Iterable[Tuple[Any, ...]]) -> List[str]:
+    return list(dict.fromkeys(info[4][0] for info in address_infos))
+
+
+def _is_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
+dns_cache = DNSCache()
+
+
+class AsyncCachedDNSBackend(httpcore.AsyncNetworkBackend):
+    """
+    httpcore network backend that resolves hosts through the DNS cache.
+
+    It connects to the resolved address while TLS still uses the original host name
+    for SNI and certificate checks. Addresses that refuse connections are tried in order
+    and a host whose addresses all fail is resolved again on the next connection.
+    """
+
+    def __init__(self, cache: DNSCache = dns_cache):
+        self._backend = httpcore.AnyIOBackend()
+        self._cache = cache
+        # Lookups in progress, so a burst of new connections to one host resolves it once
+        self._resolving: Dict[Tuple[str, int], "asyncio.Future[List[str]]"] = {}
+
+    async def _resolve(self, host: str, port: int) -> List[str]:
+        addresses = self._cache.get(host, port)
+        if addresses is not None:
+            return addresses
+        if (host, port) in self._resolving:
+            return await asyncio.shield(self._resolving[(host, port)])
+        future = asyncio.get_running_loop().create_future()
+        self._resolving[(host, port)] = future
+        try:
+            address_infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+            addresses = _addresses(address_infos)
+            self._cache.set(host, port, addresses)
+            future.set_result(addresses)
+            return addresses
+        except BaseException as e:
+            future.set_exception(e)
+            # Nobody else may be waiting, do not let the loop complain about an unretrieved exception
+            future.exception()
+            raise
+        finally:
+            del self._resolving[(host, port)]
+
+    async def connect_tcp(
+        self,
+        host: str,
+        port: int,
+        timeout: Optional[float] = None,
+        local_address: Optional[str] = None,
+        socket_options: Optional[Iterable[Any]] = None,
+    ) -> httpcore.AsyncNetworkStream:
+        if _is_ip(host):
+            return await self._backend.connect_tcp(host, port, timeout, local_address, socket_options)
+        addresses = await self._resolve(host, port)
+        error: Optional[Exception] = None
+        for address in addresses:
+            try:
+                return await self._backend.connect_tcp(address, port, timeout, local_address, socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                error = e
+        self._cache.forget(host, port)
+        raise error or httpcore.ConnectError(f"No addresses for {host}")
+
+    async def connect_unix_socket(self, path: str, timeout: Optional[float] = None, socket_options: Optional[Iterable[Any]] = None) -> httpcore.AsyncNetworkStream:
+        return await self._backend.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+class CachedDNSBackend(httpcore.NetworkBackend):
+    """Blocking counterpart of AsyncCachedDNSBackend for the sync client."""
+
+    def __init__(self, cache: DNSCache = dns_cache):
+        self._backend = httpcore.SyncBackend()
+        self._cache = cache
+
+    def connect_tcp(
+        self,
+        host: str,
+        port: int,
+        timeout: Optional[float] = None,
+        local_address: Optional[str] = None,
+        socket_options: Optional[Iterable[Any]] = None,
+    ) -> httpcore.NetworkStream:
+        if _is_ip(host):
+            return self._backend.connect_tcp(host, port, timeout, local_address, socket_options)
+        addresses = self._cache.get(host, port)
+        if addresses is None:
+            addresses = _addresses(socket.getaddrinfo(host, port, type=socket.SOCK_STREAM))
+            self._cache.set(host, port, addresses)
+        error: Optional[Exception] = None
+        for address in addresses:
+            try:
+                return self._backend.connect_tcp(address, port, timeout, local_address, socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                error = e
+        self._cache.forget(host, port)
+        raise error or httpcore.ConnectError(f"No addresses for {host}")
+
+    def connect_unix_socket(self, path: str, timeout: Optional[float] = None, socket_options: Optional[Iterable[Any]] = None) -> httpcore.NetworkStream:
+        return self._backend.connect_unix_socket(path, timeout, socket_options)
+
+    def sleep(self, seconds: float) -> None:
+        self._backend.sleep(seconds)
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release: Optional[Callable[[], None]] = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._release is not None:
+                self._release()
+                self._release = None
+
+
+class HostLimitedTransport(httpx.AsyncBaseTransport):
+    """
+    Caps the requests in flight to each host, httpx only limits the pool as a whole.
+
+    A slot is held until the response is closed, so streamed responses count for as long
+    as they are being read. One busy host (a slow search API, a site being scraped)
+    cannot take every connection of the shared pool. `by_host` overrides the cap of
+    single hosts, a cap of 0 leaves the host uncapped.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, max_per_host: int, by_host: Optional[Dict[str, int]] = None):
+        self._transport = transport
+        self._max_per_host = max_per_host
+        self._by_host = by_host or {}
+        self._hosts: Dict[str, Optional[asyncio.Semaphore]] = {}
+
+    def _semaphore(self, host: str) -> Optional[asyncio.Semaphore]:
+        if host not in self._hosts:
+            limit = self._by_host.get(host, self._max_per_host)
+            self._hosts[host] = asyncio.Semaphore(limit) if limit > 0 else None
+        return self._hosts[host]
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        semaphore = self._semaphore(request.url.host)
+        if semaphore is None:
+            return await self._transport.handle_async_request(request)
+        await semaphore.acquire()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            semaphore.release()
+            raise
+        response.stream = _ReleasingStream(response.stream, semaphore.release)  # type: ignore[arg-type]
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def _async_transport() -> httpx.AsyncBaseTransport:
+    transport = httpx.AsyncHTTPTransport(http2=HTTP2, limits=LIMITS)
+    # httpx does not take a network backend, hand it to the underlying httpcore pool
+    transport._pool._network_backend = AsyncCachedDNSBackend()
+    return CassetteTransport(HostLimitedTransport(transport, HTTP_MAX_CONNECTIONS_PER_HOST, HTTP_MAX_CONNECTIONS_BY_HOST))
+
+
+def _sync_transport() -> httpx.BaseTransport:
+    transport = httpx.HTTPTransport(http2=HTTP2, limits=LIMITS)
+    transport._pool._network_backend = CachedDNSBackend()
+    return SyncCassetteTransport(transport)
+
+
+_async_clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+_sync_client: Optional[httpx.Client] = None
+_sync_client_lock = threading.Lock()
+_litellm_async_handlers: Dict[asyncio.AbstractEventLoop, Any] = {}
+_litellm_sync_handler: Any = None
+
+
+def async_client() -> httpx.AsyncClient:
+    """
+    Process-wide async HTTP client with keep-alive pools, used by every outbound integration.
+
+    Connections are bound to the event loop they were opened on, so there is one client
+    per loop; a client of a loop that is gone is dropped rather than reused.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        for stale_loop in [stale_loop for stale_loop in _async_clients if stale_loop.is_closed()]:
+            del _async_clients[stale_loop]
+        client = httpx.AsyncClient(transport=_async_transport(), timeout=TIMEOUT)
+        _async_clients[loop] = client
+    return client
+
+
+def sync_client() -> httpx.Client:
+    """Process-wide blocking HTTP client for tools that run in worker threads."""
+    global _sync_client
+    if _sync_client is None:
+        with _sync_client_lock:
+            if _sync_client is None:
+                _sync_client = httpx.Client(transport=_sync_transport(), timeout=TIMEOUT)
+    return _sync_client
+
+
+def litellm_http_handler(asynchronous: bool) -> Any:
+    """
+    litellm HTTP handler over the shared client of the running loop, or over the sync client.
+
+    Providers litellm calls through its own HTTP handler, Groq among them, ignore
+    `litellm.aclient_session`; passing this as `client=` sends them over the shared pools.
+    """
+    from litellm.llms.custom_httpx.http_handler import AsyncHTTPHandler, HTTPHandler
+
+    global _litellm_sync_handler
+    if not asynchronous:
+        client = sync_client()
+        if _litellm_sync_handler is None or _litellm_sync_handler.client is not client:
+            _litellm_sync_handler = HTTPHandler(client=client)
+        return _litellm_sync_handler
+    client = async_client()
+    loop = asyncio.get_running_loop()
+    handler = _litellm_async_handlers.get(loop)
+    if handler is None or handler.client is not client:
+        for stale_loop in [stale_loop for stale_loop in _litellm_async_handlers if stale_loop.is_closed()]:
+            del _litellm_async_handlers[stale_loop]
+        # The handler builds a client of its own first, over our transport it opens no connections
+        handler = AsyncHTTPHandler(transport=client._transport)
+        handler.client = client
+        _litellm_async_handlers[loop] = handler
+    return handler
+
+
+def use_shared_clients_in_litellm() -> None:
+    """Point litellm's OpenAI SDK clients at the shared pools, see `litellm_http_handler` for the other providers."""
+    import litellm
+
+    litellm.client_session = sync_client()
+    try:
+        litellm.aclient_session = async_client()
+    except RuntimeError:
+        # No running loop, only sync calls are made from here
+        pass
+
+
+async def close_clients() -> None:
+    """Close the clients of the running loop and the sync client, e.g. on application shutdown."""
+    global _sync_client
+    _litellm_async_handlers.pop(asyncio.get_running_loop(), None)
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+    if _sync_client is not None:
+        _sync_client.close()
+        _sync_client = None
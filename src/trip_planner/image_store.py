@@ -0,0 +1,204 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+
+from trip_planner.cache import CACHE_DIR
+
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", os.path.join(CACHE_DIR, "images"))
+IMAGE_STORE_MAX_BYTES = int(os.getenv("IMAGE_STORE_MAX_BYTES", str(1024 * 1024 * 1024)))
+IMAGES_URL_PREFIX = os.getenv("IMAGES_URL_PREFIX", "/images")
+
+# Other workers write to the same directory, their images are picked up by a rescan this often
+IMAGE_STORE_RESCAN_SECONDS = 300.0
+
+IMAGE_ID_LENGTH = 32
+IMAGE_ID_PATTERN = re.compile(rf"^[0-9a-f]{{{IMAGE_ID_LENGTH}}}$")
+
+
+def content_id(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:IMAGE_ID_LENGTH]
+
+
+def media_type(data: bytes) -> str:
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
+def image_url(image_id: str) -> str:
+    return f"{IMAGES_URL_PREFIX.rstrip('/')}/{image_id}"
+
+
+class ImageStore:
+    """
+    Content-addressed store of generated images on local disk.
+
+    Every image is written once under the hash of its bytes, so identical images are
+    deduplicated and an image ID always refers to the same bytes. Aliases map another
+    ID, such as the hash of a generation request, to the content ID once it exists.
+
+    The least recently used images are removed together with their aliases once the
+    store grows past `max_bytes`, alias files count towards it with their image.
+    Resolving an image marks it as used by touching its mtime, and sizes are tracked in
+    an index in recently used order, rebuilt from the directory every
+    IMAGE_STORE_RESCAN_SECONDS so images stored by other workers count as well. The
+    rescan also removes aliases of images another worker evicted.
+    """
+
+    def __init__(self, root: str = IMAGE_STORE_DIR, max_bytes: int = IMAGE_STORE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(root, "aliases"), exist_ok=True)
+        self._lock = threading.Lock()
+        # Size of the image and its aliases by object path, least recently used first
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._aliases: Dict[str, Set[str]] = {}
+        self._total = 0
+        self._scanned_at: Optional[float] = None
+
+    def _object_path(self, image_id: str) -> str:
+        return os.path.join(self.root, "objects", image_id[:2], image_id)
+
+    def _alias_path(self, alias: str) -> str:
+        return os.path.join(self.root, "aliases", alias)
+
+    def put(self, data: bytes) -> str:
+        image_id = content_id(data)
+        path = self._object_path(image_id)
+        if self._touch(path):
+            return image_id
+        _atomic_write(path, data)
+        with self._lock:
+            self._scan_if_due()
+            self._add(path, len(data))
+            self._evict()
+        return image_id
+
+    def set_alias(self, alias: str, image_id: str) -> None:
+        data = image_id.encode("ascii")
+        _atomic_write(self._alias_path(alias), data)
+        path = self._object_path(image_id)
+        with self._lock:
+            # Images not indexed yet get their aliases counted by the next rescan
+            if path in self._index and alias not in self._aliases.get(path, ()):
+                self._aliases.setdefault(path, set()).add(alias)
+                self._add(path, self._index[path] + len(data))
+
+    def resolve(self, image_id: str) -> Optional[str]:
+        """Return the content ID for a content ID or an alias, None if the image is not stored."""
+        if not IMAGE_ID_PATTERN.match(image_id):
+            return None
+        if self._touch(self._object_path(image_id)):
+            return image_id
+        target = self._read_alias(image_id)
+        if target is not None and self._touch(self._object_path(target)):
+            return target
+        return None
+
+    def read(self, image_id: str) -> bytes:
+        """Bytes of a stored image, raises FileNotFoundError if it was evicted meanwhile."""
+        with open(self._object_path(image_id), "rb") as f:
+            return f.read()
+
+    def _touch(self, path: str) -> bool:
+        """Mark an image as used, False if it is not stored."""
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        with self._lock:
+            if path in self._index:
+                self._index.move_to_end(path)
+        return True
+
+    def _add(self, path: str, size: int) -> None:
+        self._total += size - self._index.pop(path, 0)
+        self._index[path] = size
+
+    def _scan_if_due(self) -> None:
+        now = time.monotonic()
+        if self._scanned_at is not None and now - self._scanned_at < IMAGE_STORE_RESCAN_SECONDS:
+            return
+        self._scanned_at = now
+        objects = []
+        for directory, _, files in os.walk(os.path.join(self.root, "objects")):
+            for name in files:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                objects.append((stat.st_mtime, path, stat.st_size))
+        self._index = OrderedDict((path, size) for _, path, size in sorted(objects))
+        self._aliases = {}
+        for alias in os.listdir(os.path.join(self.root, "aliases")):
+            target = self._read_alias(alias)
+            if target is None:
+                continue
+            path = self._object_path(target)
+            if path in self._index:
+                self._aliases.setdefault(path, set()).add(alias)
+                self._index[path] += len(target)
+            elif not os.path.exists(path):
+                # The image was evicted, by another worker or before aliases were evicted with it
+                self._remove_alias(alias, target)
+        self._total = sum(self._index.values())
+
+    def _evict(self) -> None:
+        while self._total > self.max_bytes and len(self._index) > 1:
+            path, size = self._index.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            for alias in self._aliases.pop(path, ()):
+                self._remove_alias(alias, os.path.basename(path))
+
+    def _read_alias(self, alias: str) -> Optional[str]:
+        try:
+            with open(self._alias_path(alias), "r") as f:
+                target = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return target if IMAGE_ID_PATTERN.match(target) else None
+
+    def _remove_alias(self, alias: str, image_id: str) -> None:
+        # The alias may have been pointed at another image since
+        if self._read_alias(alias) != image_id:
+            return
+        try:
+            os.remove(self._alias_path(alias))
+        except FileNotFoundError:
+            pass
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+_store: Optional[ImageStore] = None
+
+
+def get_image_store() -> ImageStore:
+    global _store
+    if _store is None:
+        _store = ImageStore()
+    return _store
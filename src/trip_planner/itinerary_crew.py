@@ -1,125 +1,441 @@
+import asyncio
 import os
+from datetime import date, timedelta
 from textwrap import dedent
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, Field
 
 from agno.agent import Agent
-from agno.models.litellm import LiteLLM
-from agno.models.openai.chat import OpenAIChat
 from agno.team import Team
 from agno.tools.duckduckgo import DuckDuckGoTools
-from agno.tools.mcp import MCPTools
 from agno.tools.reasoning import ReasoningTools
-from mcp import StdioServerParameters
 
-from trip_planner.prompts.planning_team import INSTRUCTIONS
-from trip_planner.models.itinerary import Itinerary
+from trip_planner.llm_cache import CachedLiteLLM, CachedOpenAIChat
+from trip_planner.mcp_pool import GOOGLE_MAPS_SERVER, mcp_session
+from trip_planner.metrics import AGENT_RUN_SECONDS, time_tool_call, timed
+from trip_planner.prompts.planning_team import CITY_INSTRUCTIONS, DAY_ALLOCATION_INSTRUCTIONS, INSTRUCTIONS
+from trip_planner.models.general import TravelerInput
+from trip_planner.models.itinerary import CityPlan, DayPlan, Itinerary
+from trip_planner.research import research_destination
+from trip_planner.streaming import IncrementalJSONObjects
 from trip_planner.tools.internet_search import get_top_internet_search_results
 
 
-llm = LiteLLM(
-    id="groq/llama-3.3-70b-versatile",
-    request_params={
-        "num_retries": 3,
-    }
-)
+llm = CachedLiteLLM(id="groq/llama-3.3-70b-versatile")
 
+# "cities" allocates days first and plans every city concurrently, "team" plans the whole trip with one team
+ITINERARY_PLANNING_MODE = os.getenv("ITINERARY_PLANNING_MODE", "cities")
+MAX_CONCURRENT_CITY_PLANS = int(os.getenv("ITINERARY_MAX_CONCURRENT_CITIES", "3"))
+CITY_TEAM_TOOL_CALL_LIMIT = int(os.getenv("ITINERARY_CITY_TOOL_CALL_LIMIT", "6"))
 
-env = {
-    **os.environ,
-    "GOOGLE_MAPS_API_KEY": os.getenv("GOOGLE_MAPS_API_KEY"),
-}
+_city_plans = asyncio.Semaphore(MAX_CONCURRENT_CITY_PLANS)
+
+
+def _build_team(
+    maps_tools,
+    parse_response: bool = True,
+    instructions: Optional[List[str]] = None,
+    response_model: Type[BaseModel] = Itinerary,
+    tool_call_limit: int = 10,
+) -> Team:
+    maps_agent = Agent(
+        name="Google Maps",
+        role="Location Services Agent",
+        model=llm,
+        tools=[maps_tools],
+        instructions=dedent("""\
+            You are an agent that helps find attractions, points of interest,
+            and provides directions in travel destinations from Google Maps.\
+        """),
+        add_datetime_to_instructions=True,
+    )
+
+    web_search_agent = Agent(
+        name="Web Search",
+        role="Web Search Agent",
+        model=llm,
+        tools=[research_destination, get_top_internet_search_results],
+        tool_hooks=[time_tool_call],
+        instructions=dedent("""\
+            You are an agent that can search the web for any information related to restaurants, events, etc.
+            Search for information about a given location.
+            Check research_destination for attractions first, it holds research shared across trips.\
+        """),
+        add_datetime_to_instructions=True,
+        tool_call_limit=2,
+    )
+
+    events_search_agent = Agent(
+        name="Events Search",
+        role="Events Search Agent",
+        model=llm,
+        tools=[research_destination, get_top_internet_search_results],
+        tool_hooks=[time_tool_call],
+        instructions=dedent("""\
+            You are an agent that can search for the events in the given location and date range.
+            Check research_destination for events first, search the internet only for what it does not cover.
+        """),
+        add_datetime_to_instructions=True,
+        tool_call_limit=2,
+    )
+
+    restaurants_search_agent = Agent(
+        name="Restaurants Search",
+        role="Restaurants Search Agent",
+        model=llm,
+        tools=[research_destination, get_top_internet_search_results],
+        tool_hooks=[time_tool_call],
+        instructions=dedent("""\
+            You are an agent that can search for the restaurants in the given location and date range.
+            Check research_destination for restaurants first, search the internet only for what it does not cover.
+        """),
+        add_datetime_to_instructions=True,
+        tool_call_limit=2,
+    )
 
-maps_server_params = StdioServerParameters(
-    command="npx", args=["-y", "@modelcontextprotocol/server-google-maps"], env=env
-)
+    weather_search_agent = Agent(
+        name="Weather Search",
+        role="Weather Search Agent",
+        model=llm,
+        tools=[research_destination, DuckDuckGoTools()],
+        tool_hooks=[time_tool_call],
+        instructions=dedent("""\
+            You are an agent that can search the web for information.
+            Search for the weather forecast for a given location and date.
+            Check research_destination for the weather first, it holds forecasts shared across trips.\
+        """),
+        add_datetime_to_instructions=True,
+    )
+
+    team = Team(
+        name="SkyPlanner",
+        mode="coordinate",
+        model=CachedOpenAIChat("gpt-4.1"),
+        members=[
+            web_search_agent,
+            maps_agent,
+            weather_search_agent,
+            events_search_agent,
+            restaurants_search_agent,
+        ],
+        instructions=[
+            *(instructions or INSTRUCTIONS),
+        ],
+        tools=[ReasoningTools(add_instructions=True)],
+        response_model=response_model,
+        show_tool_calls=True,
+        markdown=True,
+        debug_mode=True,
+        show_members_responses=True,
+        add_datetime_to_instructions=True,
+        enable_agentic_context=True,
+        tool_call_limit=tool_call_limit,
+        parse_response=parse_response,
+    )
+    return team
 
 
 async def run_team(query: str) -> Itinerary:
-    async with MCPTools(server_params=maps_server_params) as maps_tools:
-        maps_agent = Agent(
-            name="Google Maps",
-            role="Location Services Agent",
-            model=llm,
-            tools=[maps_tools],
-            instructions=dedent("""\
-                You are an agent that helps find attractions, points of interest,
-                and provides directions in travel destinations from Google Maps.\
-            """),
-            add_datetime_to_instructions=True,
-        )
-
-        web_search_agent = Agent(
-            name="Web Search",
-            role="Web Search Agent",
-            model=llm,
-            tools=[get_top_internet_search_results],
-            instructions=dedent("""\
-                You are an agent that can search the web for any information related to restaurants, events, etc.
-                Search for information about a given location.\
-            """),
-            add_datetime_to_instructions=True,
-            tool_call_limit=2,
-        )
-
-        events_search_agent = Agent(
-            name="Events Search",
-            role="Events Search Agent",
-            model=llm,
-            tools=[get_top_internet_search_results],
-            instructions=dedent("""\
-                You are an agent that can search for the events in the given location and date range.
-            """),
-            add_datetime_to_instructions=True,
-            tool_call_limit=2,
-        )
-
-        restaurants_search_agent = Agent(
-            name="Restaurants Search",
-            role="Restaurants Search Agent",
-            model=llm,
-            tools=[get_top_internet_search_results],
-            instructions=dedent("""\
-                You are an agent that can search for the restaurants in the given location and date range.
-            """),
-            add_datetime_to_instructions=True,
-            tool_call_limit=2,
-        )
-
-        weather_search_agent = Agent(
-            name="Weather Search",
-            role="Weather Search Agent",
-            model=llm,
-            tools=[DuckDuckGoTools()],
-            instructions=dedent("""\
-                You are an agent that can search the web for information.
-                Search for the weather forecast for a given location and date.\
-            """),
-            add_datetime_to_instructions=True,
-        )
-
-        team = Team(
-            name="SkyPlanner",
-            mode="coordinate",
-            model=OpenAIChat("gpt-4.1"),
-            members=[
-                web_search_agent,
-                maps_agent,
-                weather_search_agent,
-                events_search_agent,
-                restaurants_search_agent,
-            ],
-            instructions=[
-                *INSTRUCTIONS,
-            ],
-            tools=[ReasoningTools(add_instructions=True)],
-            response_model=Itinerary,
-            show_tool_calls=True,
-            markdown=True,
-            debug_mode=True,
-            show_members_responses=True,
-            add_datetime_to_instructions=True,
-            enable_agentic_context=True,
-            tool_call_limit=10
-        )
-
-        result = await team.arun(query)
+    async with mcp_session(GOOGLE_MAPS_SERVER) as maps_tools:
+        team = _build_team(maps_tools)
+        with timed(AGENT_RUN_SECONDS, agent=team.name):
+            result = await team.arun(query)
         return result.content # type: ignore
+
+
+class CityNights(BaseModel):
+    city: str = Field(..., description="City exactly as given in the input")
+    nights: int = Field(..., description="Nights spent in the city")
+
+
+class DayAllocation(BaseModel):
+    name: str = Field(..., description="Name of the itinerary, something funny")
+    cities: List[CityNights]
+
+
+class CityStay(BaseModel):
+    city: str
+    arrival_date: str
+    departure_date: str
+    # Days to plan, the departure day belongs to the next city except for the last one
+    dates: List[str]
+
+
+async def plan_itinerary(traveler_input: TravelerInput) -> Itinerary:
+    if ITINERARY_PLANNING_MODE == "team":
+        return await run_team(f"Plan a trip with parameters: {traveler_input.model_dump_json()}")
+    return await run_city_planning(traveler_input)
+
+
+async def run_city_planning(traveler_input: TravelerInput) -> Itinerary:
+    """
+    Plan the trip city by city.
+
+    One quick model call splits the nights across the cities, then every city is planned
+    concurrently by its own team and the city plans are merged into one itinerary, so a
+    multi-city trip takes about as long as its longest city. A city whose team fails is
+    returned without day plans rather than failing the other cities with it.
+    """
+    allocation = await allocate_days(traveler_input)
+    stays = city_stays(traveler_input, allocation)
+    results = await asyncio.gather(*(plan_city(traveler_input, stay) for stay in stays), return_exceptions=True)
+    return _merge_city_results(allocation.name, stays, results)
+
+
+def _merge_city_results(name: str, stays: List[CityStay], results: List[Any]) -> Itinerary:
+    """Merge the plans or errors of every stay, failing only if every city failed."""
+    failed = [(stay, result) for stay, result in zip(stays, results) if isinstance(result, BaseException)]
+    if len(failed) == len(stays):
+        raise failed[0][1]
+    city_plans = []
+    for stay, result in zip(stays, results):
+        if isinstance(result, asyncio.CancelledError):
+            raise result
+        if isinstance(result, BaseException):
+            print(f"Planning {stay.city} failed, returning it without day plans: {result!r}")
+            result = CityPlan(city=stay.city, arrival_date=stay.arrival_date, departure_date=stay.departure_date, day_plans=[])
+        city_plans.append(result)
+    return merge_city_plans(name, stays, city_plans)
+
+
+async def stream_itinerary(traveler_input: TravelerInput) -> AsyncIterator[Dict[str, Any]]:
+    """Plan a trip like `plan_itinerary` and yield events while it is planned, see `stream_team`."""
+    if ITINERARY_PLANNING_MODE == "team":
+        async for event in stream_team(f"Plan a trip with parameters: {traveler_input.model_dump_json()}"):
+            yield event
+        return
+    async for event in stream_city_planning(traveler_input):
+        yield event
+
+
+async def stream_city_planning(traveler_input: TravelerInput) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Plan the trip city by city like `run_city_planning` and yield events as it goes.
+
+    A "progress" event follows the day allocation, a "city_plan" event with the city's
+    index in the itinerary follows every city planned, in the order they finish, and the
+    merged "itinerary" comes last. Cities that failed only appear in the itinerary.
+    """
+    allocation = await allocate_days(traveler_input)
+    stays = city_stays(traveler_input, allocation)
+    yield {
+        "event": "progress",
+        "data": {"step": "DaysAllocated", "source": "Day Allocation", "stays": [stay.model_dump() for stay in stays]},
+    }
+
+    async def planned(index: int, stay: CityStay) -> Tuple[int, Any]:
+        try:
+            return index, await plan_city(traveler_input, stay)
+        except Exception as e:
+            return index, e
+
+    tasks = [asyncio.create_task(planned(index, stay)) for index, stay in enumerate(stays)]
+    results: List[Any] = [None] * len(stays)
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            index, result = await next_done
+            results[index] = result
+            if isinstance(result, CityPlan):
+                city_plan = merge_city_plans(allocation.name, [stays[index]], [result]).city_plans[0]
+                yield {"event": "city_plan", "data": {"index": index, "city_plan": city_plan.model_dump()}}
+    finally:
+        # The client went away, stop planning the cities still running
+        for task in tasks:
+            task.cancel()
+    itinerary = _merge_city_results(allocation.name, stays, results)
+    yield {"event": "itinerary", "data": itinerary.model_dump()}
+
+
+def _trip_nights(traveler_input: TravelerInput) -> int:
+    arrival = date.fromisoformat(traveler_input.arrival_date)
+    departure = date.fromisoformat(traveler_input.departure_date)
+    return (departure - arrival).days
+
+
+def even_allocation(cities: List[str], nights: int) -> List[CityNights]:
+    if not cities:
+        raise ValueError("A trip needs at least one city")
+    share, extra = divmod(nights, len(cities))
+    return [CityNights(city=city, nights=share + (1 if i < extra else 0)) for i, city in enumerate(cities)]
+
+
+def _valid_allocation(cities: List[str], nights: int, allocation: List[CityNights]) -> bool:
+    if [item.city for item in allocation] != cities or sum(item.nights for item in allocation) != nights:
+        return False
+    # Every city but the last needs a night, the last one can be a day trip on the departure day
+    minimum = 1 if nights >= len(cities) else 0
+    return all(item.nights >= 1 for item in allocation[:-1]) and allocation[-1].nights >= minimum
+
+
+async def allocate_days(traveler_input: TravelerInput) -> DayAllocation:
+    """Split the nights of the trip across its cities, evenly if the model's answer does not add up."""
+    cities = traveler_input.cities
+    nights = _trip_nights(traveler_input)
+    agent = Agent(
+        name="Day Allocation",
+        model=CachedOpenAIChat("gpt-4.1-mini"),
+        instructions=DAY_ALLOCATION_INSTRUCTIONS,
+        response_model=DayAllocation,
+    )
+    query = f"Total nights: {nights}\nTraveler: {traveler_input.model_dump_json()}"
+    try:
+        with timed(AGENT_RUN_SECONDS, agent=agent.name):
+            response = await agent.arun(query)
+        allocation: DayAllocation = response.content  # type: ignore
+        if _valid_allocation(cities, nights, allocation.cities):
+            return allocation
+        print(f"Day allocation {allocation.cities} does not match the trip, splitting the nights evenly")
+        name = allocation.name
+    except Exception as e:
+        print(f"Day allocation failed, splitting the nights evenly: {e!r}")
+        name = f"{', '.join(cities)} trip"
+    return DayAllocation(name=name, cities=even_allocation(cities, nights))
+
+
+def city_stays(traveler_input: TravelerInput, allocation: DayAllocation) -> List[CityStay]:
+    """
+    Consecutive stays, each city is left on the day the next one is reached.
+
+    A city without nights before the last one would share its only day with the next
+    city, so it is skipped.
+    """
+    stays = []
+    arrival = date.fromisoformat(traveler_input.arrival_date)
+    for i, item in enumerate(allocation.cities):
+        last = i == len(allocation.cities) - 1
+        if item.nights == 0 and not last:
+            print(f"No nights left for {item.city}, skipping it")
+            continue
+        departure = arrival + timedelta(days=item.nights)
+        days = item.nights + 1 if last else item.nights
+        stays.append(CityStay(
+            city=item.city,
+            arrival_date=arrival.isoformat(),
+            departure_date=departure.isoformat(),
+            dates=[(arrival + timedelta(days=day)).isoformat() for day in range(days)],
+        ))
+        arrival = departure
+    return stays
+
+
+async def plan_city(traveler_input: TravelerInput, stay: CityStay) -> CityPlan:
+    query = dedent(f"""\
+        Plan the stay in {stay.city} ({traveler_input.country}) from {stay.arrival_date} to {stay.departure_date}.
+        Plan these days: {", ".join(stay.dates)}.
+        Traveler: age {traveler_input.age}, preferences: {", ".join(traveler_input.preferences or []) or "none given"}.
+    """)
+    async with _city_plans:
+        async with mcp_session(GOOGLE_MAPS_SERVER) as maps_tools:
+            team = _build_team(
+                maps_tools,
+                instructions=CITY_INSTRUCTIONS,
+                response_model=CityPlan,
+                tool_call_limit=CITY_TEAM_TOOL_CALL_LIMIT,
+            )
+            with timed(AGENT_RUN_SECONDS, agent=team.name):
+                result = await team.arun(query)
+    if not isinstance(result.content, CityPlan):
+        raise ValueError(f"Could not plan {stay.city}: {result.content}")
+    return result.content
+
+
+def merge_city_plans(name: str, stays: List[CityStay], city_plans: List[CityPlan]) -> Itinerary:
+    """
+    Merge the city plans into one itinerary.
+
+    The allocated cities and dates win over what the teams returned: day plans outside a
+    city's stay or repeating a date are dropped and the rest are put in date order.
+    """
+    merged = []
+    for stay, plan in zip(stays, city_plans):
+        allowed = set(stay.dates)
+        day_plans: Dict[str, DayPlan] = {}
+        for day_plan in plan.day_plans:
+            day = day_plan.date.strip()[:10]
+            if day in allowed and day not in day_plans:
+                day_plans[day] = day_plan.model_copy(update={"date": day})
+        missing = allowed - set(day_plans)
+        if missing:
+            print(f"City plan for {stay.city} is missing days: {', '.join(sorted(missing))}")
+        merged.append(CityPlan(
+            city=stay.city,
+            arrival_date=stay.arrival_date,
+            departure_date=stay.departure_date,
+            day_plans=[day_plans[day] for day in sorted(day_plans)],
+        ))
+    return Itinerary(name=name, city_plans=merged)
+
+
+async def stream_team(query: str) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run the planning team and yield events while it works.
+
+    Yields dictionaries with an "event" name and "data":
+    - "progress": the coordinator or a member agent started or finished a step or tool call
+    - "day_plan" / "city_plan": a plan from the itinerary as soon as it is complete and valid
+    - "itinerary": the final, validated itinerary
+    - "error": the run failed
+
+    Agno does not stream the model output when it parses it into the response model itself,
+    so the team streams raw JSON and the itinerary is validated here instead.
+    """
+    parser = IncrementalJSONObjects(patterns=[("city_plans", "*"), ("city_plans", "*", "day_plans", "*")])
+    content = ""
+    async with mcp_session(GOOGLE_MAPS_SERVER) as maps_tools:
+        team = _build_team(maps_tools, parse_response=False)
+        with timed(AGENT_RUN_SECONDS, agent=team.name):
+            stream = await team.arun(query, stream=True, stream_intermediate_steps=True)
+            async for event in stream:
+                name = getattr(event, "event", "")
+                if name == "TeamRunResponseContent":
+                    if not isinstance(event.content, str):
+                        continue
+                    content += event.content
+                    for completed in parser.feed(event.content):
+                        plan_event = _plan_event(completed.path, completed.value)
+                        if plan_event is not None:
+                            yield plan_event
+                elif name == "TeamRunError":
+                    yield {"event": "error", "data": {"detail": str(event.content)}}
+                    return
+                elif name in PROGRESS_EVENTS:
+                    yield {"event": "progress", "data": _progress_data(event)}
+
+    try:
+        itinerary = Itinerary.model_validate_json(content)
+    except ValueError as e:
+        yield {"event": "error", "data": {"detail": f"Error parsing itinerary: {e}"}}
+        return
+    yield {"event": "itinerary", "data": itinerary.model_dump()}
+
+
+PROGRESS_EVENTS = {
+    "TeamRunStarted", "TeamToolCallStarted", "TeamToolCallCompleted", "TeamReasoningStep",
+    "RunStarted", "ToolCallStarted", "ToolCallCompleted", "RunCompleted",
+}
+
+
+def _progress_data(event: Any) -> Dict[str, Any]:
+    data = {
+        "step": event.event,
+        "source": getattr(event, "agent_name", None) or getattr(event, "team_name", None),
+    }
+    tool = getattr(event, "tool", None)
+    if tool is not None:
+        data["tool"] = tool.tool_name
+        data["tool_args"] = tool.tool_args
+    return data
+
+
+def _plan_event(path: tuple, value: Any) -> Any:
+    try:
+        if len(path) == 2:
+            return {"event": "city_plan", "data": {"index": path[1], "city_plan": CityPlan.model_validate(value).model_dump()}}
+        return {
+            "event": "day_plan",
+            "data": {"city_index": path[1], "index": path[3], "day_plan": DayPlan.model_validate(value).model_dump()},
+        }
+    except ValueError:
+        # Not valid yet against the model, the final itinerary still carries it
+        return None
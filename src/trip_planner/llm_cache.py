@@ -0,0 +1,421 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Type, TypeVar, Union
+
+import litellm
+from agno.models.litellm import LiteLLM
+from agno.models.message import Message
+from agno.models.openai import OpenAIChat
+from litellm import ModelResponse, acompletion
+from openai import AsyncOpenAI, OpenAI
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from pydantic import BaseModel
+
+from trip_planner.cache import MemoryCache, TieredCache
+from trip_planner.cassette import active_cassette
+from trip_planner.http_clients import async_client, litellm_http_handler, sync_client, use_shared_clients_in_litellm
+from trip_planner.llm_scheduler import estimate_request_tokens, scheduler
+from trip_planner.metrics import CACHE_LOOKUPS, LLM_CALL_SECONDS, record_usage
+
+# "off", "memory" (this process only) or "disk" (shared by the workers on a host and kept across restarts)
+LLM_CACHE = os.getenv("LLM_CACHE", "off")
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Request parameters that do not change the completion and must not end up in cache keys
+_UNKEYED_PARAMS = {"api_key", "api_base", "client", "num_retries", "timeout", "extra_headers", "metadata", "user"}
+# Providers litellm calls through its own HTTP handler, which takes the shared pools as `client=`
+LITELLM_HTTP_HANDLER_PROVIDERS = {"groq"}
+
+# agno's add_datetime_to_instructions puts the time to the microsecond into the prompt
+_CURRENT_TIME = re.compile(r"The current time is \d{4}-\d\d-\d\d[ T][0-9:.+-]*")
+
+_bypass: contextvars.ContextVar[bool] = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+T = TypeVar("T")
+
+
+class CompletionCache:
+    """
+    Exact-match cache of chat completions.
+
+    Keys hash everything that determines a completion: the model, messages, tools,
+    response schema and sampling parameters. Only an identical request is a hit, so the
+    cache replays retries and duplicate requests but never answers a different prompt.
+    The current time agents are told is left out of keys, else no request would repeat.
+    """
+
+    def __init__(self, backend: str = LLM_CACHE, ttl: float = LLM_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl = ttl
+        self._store: Optional[Union[MemoryCache, TieredCache]] = None
+        if backend == "memory":
+            self._store = MemoryCache(max_entries=LLM_CACHE_MAX_ENTRIES)
+        elif backend == "disk":
+            self._store = TieredCache(
+                "llm_completions",
+                ttl=ttl,
+                memory_entries=min(LLM_CACHE_MAX_ENTRIES, 1024),
+                disk_entries=LLM_CACHE_MAX_ENTRIES * 10,
+                disk_bytes=LLM_CACHE_MAX_BYTES,
+            )
+
+    @property
+    def enabled(self) -> bool:
+        return self._store is not None and not _bypass.get()
+
+    @staticmethod
+    def key(model: str, messages: List[Any], **params: Any) -> str:
+        keyed = {name: value for name, value in params.items() if name not in _UNKEYED_PARAMS and value is not None}
+        payload = json.dumps({"model": model, "messages": messages, "params": keyed}, sort_keys=True, default=_schema_or_str)
+        payload = _CURRENT_TIME.sub("The current time is now", payload)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        value = self._store.get(key)  # type: ignore[union-attr]
+        if isinstance(self._store, MemoryCache):
+            # The disk backend counts its own lookups
+            CACHE_LOOKUPS.labels(cache="llm_completions", result="miss" if value is None else "memory_hit").inc()
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        if self.enabled:
+            self._store.set(key, value, self.ttl)  # type: ignore[union-attr]
+
+
+def _schema_or_str(value: Any) -> Any:
+    if isinstance(value, type) and issubclass(value, BaseModel):
+        return value.model_json_schema()
+    return str(value)
+
+
+completion_cache = CompletionCache()
+
+
+@contextmanager
+def llm_cache_bypass() -> Iterator[None]:
+    """Skip the completion cache, reads and writes, for every model call made inside the block."""
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def _dump(response: Any) -> Dict[str, Any]:
+    return response.model_dump(mode="json")
+
+
+def _wants_key(use_cache: bool) -> bool:
+    return (use_cache and completion_cache.enabled) or active_cassette() is not None
+
+
+async def _aprovider_call(model: str, tokens: int, call: Callable[[], Awaitable[T]]) -> T:
+    async def timed_call() -> T:
+        started = time.perf_counter()
+        response = await call()
+        LLM_CALL_SECONDS.labels(model=model).observe(time.perf_counter() - started)
+        record_usage(model, getattr(response, "usage", None))
+        return response
+
+    return await scheduler.acall(model, tokens, timed_call)
+
+
+def _provider_call(model: str, tokens: int, call: Callable[[], T]) -> T:
+    def timed_call() -> T:
+        started = time.perf_counter()
+        response = call()
+        LLM_CALL_SECONDS.labels(model=model).observe(time.perf_counter() - started)
+        record_usage(model, getattr(response, "usage", None))
+        return response
+
+    return scheduler.call(model, tokens, timed_call)
+
+
+async def _aprovider_stream(model: str, tokens: int, stream: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+    # Usage comes with the last chunk, when the provider reports it for streams at all
+    started = time.perf_counter()
+    async for chunk in scheduler.astream(model, tokens, stream):
+        record_usage(model, getattr(chunk, "usage", None))
+        yield chunk
+    LLM_CALL_SECONDS.labels(model=model).observe(time.perf_counter() - started)
+
+
+def _provider_stream(model: str, tokens: int, stream: Callable[[], Iterator[Any]]) -> Iterator[Any]:
+    started = time.perf_counter()
+    for chunk in scheduler.stream(model, tokens, stream):
+        record_usage(model, getattr(chunk, "usage", None))
+        yield chunk
+    LLM_CALL_SECONDS.labels(model=model).observe(time.perf_counter() - started)
+
+
+async def _acomplete(key: Optional[str], use_cache: bool, model: str, tokens: int, provider_call: Callable[[], Awaitable[T]], load: Callable[[Dict[str, Any]], T]) -> T:
+    """
+    A completion from the cache, the active cassette or the provider, in that order.
+
+    Only calls that reach the provider wait for the rate limiter, `tokens` is their estimated size.
+    """
+    call = partial(_aprovider_call, model, tokens, provider_call)
+    if key is None:
+        return await call()
+    # The disk backend is a SQLite file, keep it off the event loop
+    cached = await asyncio.to_thread(completion_cache.get, key) if use_cache else None
+    if cached is not None:
+        return load(cached)
+    cassette = active_cassette()
+    if cassette is not None:
+        response = await cassette.acall("llm", f"llm:{key}", {"model": model}, call, dump=_dump, load=load)
+    else:
+        response = await call()
+    data = _dump(response)
+    if use_cache and data.get("choices"):
+        await asyncio.to_thread(completion_cache.set, key, data)
+    return response
+
+
+def _complete(key: Optional[str], use_cache: bool, model: str, tokens: int, provider_call: Callable[[], T], load: Callable[[Dict[str, Any]], T]) -> T:
+    """Blocking counterpart of `_acomplete`."""
+    call = partial(_provider_call, model, tokens, provider_call)
+    if key is None:
+        return call()
+    cached = completion_cache.get(key) if use_cache else None
+    if cached is not None:
+        return load(cached)
+    cassette = active_cassette()
+    if cassette is not None:
+        response = cassette.call("llm", f"llm:{key}", {"model": model}, call, dump=_dump, load=load)
+    else:
+        response = call()
+    data = _dump(response)
+    if use_cache and data.get("choices"):
+        completion_cache.set(key, data)
+    return response
+
+
+def _model_response(data: Dict[str, Any]) -> ModelResponse:
+    return ModelResponse(**data)
+
+
+def _with_shared_client(kwargs: Dict[str, Any], asynchronous: bool) -> Dict[str, Any]:
+    if "client" in kwargs or kwargs["model"].split("/", 1)[0] not in LITELLM_HTTP_HANDLER_PROVIDERS:
+        return kwargs
+    return {**kwargs, "client": litellm_http_handler(asynchronous)}
+
+
+class _SharedPoolsLiteLLM:
+    """The litellm module as agno's LiteLLM uses it, with every completion sent over the shared pools."""
+
+    def completion(self, **kwargs: Any) -> Any:
+        return litellm.completion(**_with_shared_client(kwargs, asynchronous=False))
+
+    async def acompletion(self, **kwargs: Any) -> Any:
+        return await litellm.acompletion(**_with_shared_client(kwargs, asynchronous=True))
+
+
+async def cached_acompletion(*, cache: bool = True, **kwargs: Any) -> ModelResponse:
+    """`litellm.acompletion` through the completion cache, pass `cache=False` to bypass it for one call."""
+    use_shared_clients_in_litellm()
+    tokens = estimate_request_tokens(kwargs["messages"], kwargs.get("max_tokens"))
+    if kwargs.get("stream"):
+        # Waits for the rate limiter before the stream starts, its usage is not settled afterwards
+        return await scheduler.acall(kwargs["model"], tokens, lambda: acompletion(**_with_shared_client(kwargs, asynchronous=True)))
+    key = completion_cache.key(**kwargs) if _wants_key(cache) else None
+    return await _acomplete(
+        key, cache, kwargs["model"], tokens, lambda: acompletion(**_with_shared_client(kwargs, asynchronous=True)), _model_response
+    )
+
+
+@dataclass
+class CachedOpenAIChat(OpenAIChat):
+    """
+    OpenAIChat whose non-streaming completions go through the completion cache.
+
+    Its clients use the shared connection pools instead of a new HTTP client per call,
+    completions sent to the provider wait for its rate limiter and are recorded in the metrics.
+    """
+
+    cache_completions: bool = True
+    # The SDK would retry 429s on its own, behind the scheduler's back; the scheduler retries them
+    max_retries: Optional[int] = 0
+
+    def get_client(self) -> OpenAI:
+        if self.http_client is not None:
+            return super().get_client()
+        return OpenAI(**self._get_client_params(), http_client=sync_client())
+
+    def get_async_client(self) -> AsyncOpenAI:
+        if self.http_client is not None:
+            return super().get_async_client()
+        return AsyncOpenAI(**self._get_client_params(), http_client=async_client())
+
+    def _estimated_tokens(self, messages: List[Message]) -> int:
+        return estimate_request_tokens(messages, self.max_completion_tokens or self.max_tokens)
+
+    def _completion_key(self, messages: List[Message], response_format: Any, tools: Any, tool_choice: Any) -> Optional[str]:
+        if not _wants_key(self.cache_completions):
+            return None
+        return completion_cache.key(
+            f"openai/{self.id}",
+            [self._format_message(message) for message in messages],
+            **self.get_request_params(response_format=response_format, tools=tools, tool_choice=tool_choice),
+        )
+
+    def invoke(
+        self,
+        messages: List[Message],
+        response_format: Optional[Union[Dict, Type[BaseModel]]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[Union[str, Dict[str, Any]]] = None,
+    ) -> ChatCompletion:
+        return _complete(
+            self._completion_key(messages, response_format, tools, tool_choice),
+            self.cache_completions,
+            self.id,
+            self._estimated_tokens(messages),
+            lambda: super(CachedOpenAIChat, self).invoke(messages, response_format=response_format, tools=tools, tool_choice=tool_choice),
+            ChatCompletion.model_validate,
+        )
+
+    async def ainvoke(
+        self,
+        messages: List[Message],
+        response_format: Optional[Union[Dict, Type[BaseModel]]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[Union[str, Dict[str, Any]]] = None,
+    ) -> ChatCompletion:
+        return await _acomplete(
+            self._completion_key(messages, response_format, tools, tool_choice),
+            self.cache_completions,
+            self.id,
+            self._estimated_tokens(messages),
+            lambda: super(CachedOpenAIChat, self).ainvoke(messages, response_format=response_format, tools=tools, tool_choice=tool_choice),
+            ChatCompletion.model_validate,
+        )
+
+    def invoke_stream(
+        self,
+        messages: List[Message],
+        response_format: Optional[Union[Dict, Type[BaseModel]]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[Union[str, Dict[str, Any]]] = None,
+    ) -> Iterator[ChatCompletionChunk]:
+        yield from _provider_stream(
+            self.id,
+            self._estimated_tokens(messages),
+            lambda: super(CachedOpenAIChat, self).invoke_stream(messages, response_format=response_format, tools=tools, tool_choice=tool_choice),
+        )
+
+    async def ainvoke_stream(
+        self,
+        messages: List[Message],
+        response_format: Optional[Union[Dict, Type[BaseModel]]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[Union[str, Dict[str, Any]]] = None,
+    ) -> AsyncIterator[ChatCompletionChunk]:
+        async for chunk in _aprovider_stream(
+            self.id,
+            self._estimated_tokens(messages),
+            lambda: super(CachedOpenAIChat, self).ainvoke_stream(messages, response_format=response_format, tools=tools, tool_choice=tool_choice),
+        ):
+            yield chunk
+
+
+@dataclass
+class CachedLiteLLM(LiteLLM):
+    """
+    LiteLLM model whose non-streaming completions go through the completion cache and the shared connection pools.
+
+    Completions sent to the provider wait for its rate limiter and are recorded in the metrics.
+    """
+
+    cache_completions: bool = True
+
+    def get_client(self) -> Any:
+        use_shared_clients_in_litellm()
+        if self.client is None:
+            self.client = _SharedPoolsLiteLLM()
+        return self.client
+
+    def _estimated_tokens(self, messages: List[Message]) -> int:
+        return estimate_request_tokens(messages, self.max_tokens)
+
+    def _completion_key(self, messages: List[Message], response_format: Any, tools: Any) -> Optional[str]:
+        if not _wants_key(self.cache_completions):
+            return None
+        params = self.get_request_params(tools=tools)
+        return completion_cache.key(
+            params.pop("model"),
+            self._format_messages(messages),
+            response_format=response_format,
+            **params,
+        )
+
+    def invoke(
+        self,
+        messages: List[Message],
+        response_format: Optional[Union[Dict, Type[BaseModel]]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[Union[str, Dict[str, Any]]] = None,
+    ) -> Any:
+        return _complete(
+            self._completion_key(messages, response_format, tools),
+            self.cache_completions,
+            self.id,
+            self._estimated_tokens(messages),
+            lambda: super(CachedLiteLLM, self).invoke(messages, response_format=response_format, tools=tools, tool_choice=tool_choice),
+            _model_response,
+        )
+
+    async def ainvoke(
+        self,
+        messages: List[Message],
+        response_format: Optional[Union[Dict, Type[BaseModel]]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[Union[str, Dict[str, Any]]] = None,
+    ) -> Any:
+        return await _acomplete(
+            self._completion_key(messages, response_format, tools),
+            self.cache_completions,
+            self.id,
+            self._estimated_tokens(messages),
+            lambda: super(CachedLiteLLM, self).ainvoke(messages, response_format=response_format, tools=tools, tool_choice=tool_choice),
+            _model_response,
+        )
+
+    def invoke_stream(
+        self,
+        messages: List[Message],
+        response_format: Optional[Union[Dict, Type[BaseModel]]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[Union[str, Dict[str, Any]]] = None,
+    ) -> Iterator[Any]:
+        yield from _provider_stream(
+            self.id,
+            self._estimated_tokens(messages),
+            lambda: super(CachedLiteLLM, self).invoke_stream(messages, response_format=response_format, tools=tools, tool_choice=tool_choice),
+        )
+
+    async def ainvoke_stream(
+        self,
+        messages: List[Message],
+        response_format: Optional[Union[Dict, Type[BaseModel]]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[Union[str, Dict[str, Any]]] = None,
+    ) -> AsyncIterator[Any]:
+        async for chunk in _aprovider_stream(
+            self.id,
+            self._estimated_tokens(messages),
+            lambda: super(CachedLiteLLM, self).ainvoke_stream(messages, response_format=response_format, tools=tools, tool_choice=tool_choice),
+        ):
+            yield chunk
@@ -0,0 +1,420 @@
+import asyncio
+import contextvars
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar, Union
+
+from trip_planner.metrics import LLM_QUEUE_DEPTH, LLM_QUEUE_WAIT_SECONDS, LLM_RATE_LIMITED
+from trip_planner.tools.page_chunking import estimate_tokens
+
+T = TypeVar("T")
+
+# Requests and tokens per minute, by provider ("openai", "groq") or by provider/model, which wins.
+# Each model gets its own buckets, the provider entry only supplies the limits. "{}" turns limiting off.
+LLM_RATE_LIMITS: Dict[str, Dict[str, float]] = json.loads(
+    os.getenv("LLM_RATE_LIMITS", '{"openai": {"rpm": 500, "tpm": 200000}, "groq": {"rpm": 1000, "tpm": 300000}}')
+)
+# Completion tokens reserved for a call that does not set max_tokens, the difference is settled afterwards
+LLM_COMPLETION_TOKENS_ESTIMATE = int(os.getenv("LLM_COMPLETION_TOKENS_ESTIMATE", "512"))
+LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "3"))
+# Backoff after a 429 that says nothing about when to retry, doubled on every retry
+LLM_RATE_LIMIT_BACKOFF_SECONDS = float(os.getenv("LLM_RATE_LIMIT_BACKOFF_SECONDS", "2"))
+MAX_BACKOFF_SECONDS = 60.0
+
+# Lower runs first: requests someone is waiting for go ahead of jobs and background refreshes
+INTERACTIVE = 0
+BACKGROUND = 10
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+
+class SharedPriority:
+    """Priority of work done for several callers, raised to the most urgent one as they join."""
+
+    def __init__(self, value: int):
+        self.value = value
+
+    def raise_to(self, priority: int) -> bool:
+        if priority >= self.value:
+            return False
+        self.value = priority
+        return True
+
+
+_priority: contextvars.ContextVar[Union[int, SharedPriority]] = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def llm_priority(priority: Union[int, SharedPriority]) -> Iterator[None]:
+    """Run the model calls of the block, and of the tasks it starts, at `priority`."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    priority = _priority.get()
+    return priority.value if isinstance(priority, SharedPriority) else priority
+
+
+def _priority_name(priority: int) -> str:
+    return PRIORITY_NAMES.get(priority, str(priority))
+
+
+def estimate_request_tokens(messages: List[Any], max_tokens: Optional[int] = None) -> int:
+    """Tokens a call is expected to use: its messages, as agno Messages or dicts, plus the completion."""
+    text = json.dumps([getattr(message, "content", message) for message in messages], default=str)
+    return estimate_tokens(text) + (max_tokens or LLM_COMPLETION_TOKENS_ESTIMATE)
+
+
+def _usage_tokens(usage: Any) -> Optional[int]:
+    if usage is None:
+        return None
+    total = getattr(usage, "total_tokens", None)
+    if total is None:
+        total = (getattr(usage, "prompt_tokens", 0) or 0) + (getattr(usage, "completion_tokens", 0) or 0)
+    return total
+
+
+def _duration_seconds(value: str) -> Optional[float]:
+    # OpenAI reset headers look like "1s", "6m0s" or "250ms"
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(number) * scale[unit] for number, unit in parts)
+
+
+def rate_limit_delay(error: BaseException) -> Optional[float]:
+    """
+    Seconds the provider asks to wait before retrying, None if `error` is not a rate limit.
+
+    Reads retry-after-ms / retry-after (seconds or an HTTP date) and OpenAI's
+    x-ratelimit-reset-* headers; 0 if the 429 carries none of them. agno raises provider
+    errors as ModelProviderError from the SDK's error, so the whole cause chain is searched.
+    """
+    status = None
+    headers: Dict[str, Any] = {}
+    cause: Optional[BaseException] = error
+    while cause is not None:
+        response = getattr(cause, "response", None)
+        status = status or getattr(cause, "status_code", None) or getattr(response, "status_code", None)
+        headers = headers or dict(getattr(response, "headers", None) or getattr(cause, "litellm_response_headers", None) or {})
+        cause = cause.__cause__
+    if status != 429:
+        return None
+    headers = {name.lower(): value for name, value in headers.items()}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            value = headers["retry-after"]
+            try:
+                return max(float(value), 0.0)
+            except ValueError:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        pass
+    resets = [_duration_seconds(str(headers[name])) for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens") if name in headers]
+    resets = [reset for reset in resets if reset is not None]
+    return max(resets) if resets else 0.0
+
+
+class _Bucket:
+    """Token bucket refilled continuously, holding at most a minute's worth."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        # A call larger than the bucket waits for a full bucket instead of forever
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        # May go negative when a call used more than it reserved, later calls wait for it
+        self.level -= amount
+
+
+class _Waiter:
+    def __init__(self, priority: Union[int, SharedPriority], tokens: int, loop: Optional[asyncio.AbstractEventLoop]):
+        self._priority = priority
+        # Queue depth is counted under the priority the call was queued with
+        self.label = _priority_name(self.priority)
+        self.tokens = tokens
+        self.loop = loop
+        self.async_event = asyncio.Event() if loop is not None else None
+        self.thread_event = threading.Event() if loop is None else None
+
+    def wake(self) -> None:
+        if self.async_event is not None:
+            self.loop.call_soon_threadsafe(self.async_event.set)  # type: ignore[union-attr]
+        else:
+            self.thread_event.set()  # type: ignore[union-attr]
+
+    @property
+    def priority(self) -> int:
+        return self._priority.value if isinstance(self._priority, SharedPriority) else self._priority
+
+
+class RateLimiter:
+    """
+    Request and token buckets of one model, with waiters served in priority order.
+
+    Only the first waiter in line may take from the buckets, so a queued interactive call is
+    never overtaken by background work. The line is worked out on every check, as shared
+    work can be raised to a higher priority while it waits. After a 429 the limiter holds
+    everyone back for as long as the provider asked.
+    """
+
+    def __init__(self, model: str, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        self.model = model
+        self.requests = _Bucket(rpm) if rpm else None
+        self.tokens = _Bucket(tpm) if tpm else None
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+        self._queue: List[Tuple[int, _Waiter]] = []
+        self._order = itertools.count()
+
+    def _wait_time(self, tokens: int, now: float) -> float:
+        wait = max(self.blocked_until - now, 0.0)
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1, now))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens, now))
+        return wait
+
+    def _head(self) -> Optional[_Waiter]:
+        if not self._queue:
+            return None
+        return min(self._queue, key=lambda entry: (entry[1].priority, entry[0]))[1]
+
+    def _enqueue(self, waiter: _Waiter) -> None:
+        with self._lock:
+            self._queue.append((next(self._order), waiter))
+        LLM_QUEUE_DEPTH.labels(model=self.model, priority=waiter.label).inc()
+
+    def _remove(self, waiter: _Waiter) -> bool:
+        entries = [entry for entry in self._queue if entry[1] is not waiter]
+        removed = len(entries) != len(self._queue)
+        self._queue = entries
+        return removed
+
+    def _try_take(self, waiter: _Waiter) -> Optional[float]:
+        """0 once `waiter` got its share, seconds to wait if it is first in line, None if it is not."""
+        with self._lock:
+            head = self._head()
+            if head is not waiter:
+                # The head may have been overtaken by raised shared work while it slept, let it check
+                if head is not None:
+                    head.wake()
+                return None
+            wait = self._wait_time(waiter.tokens, time.monotonic())
+            if wait > 0:
+                return wait
+            self._remove(waiter)
+            if self.requests is not None:
+                self.requests.take(1)
+            if self.tokens is not None:
+                self.tokens.take(waiter.tokens)
+            head = self._head()
+        LLM_QUEUE_DEPTH.labels(model=self.model, priority=waiter.label).dec()
+        if head is not None:
+            head.wake()
+        return 0.0
+
+    def _leave(self, waiter: _Waiter) -> None:
+        with self._lock:
+            if not self._remove(waiter):
+                return
+            head = self._head()
+        LLM_QUEUE_DEPTH.labels(model=self.model, priority=waiter.label).dec()
+        if head is not None:
+            head.wake()
+
+    async def acquire(self, tokens: int, priority: Union[int, SharedPriority] = INTERACTIVE) -> None:
+        """Wait until a call of `tokens` tokens may be sent."""
+        waiter = _Waiter(priority, tokens, asyncio.get_running_loop())
+        event = waiter.async_event
+        self._enqueue(waiter)
+        started = time.monotonic()
+        try:
+            while True:
+                event.clear()  # type: ignore[union-attr]
+                wait = self._try_take(waiter)
+                if wait == 0:
+                    break
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=wait)  # type: ignore[union-attr]
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            self._leave(waiter)
+            raise
+        LLM_QUEUE_WAIT_SECONDS.labels(model=self.model, priority=waiter.label).observe(time.monotonic() - started)
+
+    def acquire_blocking(self, tokens: int, priority: Union[int, SharedPriority] = INTERACTIVE) -> None:
+        """Blocking counterpart of `acquire`, for model calls made from threads."""
+        waiter = _Waiter(priority, tokens, None)
+        event = waiter.thread_event
+        self._enqueue(waiter)
+        started = time.monotonic()
+        try:
+            while True:
+                event.clear()  # type: ignore[union-attr]
+                wait = self._try_take(waiter)
+                if wait == 0:
+                    break
+                event.wait(timeout=wait)  # type: ignore[union-attr]
+        except BaseException:
+            self._leave(waiter)
+            raise
+        LLM_QUEUE_WAIT_SECONDS.labels(model=self.model, priority=waiter.label).observe(time.monotonic() - started)
+
+    def settle(self, reserved: int, used: Optional[int]) -> None:
+        """Correct the token bucket once the actual usage of a call is known."""
+        if self.tokens is None or used is None:
+            return
+        with self._lock:
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + reserved - used)
+
+    def back_off(self, seconds: float) -> None:
+        """Hold every call back for `seconds`, after the provider answered 429."""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            # The provider's view of the remaining budget is lower than ours, start from empty buckets
+            for bucket in (self.requests, self.tokens):
+                if bucket is not None:
+                    bucket.level = min(bucket.level, 0.0)
+        LLM_RATE_LIMITED.labels(model=self.model).inc()
+
+
+class LLMScheduler:
+    """
+    Process-wide gate for model calls: rate limits per provider and model, priorities and 429 backoff.
+
+    Calls are retried on 429 after waiting as long as the provider asked (or an exponential
+    backoff if it did not say), other errors are raised right away.
+    """
+
+    def __init__(self, limits: Dict[str, Dict[str, float]], retries: int = LLM_RATE_LIMIT_RETRIES):
+        self.limits = limits
+        self.retries = retries
+        self._limiters: Dict[str, Optional[RateLimiter]] = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, model: str) -> Optional[RateLimiter]:
+        """The limiter of a model, agno OpenAIChat ids without a provider prefix are OpenAI models."""
+        model = model if "/" in model else f"openai/{model}"
+        with self._lock:
+            if model not in self._limiters:
+                limits = self.limits.get(model) or self.limits.get(model.split("/", 1)[0])
+                self._limiters[model] = RateLimiter(model, limits.get("rpm"), limits.get("tpm")) if limits else None
+            return self._limiters[model]
+
+    def _backoff(self, limiter: RateLimiter, error: BaseException, attempt: int) -> bool:
+        delay = rate_limit_delay(error)
+        if delay is None or attempt >= self.retries:
+            return False
+        if not delay:
+            delay = min(LLM_RATE_LIMIT_BACKOFF_SECONDS * 2 ** attempt, MAX_BACKOFF_SECONDS) * random.uniform(0.8, 1.2)
+        print(f"Rate limited by {limiter.model}, backing off for {delay:.1f}s")
+        limiter.back_off(delay)
+        return True
+
+    async def acall(self, model: str, tokens: int, call: Callable[[], Awaitable[T]]) -> T:
+        limiter = self.limiter(model)
+        if limiter is None:
+            return await call()
+        for attempt in itertools.count():
+            await limiter.acquire(tokens, _priority.get())
+            try:
+                response = await call()
+            except Exception as e:
+                if self._backoff(limiter, e, attempt):
+                    continue
+                raise
+            limiter.settle(tokens, _usage_tokens(getattr(response, "usage", None)))
+            return response
+        raise AssertionError("unreachable")
+
+    def call(self, model: str, tokens: int, call: Callable[[], T]) -> T:
+        """Blocking counterpart of `acall`."""
+        limiter = self.limiter(model)
+        if limiter is None:
+            return call()
+        for attempt in itertools.count():
+            limiter.acquire_blocking(tokens, _priority.get())
+            try:
+                response = call()
+            except Exception as e:
+                if self._backoff(limiter, e, attempt):
+                    continue
+                raise
+            limiter.settle(tokens, _usage_tokens(getattr(response, "usage", None)))
+            return response
+        raise AssertionError("unreachable")
+
+    async def astream(self, model: str, tokens: int, stream: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """Chunks of a streamed call, retried on 429 only as long as nothing was yielded yet."""
+        limiter = self.limiter(model)
+        if limiter is None:
+            async for chunk in stream():
+                yield chunk
+            return
+        for attempt in itertools.count():
+            await limiter.acquire(tokens, _priority.get())
+            used: Optional[int] = None
+            yielded = False
+            try:
+                async for chunk in stream():
+                    used = _usage_tokens(getattr(chunk, "usage", None)) or used
+                    yielded = True
+                    yield chunk
+            except Exception as e:
+                if not yielded and self._backoff(limiter, e, attempt):
+                    continue
+                raise
+            limiter.settle(tokens, used)
+            return
+
+    def stream(self, model: str, tokens: int, stream: Callable[[], Iterator[T]]) -> Iterator[T]:
+        """Blocking counterpart of `astream`."""
+        limiter = self.limiter(model)
+        if limiter is None:
+            yield from stream()
+            return
+        for attempt in itertools.count():
+            limiter.acquire_blocking(tokens, _priority.get())
+            used: Optional[int] = None
+            yielded = False
+            try:
+                for chunk in stream():
+                    used = _usage_tokens(getattr(chunk, "usage", None)) or used
+                    yielded = True
+                    yield chunk
+            except Exception as e:
+                if not yielded and self._backoff(limiter, e, attempt):
+                    continue
+                raise
+            limiter.settle(tokens, used)
+            return
+
+
+scheduler = LLMScheduler(LLM_RATE_LIMITS)
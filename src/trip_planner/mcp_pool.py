@@ -0,0 +1,278 @@
+import asyncio
+import os
+import shlex
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+from agno.tools.mcp import MCPTools
+from mcp import StdioServerParameters
+
+from trip_planner.cassette import record_mcp_calls
+from trip_planner.metrics import time_mcp_calls
+
+GOOGLE_MAPS_SERVER = "google_maps"
+AIRBNB_SERVER = "airbnb"
+
+POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "2"))
+HEALTH_CHECK_INTERVAL_SECONDS = float(os.getenv("MCP_HEALTH_CHECK_INTERVAL_SECONDS", "30"))
+PING_TIMEOUT_SECONDS = 5.0
+START_TIMEOUT_SECONDS = 120.0
+
+
+def _command(env_var: str, default: List[str]) -> List[str]:
+    """Server command line, overridable with an env var, e.g. to run local stand-ins in benchmarks."""
+    command = os.getenv(env_var)
+    return shlex.split(command) if command else default
+
+
+def google_maps_server_params() -> StdioServerParameters:
+    env = {
+        **os.environ,
+        "GOOGLE_MAPS_API_KEY": os.getenv("GOOGLE_MAPS_API_KEY", ""),
+    }
+    command = _command("GOOGLE_MAPS_MCP_COMMAND", ["npx", "-y", "@modelcontextprotocol/server-google-maps"])
+    return StdioServerParameters(command=command[0], args=command[1:], env=env)
+
+
+def airbnb_server_params() -> StdioServerParameters:
+    command = _command("AIRBNB_MCP_COMMAND", ["npx", "-y", "@openbnb/mcp-server-airbnb", "--ignore-robots-txt"])
+    return StdioServerParameters(command=command[0], args=command[1:], env={**os.environ})
+
+
+SERVER_PARAMS = {
+    GOOGLE_MAPS_SERVER: google_maps_server_params,
+    AIRBNB_SERVER: airbnb_server_params,
+}
+
+
+class _PooledServer:
+    """
+    One long-lived MCP server process and its client session.
+
+    The stdio transport is built on anyio task groups, which have to be entered and
+    exited from the same task, so every server is owned by a dedicated task that
+    opens the `MCPTools` context, waits until it is asked to stop and closes it again.
+    """
+
+    def __init__(self, name: str, server_params: StdioServerParameters, server_name: str):
+        self.name = name
+        self.server_params = server_params
+        # Server type the pool serves, recorded calls are keyed by it and not by the pool member
+        self.server_name = server_name
+        self.tools: Optional[MCPTools] = None
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._error: Optional[BaseException] = None
+        # Callers using the session right now, and a lock so only one of them restarts the server
+        self.users = 0
+        self.restart_lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        self._ready.clear()
+        self._stop.clear()
+        self._error = None
+        self._task = asyncio.create_task(self._own(), name=f"mcp-{self.name}")
+        await asyncio.wait_for(self._ready.wait(), timeout=START_TIMEOUT_SECONDS)
+        if self._error is not None:
+            raise RuntimeError(f"MCP server '{self.name}' failed to start: {self._error!r}")
+
+    async def _own(self) -> None:
+        try:
+            async with MCPTools(server_params=self.server_params) as tools:
+                record_mcp_calls(self.server_name, tools.session)
+                time_mcp_calls(tools.session)
+                self.tools = tools
+                self._ready.set()
+                await self._stop.wait()
+        except Exception as e:
+            self._error = e
+        finally:
+            self.tools = None
+            self._ready.set()
+
+    @property
+    def alive(self) -> bool:
+        return self.tools is not None and self._task is not None and not self._task.done()
+
+    async def ping(self) -> bool:
+        if not self.alive or self.tools.session is None:  # type: ignore[union-attr]
+            return False
+        try:
+            await asyncio.wait_for(self.tools.session.send_ping(), timeout=PING_TIMEOUT_SECONDS)  # type: ignore[union-attr]
+            return True
+        except Exception:
+            return False
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stop.set()
+        try:
+            await asyncio.wait_for(self._task, timeout=PING_TIMEOUT_SECONDS)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            self._task.cancel()
+        except Exception:
+            pass
+        self._task = None
+
+    async def restart(self) -> None:
+        await self.stop()
+        await self.start()
+
+
+class MCPServerPool:
+    """
+    A fixed-size pool of warm MCP server sessions for a single server type.
+
+    MCP sessions multiplex requests, so sessions are shared: every caller gets the
+    server with the fewest users and never waits for another request to finish.
+    Unused sessions are pinged periodically and any server that crashed or stopped
+    answering is restarted before it is handed out again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        server_params: StdioServerParameters,
+        size: int = POOL_SIZE,
+        health_check_interval: float = HEALTH_CHECK_INTERVAL_SECONDS,
+    ):
+        self.name = name
+        self.server_params = server_params
+        self.size = size
+        self.health_check_interval = health_check_interval
+        self._servers: List[_PooledServer] = []
+        self._health_task: Optional[asyncio.Task] = None
+        self._started = False
+
+    async def start(self) -> None:
+        if self._started:
+            return
+        self._servers = [_PooledServer(f"{self.name}-{i}", self.server_params, self.name) for i in range(self.size)]
+        results = await asyncio.gather(*(server.start() for server in self._servers), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                print(f"MCP pool '{self.name}': {result}")
+        self._health_task = asyncio.create_task(self._health_loop(), name=f"mcp-pool-{self.name}-health")
+        self._started = True
+
+    async def stop(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        await asyncio.gather(*(server.stop() for server in self._servers), return_exceptions=True)
+        self._servers = []
+        self._started = False
+
+    @property
+    def started(self) -> bool:
+        return self._started
+
+    def _least_used(self) -> _PooledServer:
+        # Healthy servers first, a dead one is only picked (and restarted) when all of them are down
+        return min(self._servers, key=lambda server: (not server.alive, server.users))
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[MCPTools]:
+        """A healthy MCP session for the duration of the block, shared with other callers."""
+        server = self._least_used()
+        server.users += 1
+        try:
+            if not server.alive:
+                await self._restart(server)
+            yield server.tools  # type: ignore[misc]
+        except Exception:
+            # The server may have died under the call, start a clean process unless it still answers
+            await self._restart_quietly(server, force=True)
+            raise
+        finally:
+            server.users -= 1
+
+    async def _restart(self, server: _PooledServer, force: bool = False) -> None:
+        """
+        Restart a server that is not running, or with `force` one that does not answer a ping.
+
+        A crashed server process does not end the task owning its session, so `alive`
+        stays true and only a ping tells a dead session from a healthy one.
+        """
+        async with server.restart_lock:
+            # Another caller may have restarted it while this one waited for the lock
+            if not server.alive or (force and not await server.ping()):
+                await server.restart()
+
+    async def _restart_quietly(self, server: _PooledServer, force: bool = False) -> None:
+        try:
+            await self._restart(server, force)
+        except Exception as e:
+            print(f"MCP pool '{self.name}': failed to restart {server.name}: {e!r}")
+
+    async def check(self) -> None:
+        """Ping the unused servers and restart the ones that crashed or stopped answering."""
+        # A slow tool call in flight is not a failed ping, servers in use are left alone
+        for server in self._servers:
+            if server.users == 0:
+                await self._restart_quietly(server, force=True)
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            await self.check()
+
+
+_pools: Dict[str, MCPServerPool] = {}
+# Pools still starting in the background, sessions wait for them instead of spawning a server
+_warmup: Optional["asyncio.Task[None]"] = None
+
+
+async def start_pools(names: Optional[List[str]] = None, wait: bool = True) -> None:
+    """
+    Start warm MCP server pools, called from the API lifespan.
+
+    With `wait=False` the servers start in the background, so the API can take requests
+    while npx is still booting them; sessions requested meanwhile wait for the pools.
+    """
+    global _warmup
+    for name in names or list(SERVER_PARAMS):
+        if name not in _pools:
+            _pools[name] = MCPServerPool(name, SERVER_PARAMS[name]())
+
+    async def start() -> None:
+        await asyncio.gather(*(pool.start() for pool in _pools.values()))
+
+    _warmup = asyncio.create_task(start(), name="mcp-pools-warmup")
+    if wait:
+        await _warmup
+
+
+async def stop_pools() -> None:
+    if _warmup is not None and not _warmup.done():
+        _warmup.cancel()
+        await asyncio.gather(_warmup, return_exceptions=True)
+    await asyncio.gather(*(pool.stop() for pool in _pools.values()), return_exceptions=True)
+    _pools.clear()
+
+
+@asynccontextmanager
+async def mcp_session(name: str) -> AsyncIterator[MCPTools]:
+    """
+    Get an MCP session for the given server.
+
+    Uses the warm pool when the API started one, otherwise falls back to spawning
+    a dedicated server for the duration of the block (scripts, notebooks).
+    """
+    if _warmup is not None and not _warmup.done():
+        await asyncio.shield(_warmup)
+    pool = _pools.get(name)
+    if pool is not None and pool.started:
+        async with pool.session() as tools:
+            yield tools
+    else:
+        async with MCPTools(server_params=SERVER_PARAMS[name]()) as tools:
+            record_mcp_calls(name, tools.session)
+            time_mcp_calls(tools.session)
+            yield tools
@@ -0,0 +1,242 @@
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Tuple, Union
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from starlette.routing import Match
+
+# From tens of milliseconds for cached tool calls up to multi-minute team runs
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+
+class SharedEndpoint:
+    """Endpoint of work done for several callers, switched to the caller that needs it most."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+# Endpoint (route template, or "job:<kind>" for background jobs) the current work is done for,
+# model tokens and cost are attributed to it
+current_endpoint: contextvars.ContextVar[Union[str, SharedEndpoint]] = contextvars.ContextVar("metrics_endpoint", default="none")
+
+
+def endpoint_name() -> str:
+    name = current_endpoint.get()
+    return name.name if isinstance(name, SharedEndpoint) else name
+
+
+ENDPOINT_SECONDS = Histogram(
+    "trip_planner_endpoint_duration_seconds",
+    "Latency of API endpoints, up to the last byte of the response",
+    ["endpoint", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+JOB_SECONDS = Histogram(
+    "trip_planner_job_duration_seconds",
+    "Run time of background jobs, without the time spent queued",
+    ["kind", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+AGENT_RUN_SECONDS = Histogram(
+    "trip_planner_agent_run_duration_seconds",
+    "Latency of agent and team runs",
+    ["agent", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+TOOL_CALL_SECONDS = Histogram(
+    "trip_planner_tool_call_duration_seconds",
+    "Latency of tool calls made by agents, including MCP tools",
+    ["tool", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+TOOL_OUTPUT_BYTES = Counter(
+    "trip_planner_tool_output_bytes",
+    "Bytes of compacted tool outputs before and after compaction, the model gets the compacted ones",
+    ["tool", "stage"],
+)
+SCRAPE_SECONDS = Histogram(
+    "trip_planner_scrape_duration_seconds",
+    "Latency of scraping a search result page, including text extraction",
+    ["status"],
+    buckets=LATENCY_BUCKETS,
+)
+SUMMARIZE_SECONDS = Histogram(
+    "trip_planner_summarize_duration_seconds",
+    "Latency of summarizing a scraped page",
+    ["status"],
+    buckets=LATENCY_BUCKETS,
+)
+IMAGE_GENERATION_SECONDS = Histogram(
+    "trip_planner_image_generation_duration_seconds",
+    "Latency of image generation API calls",
+    ["status"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_CALL_SECONDS = Histogram(
+    "trip_planner_llm_call_duration_seconds",
+    "Latency of model completions sent to the provider, cache hits are not included",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "trip_planner_llm_tokens",
+    "Tokens of model completions sent to the provider",
+    ["model", "endpoint", "kind"],
+)
+LLM_COST = Counter(
+    "trip_planner_llm_cost_usd",
+    "Estimated cost of model completions from litellm's price list, 0 for models it has no price for",
+    ["model", "endpoint"],
+)
+LLM_QUEUE_DEPTH = Gauge(
+    "trip_planner_llm_queue_depth",
+    "Model calls waiting for the rate limiter",
+    ["model", "priority"],
+    multiprocess_mode="livesum",
+)
+LLM_QUEUE_WAIT_SECONDS = Histogram(
+    "trip_planner_llm_queue_wait_seconds",
+    "Time model calls waited for the rate limiter",
+    ["model", "priority"],
+    buckets=LATENCY_BUCKETS,
+)
+CACHE_LOOKUPS = Counter(
+    "trip_planner_cache_lookups",
+    "Cache lookups by result, a hit in the memory or the disk tier or a miss",
+    ["cache", "result"],
+)
+LLM_RATE_LIMITED = Counter(
+    "trip_planner_llm_rate_limited",
+    "Model calls the provider answered with 429",
+    ["model"],
+)
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels: str) -> Iterator[None]:
+    """Observe the duration of the block with a status label of "ok", "error" or "cancelled"."""
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except Exception:
+        status = "error"
+        raise
+    except BaseException:
+        status = "cancelled"
+        raise
+    finally:
+        histogram.labels(status=status, **labels).observe(time.perf_counter() - started)
+
+
+@contextmanager
+def endpoint(name: Union[str, SharedEndpoint]) -> Iterator[None]:
+    """Attribute model usage of the block to `name`."""
+    token = current_endpoint.set(name)
+    try:
+        yield
+    finally:
+        current_endpoint.reset(token)
+
+
+async def time_tool_call(function_name: str, function_call: Callable, arguments: Dict[str, Any]) -> Any:
+    """
+    agno tool hook that records the latency of every tool call.
+
+    Pass it first in `tool_hooks` so the time of the other hooks is included.
+    """
+    with timed(TOOL_CALL_SECONDS, tool=function_name):
+        return await function_call(**arguments)
+
+
+def time_mcp_calls(session: Any) -> None:
+    """
+    Record the latency of the tool calls of an MCP client session, made by agents or directly.
+
+    MCP agents are not given `time_tool_call`, so their calls are not counted twice.
+    """
+    call_tool = session.call_tool
+
+    async def timed_call_tool(name: str, *args: Any, **kwargs: Any) -> Any:
+        with timed(TOOL_CALL_SECONDS, tool=name):
+            return await call_tool(name, *args, **kwargs)
+
+    session.call_tool = timed_call_tool
+
+
+def _cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    # Only imported once a model was called, litellm is slow to import
+    import litellm
+
+    try:
+        prompt_cost, completion_cost = litellm.cost_per_token(
+            model=model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens
+        )
+    except Exception:
+        return 0.0
+    return prompt_cost + completion_cost
+
+
+def record_usage(model: str, usage: Any) -> None:
+    """Count the tokens and estimated cost of a completion, `usage` as reported by OpenAI or litellm."""
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    name = endpoint_name()
+    LLM_TOKENS.labels(model=model, endpoint=name, kind="prompt").inc(prompt_tokens)
+    LLM_TOKENS.labels(model=model, endpoint=name, kind="completion").inc(completion_tokens)
+    LLM_COST.labels(model=model, endpoint=name).inc(_cost(model, prompt_tokens, completion_tokens))
+
+
+def render() -> Tuple[bytes, str]:
+    """The metrics in the Prometheus text format and its content type."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Several workers, each writes its samples to the shared directory
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def _route_path(scope: Dict[str, Any]) -> str:
+    # Route templates keep the label set bounded, e.g. /jobs/{job_id} instead of every job id
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+class EndpointMetricsMiddleware:
+    """
+    ASGI middleware that records endpoint latency and attributes model usage to the endpoint.
+
+    Streaming responses are timed until their last chunk is sent.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        name = _route_path(scope)
+        status = 500
+
+        async def send_with_status(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            with endpoint(name):
+                await self.app(scope, receive, send_with_status)
+        finally:
+            ENDPOINT_SECONDS.labels(endpoint=name, method=scope["method"], status=str(status)).observe(time.perf_counter() - started)
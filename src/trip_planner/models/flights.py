@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseModel, Field
 
 
@@ -12,6 +14,8 @@ class Flight(BaseModel):
     price: str = Field(..., description="Price of the flight")
     aircraft: str = Field(..., description="Aircraft of the flight")
     booking_link: str = Field(..., description="Booking link of the flight")
+    booking_token: Optional[str] = Field(None, description="SerpAPI token to fetch booking options of the flight")
+    stops: Optional[int] = Field(None, description="Number of stops")
 
 
 class FlightsPlan(BaseModel):
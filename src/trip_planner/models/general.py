@@ -10,7 +10,7 @@ from .itinerary import Itinerary
 
 class TravelerInput(BaseModel):
     country: str = Field(..., description="Country of the trip")
-    cities: list[str] = Field(..., description="Cities of the trip")
+    cities: list[str] = Field(..., min_length=1, description="Cities of the trip")
     arrival_date: str = Field(..., description="Arrival date of the trip in YYYY-MM-DD format")
     departure_date: str = Field(..., description="Departure date of the trip in YYYY-MM-DD format")
     age: int = Field(..., description="Age of the traveler")
@@ -28,6 +28,9 @@ class TravelerInput(BaseModel):
             
             if arrival > departure:
                 raise ValueError("Arrival date cannot be after departure date")
+            days = (departure - arrival).days + 1
+            if len(self.cities) > days:
+                raise ValueError(f"A trip of {days} days cannot visit {len(self.cities)} cities")
         except ValueError as e:
             if "time data" in str(e):
                 raise ValueError("Invalid date format. Use YYYY-MM-DD")
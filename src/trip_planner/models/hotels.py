@@ -3,7 +3,6 @@ from typing import Any, Type, Optional, List
 
 from agno.tools import tool
 from pydantic import BaseModel, Field
-from serpapi import GoogleSearch
 
 from enum import Enum
 
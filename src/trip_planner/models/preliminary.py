@@ -0,0 +1,72 @@
+from datetime import date
+from textwrap import dedent
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, Field
+
+
+class UserPreference(BaseModel):
+    user_id: str
+    user_name: str
+    raw_preferences: List[str]
+
+
+class PreliminaryPlanInputArgs(BaseModel):
+    """Example:
+{    
+    "destination": "Paris",
+    "consesnsus_dates": ["2025-08-01", "2025-08-02", "2025-08-03", "2025-08-04", "2025-08-05", "2025-08-06"],
+    "grouped_preferences": [
+        {
+            "user_id": "1234",
+            "user_name": "Jenya",
+            "raw_preferences": ["museums", "restaurants"]
+        },
+        {
+            "user_id": "1235",
+            "user_name": "Illia",
+            "preferred_length_days": 3,
+            "raw_preferences": ["parks", "restaurants", "landmarks"]
+        }
+    ]
+}
+"""
+    destination: str
+    budget: Optional[str] = None
+    preferred_length_days: Optional[int] = None
+    consesnsus_dates: List[date]
+    grouped_preferences: List[UserPreference]
+
+
+class Activity(BaseModel):
+    name: str
+    description: str
+    location: str
+    preliminary_length: Optional[str] = Field(None, description="Length of time this activity will take. For example, '3 hours'")
+    cost: Optional[int] = None
+
+
+class DayPlan(BaseModel):
+    acitivites: List[Activity] = Field(
+        ...,
+        description=dedent("""
+            List of things to do or places to visit; not limited to any particular activity type;
+            Could be restaurants, museums, river boats, landmarks to visit, etc...
+        """)
+    )
+
+# Define response models
+class PreliminaryPlan(BaseModel):
+    duration_days: int
+    start_date: date
+    end_date: date
+    name: str
+    summary: str = Field(..., description="Must accurately, but consicely desribe and summarize planned activities")
+    image_id: Optional[str] = Field(None, description="Internal field, skip or return null")
+    image_url: Optional[str] = Field(None, description="Internal field, skip or return null")
+    image_status: Optional[Literal["ready", "pending", "failed"]] = Field(None, description="Internal field, skip or return null")
+    day_plans: List[DayPlan] = Field(..., description="Activies per day")
+
+
+class ProposedPlans(BaseModel):
+    plans: List[PreliminaryPlan]
@@ -1,100 +1,64 @@
-from datetime import date
+import asyncio
+import os
 from textwrap import dedent
-from typing import List, Optional
+from typing import List, Set
 
 from agno.agent import Agent
 from agno.models.openai.chat import OpenAIChat
 from agno.tools.reasoning import ReasoningTools
-from pydantic import BaseModel, Field
-from agno.models.litellm import LiteLLM
-
-from trip_planner.tools.generate_image import generate_image
-
-# from phoenix.otel import register
-
-# # configure the Phoenix tracer
-# tracer_provider = register(
-#     endpoint="http://localhost:6006/v1/traces",
-#     project_name="agno_trip_planner",
-#     auto_instrument=True
-# )
-
-
-llm = LiteLLM(
-    id="groq/llama-3.3-70b-versatile",
-    request_params={
-        "num_retries": 3,
-    }
-)
-
-class UserPreference(BaseModel):
-    user_id: str
-    user_name: str
-    raw_preferences: List[str]
-
-
-class PreliminaryPlanInputArgs(BaseModel):
-    """Example:
-{    
-    "destination": "Paris",
-    "consesnsus_dates": ["2025-08-01", "2025-08-02", "2025-08-03", "2025-08-04", "2025-08-05", "2025-08-06"],
-    "grouped_preferences": [
-        {
-            "user_id": "1234",
-            "user_name": "Jenya",
-            "raw_preferences": ["museums", "restaurants"]
-        },
-        {
-            "user_id": "1235",
-            "user_name": "Illia",
-            "preferred_length_days": 3,
-            "raw_preferences": ["parks", "restaurants", "landmarks"]
-        }
-    ]
-}
-"""
-    destination: str
-    budget: Optional[str] = None
-    preferred_length_days: Optional[int] = None
-    consesnsus_dates: List[date]
-    grouped_preferences: List[UserPreference]
-
-
-class Activity(BaseModel):
-    name: str
-    description: str
-    location: str
-    preliminary_length: Optional[str] = Field(None, description="Length of time this activity will take. For example, '3 hours'")
-    cost: Optional[int] = None
-
-
-class DayPlan(BaseModel):
-    acitivites: List[Activity] = Field(
-        ...,
-        description=dedent("""
-            List of things to do or places to visit; not limited to any particular activity type;
-            Could be restaurants, museums, river boats, landmarks to visit, etc...
-        """)
-    )
 
-# Define response models
-class PreliminaryPlan(BaseModel):
-    duration_days: int
-    start_date: date
-    end_date: date
-    name: str
-    summary: str = Field(..., description="Must accurately, but consicely desribe and summarize planned activities")
-    base64_image_string: Optional[str] = Field(None, description="Internal field, skip or return null")
-    day_plans: List[DayPlan] = Field(..., description="Activies per day")
+from trip_planner.image_store import image_url
+from trip_planner.llm_cache import CachedLiteLLM
+from trip_planner.models.preliminary import PreliminaryPlan, PreliminaryPlanInputArgs, ProposedPlans
+from trip_planner.metrics import AGENT_RUN_SECONDS, timed
+from trip_planner.research import stored_research
+from trip_planner.tools.generate_image import generate_image, image_generation_id
+
+llm = CachedLiteLLM(id="groq/llama-3.3-70b-versatile")
+
+# How long /preliminary_plan waits for images before returning plans with pending images
+IMAGES_DEADLINE_SECONDS = float(os.getenv("PRELIMINARY_PLAN_IMAGES_DEADLINE_SECONDS", "15"))
+
+# Image generations that outlived their request, kept referenced so they can finish and fill the cache
+_background_images: Set[asyncio.Task] = set()
+
+def image_prompt_for_plan(plan: PreliminaryPlan) -> str:
+    return f"A beautiful stok background image for a trip called '{plan.name}' with the following summary: {plan.summary}"
+
+
+async def generate_image_for_plan(plan: PreliminaryPlan) -> str:
+    return await generate_image(image_prompt_for_plan(plan))
+
 
+async def add_images_to_plans(plans: List[PreliminaryPlan], deadline: float = IMAGES_DEADLINE_SECONDS) -> None:
+    """
+    Generate images for all plans concurrently and attach the ones that finish before the deadline.
 
-class ProposedPlans(BaseModel):
-    plans: List[PreliminaryPlan]
+    Plans whose image is still generating are marked "pending" and already carry the image URL;
+    the generation keeps running in the background and the URL serves the image once it is stored.
+    """
+    tasks = {asyncio.create_task(generate_image_for_plan(plan)): plan for plan in plans}
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
 
+    for task in done:
+        plan = tasks[task]
+        if task.exception() is None:
+            plan.image_id = task.result()
+            plan.image_url = image_url(plan.image_id)
+            plan.image_status = "ready"
+        else:
+            print(f"Image generation failed for plan '{plan.name}': {task.exception()!r}")
+            plan.image_status = "failed"
 
-def generate_image_for_plan(plan: PreliminaryPlan):
-    prompt = f"A beautiful stok background image for a trip called '{plan.name}' with the following summary: {plan.summary}"
-    return generate_image(prompt)
+    for task in pending:
+        plan = tasks[task]
+        plan.image_id = image_generation_id(image_prompt_for_plan(plan))
+        plan.image_url = image_url(plan.image_id)
+        plan.image_status = "pending"
+        _background_images.add(task)
+        task.add_done_callback(_background_images.discard)
+        # Retrieve the exception, if any, so a late failure does not get logged as never retrieved
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
 
 
 async def run_agent(input_parameters: PreliminaryPlanInputArgs, reasoning: bool = False, generate_images: bool = True) -> ProposedPlans:
@@ -120,9 +84,18 @@ async def run_agent(input_parameters: PreliminaryPlanInputArgs, reasoning: bool
     )
 
     query = f"Plan a trip with parameters: {input_parameters.model_dump_json()}"
-    result = await agent.arun(query)
+    # Only research other trips already did, preliminary plans should stay fast
+    dates = sorted(input_parameters.consesnsus_dates)
+    research = ""
+    if dates:
+        research = await asyncio.to_thread(
+            stored_research, input_parameters.destination, dates[0].isoformat(), dates[-1].isoformat()
+        )
+    if research:
+        query += f"\n\nWhat is known about the destination:\n{research}"
+    with timed(AGENT_RUN_SECONDS, agent=agent.name):
+        result = await agent.arun(query)
     proposition: ProposedPlans = result.content # type: ignore
-    if generate_images:
-        for plan in proposition.plans:
-            plan.base64_image_string = generate_image_for_plan(plan)
+    if generate_images and proposition.plans:
+        await add_images_to_plans(proposition.plans)
     return proposition
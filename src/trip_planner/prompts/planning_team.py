@@ -36,4 +36,40 @@ INSTRUCTIONS = [
         - Backup options for weather-dependent activities
         - Each day in the trip should be planned
     """),
-]
\ No newline at end of file
+]
+
+DAY_ALLOCATION_INSTRUCTIONS = dedent("""\
+    You split the nights of a trip across its cities.
+    Give every city at least one night when there are enough nights, and more nights to cities with
+    more attractions, events during the travel period and activities matching the traveler's age and preferences.
+    Keep the cities in the given order. The nights must add up exactly to the given total.
+    Also give the whole trip a name, something funny.
+""")
+
+
+CITY_INSTRUCTIONS = [
+    dedent("""
+           Create a detailed, personalized travel plan for one city of a longer trip by researching activities,
+           events, and attractions in the city during the given dates.
+    """),
+
+    dedent("""\
+        Task description:
+        ### 1. Research Phase
+        - Gather information about:
+           1. Current events and festivals during the stay
+           2. Popular attractions and landmarks
+           3. Age-appropriate activities and entertainment
+           4. Local experiences and cultural highlights
+
+        If no information is found for the event than skip this step.
+
+        ### 2. Planning Phase
+        - The dates of the stay are fixed, do not change them
+        - Develop a day-by-day schedule for exactly the dates you are given, including:
+        - Recommended activities with timing
+        - Must-see attractions prioritized by relevance
+        - Backup options for weather-dependent activities
+        - Each of the given days should be planned
+    """),
+]
@@ -0,0 +1,202 @@
+import asyncio
+import json
+import os
+from textwrap import dedent
+from typing import Dict, List, Optional, Tuple
+
+from agno.agent import Agent
+from pydantic import BaseModel, Field
+
+from trip_planner.itinerary_crew import llm, run_team
+from trip_planner.llm_cache import CachedOpenAIChat
+from trip_planner.metrics import AGENT_RUN_SECONDS, time_tool_call, timed
+from trip_planner.models.general import TravelerInput
+from trip_planner.models.itinerary import DayPlan, Itinerary
+from trip_planner.research import research_destination
+from trip_planner.tools.internet_search import get_top_internet_search_results
+
+# "days" re-plans only the days the feedback is about, "full" reruns the whole planning team
+REFINEMENT_MODE = os.getenv("REFINEMENT_MODE", "days")
+MAX_CONCURRENT_DAY_REPLANS = int(os.getenv("REFINEMENT_MAX_CONCURRENT_DAYS", "4"))
+
+
+class DayChange(BaseModel):
+    city: str = Field(..., description="City of the day exactly as in the outline")
+    date: str = Field(..., description="Date of the day exactly as in the outline, YYYY-MM-DD")
+    instruction: str = Field(..., description="What to change on this day according to the feedback")
+
+
+class RefinementScope(BaseModel):
+    replan_all: bool = Field(
+        ...,
+        description="True if the feedback changes the structure of the trip: cities, their order or dates, number of days",
+    )
+    days: List[DayChange] = Field(..., description="Days whose plan has to change, empty if replan_all is true")
+
+
+def itinerary_outline(itinerary: Itinerary) -> str:
+    """Numbered days with their activities and restaurants, enough to tell which days feedback is about."""
+    lines = []
+    number = 1
+    for city_plan in itinerary.city_plans:
+        for day_plan in city_plan.day_plans:
+            activities = ", ".join(activity.name for activity in day_plan.activities) or "none"
+            restaurants = ", ".join(restaurant.name for restaurant in day_plan.restaurants or []) or "none"
+            lines.append(f"Day {number} ({day_plan.date}, {city_plan.city}): activities: {activities}; restaurants: {restaurants}")
+            number += 1
+    return "\n".join(lines)
+
+
+async def refine_itinerary(traveler_input: TravelerInput, itinerary: Itinerary, user_feedback: str) -> Itinerary:
+    """
+    Apply user feedback to an itinerary, re-planning only the days it is about.
+
+    A small model call maps the feedback to days; each affected day is re-planned
+    concurrently and every other day is kept as it is, as is a day whose re-plan failed.
+    Feedback that changes no day returns the itinerary unchanged, feedback that changes
+    the trip itself (cities, dates, length) goes through the full planning team instead.
+    """
+    if REFINEMENT_MODE == "full":
+        return await refine_with_team(traveler_input, itinerary, user_feedback)
+
+    scope = await locate_changes(itinerary, user_feedback)
+    if scope is not None and not scope.replan_all and not scope.days:
+        print("Feedback does not ask to change any day, keeping the itinerary")
+        return itinerary
+    targets = _resolve_targets(itinerary, scope) if scope is not None and not scope.replan_all else None
+    if not targets:
+        print("Refinement is not limited to known days, re-planning the whole itinerary")
+        return await refine_with_team(traveler_input, itinerary, user_feedback)
+
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_DAY_REPLANS)
+
+    async def replan(position: Tuple[int, int], instruction: str) -> DayPlan:
+        async with semaphore:
+            return await replan_day(traveler_input, itinerary, position, instruction, user_feedback)
+
+    results = await asyncio.gather(
+        *(replan(position, instruction) for position, instruction in targets.items()), return_exceptions=True
+    )
+    failed = [result for result in results if isinstance(result, BaseException)]
+    if len(failed) == len(results):
+        raise failed[0]
+    replanned: Dict[Tuple[int, int], DayPlan] = {}
+    for position, result in zip(targets, results):
+        if isinstance(result, asyncio.CancelledError):
+            raise result
+        if isinstance(result, BaseException):
+            city_index, day_index = position
+            city_plan = itinerary.city_plans[city_index]
+            print(f"Re-planning {city_plan.city} on {city_plan.day_plans[day_index].date} failed, keeping the day: {result!r}")
+            continue
+        replanned[position] = result
+    city_plans = []
+    for city_index, city_plan in enumerate(itinerary.city_plans):
+        if not any(position[0] == city_index for position in replanned):
+            city_plans.append(city_plan)
+            continue
+        day_plans = [
+            replanned.get((city_index, day_index), day_plan)
+            for day_index, day_plan in enumerate(city_plan.day_plans)
+        ]
+        city_plans.append(city_plan.model_copy(update={"day_plans": day_plans}))
+    return itinerary.model_copy(update={"city_plans": city_plans})
+
+
+async def locate_changes(itinerary: Itinerary, user_feedback: str) -> Optional[RefinementScope]:
+    agent = Agent(
+        name="Refinement Scope",
+        model=CachedOpenAIChat("gpt-4.1-mini"),
+        instructions=dedent("""\
+            You are given the outline of a travel itinerary and feedback from the traveler.
+            Decide which days the feedback asks to change and what to change on each of them.
+            Only list days that really have to change. If the feedback changes the cities, their order,
+            the dates or the number of days, set replan_all to true.\
+        """),
+        response_model=RefinementScope,
+    )
+    try:
+        with timed(AGENT_RUN_SECONDS, agent=agent.name):
+            response = await agent.arun(f"Itinerary:\n{itinerary_outline(itinerary)}\n\nFeedback:\n{user_feedback}")
+    except Exception as e:
+        print(f"Could not locate the days to refine: {e!r}")
+        return None
+    return response.content if isinstance(response.content, RefinementScope) else None
+
+
+def _resolve_targets(itinerary: Itinerary, scope: RefinementScope) -> Optional[Dict[Tuple[int, int], str]]:
+    """Positions (city index, day index) of the days in scope, None if any of them is not in the itinerary."""
+    positions = {
+        (city_plan.city.casefold(), day_plan.date): (city_index, day_index)
+        for city_index, city_plan in enumerate(itinerary.city_plans)
+        for day_index, day_plan in enumerate(city_plan.day_plans)
+    }
+    targets: Dict[Tuple[int, int], str] = {}
+    for change in scope.days:
+        position = positions.get((change.city.casefold(), change.date.strip()[:10]))
+        if position is None:
+            return None
+        targets[position] = f"{targets[position]}\n{change.instruction}" if position in targets else change.instruction
+    return targets
+
+
+async def replan_day(
+    traveler_input: TravelerInput,
+    itinerary: Itinerary,
+    position: Tuple[int, int],
+    instruction: str,
+    user_feedback: str,
+) -> DayPlan:
+    city_index, day_index = position
+    city_plan = itinerary.city_plans[city_index]
+    day_plan = city_plan.day_plans[day_index]
+    # Activities planned on other days of the trip, so the new plan does not repeat them
+    planned_elsewhere = [
+        activity.name
+        for other_city_index, other_city in enumerate(itinerary.city_plans)
+        for other_day_index, other_day in enumerate(other_city.day_plans)
+        if (other_city_index, other_day_index) != position
+        for activity in other_day.activities
+    ]
+    agent = Agent(
+        name="Day Planner",
+        model=llm,
+        tools=[research_destination, get_top_internet_search_results],
+        tool_hooks=[time_tool_call],
+        instructions=dedent("""\
+            You re-plan one day of a travel itinerary according to the traveler's feedback.
+            Keep everything the feedback does not ask to change. If you need new activities or restaurants,
+            check research_destination first and search the web only for what it does not cover.
+            Do not plan activities that are already planned on other days.\
+        """),
+        add_datetime_to_instructions=True,
+        tool_call_limit=2,
+        response_model=DayPlan,
+    )
+    query = dedent(f"""\
+        City: {city_plan.city}, date: {day_plan.date}
+        Traveler: age {traveler_input.age}, preferences: {", ".join(traveler_input.preferences or []) or "none given"}
+        Current plan of the day: {day_plan.model_dump_json()}
+        Planned on other days: {json.dumps(planned_elsewhere)}
+        Change for this day: {instruction}
+        Full feedback: {user_feedback}
+    """)
+    with timed(AGENT_RUN_SECONDS, agent=agent.name):
+        response = await agent.arun(query)
+    if not isinstance(response.content, DayPlan):
+        raise ValueError(f"Could not re-plan {city_plan.city} on {day_plan.date}: {response.content}")
+    return response.content.model_copy(update={"date": day_plan.date})
+
+
+async def refine_with_team(traveler_input: TravelerInput, itinerary: Itinerary, user_feedback: str) -> Itinerary:
+    query = dedent(f"""\
+        Refine the itinerary with the following traveler input:
+        {traveler_input}
+
+        Itinerary:
+        {itinerary}
+
+        User feedback:
+        {user_feedback}
+    """)
+    return await run_team(query)
@@ -0,0 +1,210 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from datetime import date
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from agno.tools import tool
+
+from trip_planner.cache import TieredCache
+from trip_planner.llm_scheduler import BACKGROUND, llm_priority
+from trip_planner.singleflight import SingleFlight, canonical_key
+from trip_planner.tools.internet_search import get_top_internet_search_results
+
+RESEARCH_CACHE_MAX_BYTES = int(os.getenv("RESEARCH_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+# Stale findings are served for this fraction of their TTL past expiry while they are refreshed in the background
+RESEARCH_STALE_FACTOR = float(os.getenv("RESEARCH_STALE_FACTOR", "1"))
+
+
+@dataclass(frozen=True)
+class ResearchKind:
+    name: str
+    ttl: float
+    # "range" keys findings by the exact dates, "month" by the month of the first day, None ignores the dates
+    date_window: Optional[str]
+    query: str
+
+
+def _kind(name: str, ttl: float, date_window: Optional[str], query: str) -> ResearchKind:
+    ttl = float(os.getenv(f"RESEARCH_TTL_{name.upper()}_SECONDS", str(ttl)))
+    return ResearchKind(name=name, ttl=ttl, date_window=date_window, query=query)
+
+
+RESEARCH_KINDS: Dict[str, ResearchKind] = {
+    kind.name: kind
+    for kind in [
+        _kind("weather", 3 * 60 * 60, "range", "weather forecast for {city} from {start_date} to {end_date}"),
+        _kind("events", 24 * 60 * 60, "range", "events, concerts and festivals in {city} from {start_date} to {end_date}"),
+        _kind("attractions", 14 * 24 * 60 * 60, "month", "top attractions and things to do in {city} in {month}"),
+        _kind("restaurants", 30 * 24 * 60 * 60, None, "best local restaurants in {city}"),
+    ]
+}
+
+
+@dataclass
+class Findings:
+    text: str
+    researched_at: float
+    fresh_until: float
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.time() < self.fresh_until
+
+
+class ResearchStore:
+    """
+    Summarized destination research shared by every request.
+
+    Findings are keyed by (city, date window, kind), where the window depends on the kind:
+    weather and events are tied to the exact dates while restaurants are not tied to dates
+    at all. Each kind has its own TTL; expired findings are still served for a while
+    (stale-while-revalidate) and refreshed in the background, so popular destinations
+    are researched about once per TTL no matter how many trips are planned. The disk tier
+    evicts least recently used findings past RESEARCH_CACHE_MAX_BYTES.
+    """
+
+    def __init__(self, cache: Optional[TieredCache] = None):
+        self.cache = cache or TieredCache(
+            "research",
+            ttl=max(kind.ttl for kind in RESEARCH_KINDS.values()),
+            memory_entries=512,
+            disk_bytes=RESEARCH_CACHE_MAX_BYTES,
+        )
+        self._calls = SingleFlight()
+        self._refreshes: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def key(city: str, start_date: str, end_date: str, kind: ResearchKind) -> str:
+        if kind.date_window == "range":
+            window = f"{start_date}..{end_date}"
+        elif kind.date_window == "month":
+            window = start_date[:7]
+        else:
+            window = ""
+        return canonical_key("research", {"city": city, "window": window, "kind": kind.name})
+
+    def peek(self, city: str, start_date: str, end_date: str, kind_name: str) -> Optional[Findings]:
+        """Stored findings, fresh or stale, without researching anything."""
+        kind = RESEARCH_KINDS[kind_name]
+        entry = self.cache.get(self.key(city, start_date, end_date, kind))
+        return Findings(**entry) if entry is not None else None
+
+    async def get(
+        self,
+        city: str,
+        start_date: str,
+        end_date: str,
+        kind_name: str,
+        research: Optional[Callable[[str], Awaitable[str]]] = None,
+    ) -> Optional[Findings]:
+        """
+        Findings for a destination, researching them if none are stored.
+
+        Stale findings are returned right away and refreshed in the background. Concurrent
+        requests for the same missing findings share one research run.
+        """
+        kind = RESEARCH_KINDS[kind_name]
+        key = self.key(city, start_date, end_date, kind)
+        query = kind.query.format(city=city, start_date=start_date, end_date=end_date, month=_month_name(start_date))
+        research = research or _search
+        entry = await asyncio.to_thread(self.cache.get, key)
+        if entry is not None:
+            findings = Findings(**entry)
+            if not findings.is_fresh:
+                self._refresh_in_background(key, kind, query, research)
+            return findings
+        return await self._calls.do(key, lambda: self._research(key, kind, query, research))
+
+    async def _research(
+        self,
+        key: str,
+        kind: ResearchKind,
+        query: str,
+        research: Callable[[str], Awaitable[str]],
+    ) -> Optional[Findings]:
+        text = (await research(query)).strip()
+        if not text:
+            # Nothing found (or every site failed), try again next time instead of caching the gap
+            return None
+        now = time.time()
+        findings = Findings(text=text, researched_at=now, fresh_until=now + kind.ttl)
+        await asyncio.to_thread(
+            self.cache.set, key, findings.__dict__, kind.ttl * (1 + RESEARCH_STALE_FACTOR)
+        )
+        return findings
+
+    def _refresh_in_background(
+        self,
+        key: str,
+        kind: ResearchKind,
+        query: str,
+        research: Callable[[str], Awaitable[str]],
+    ) -> None:
+        if any(task.get_name() == key for task in self._refreshes):
+            return
+        # The task copies the context here, so its model calls queue behind the requests being served
+        with llm_priority(BACKGROUND):
+            task = asyncio.create_task(self._calls.do(key, lambda: self._research(key, kind, query, research)), name=key)
+        self._refreshes.add(task)
+        task.add_done_callback(self._refreshes.discard)
+        # A failed refresh keeps serving the stale findings, retrieve the exception so it is not reported as lost
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+def _month_name(day: str) -> str:
+    try:
+        return date.fromisoformat(day[:10]).strftime("%B")
+    except ValueError:
+        return day
+
+
+async def _search(query: str) -> str:
+    return await get_top_internet_search_results.entrypoint(query)  # type: ignore[union-attr]
+
+
+research_store = ResearchStore()
+
+
+def format_findings(city: str, kind: str, findings: Findings) -> str:
+    age_hours = (time.time() - findings.researched_at) / 3600
+    return f"{kind.capitalize()} in {city} (researched {age_hours:.0f}h ago):\n{findings.text}"
+
+
+@tool(
+    name="research_destination",
+    description="Get shared research about a destination: weather, events, attractions or restaurants",
+    show_result=True,
+)
+async def research_destination(city: str, start_date: str, end_date: str, kind: str) -> str:
+    """
+    Get summarized research about a destination for the travel dates.
+
+    Findings are shared across trips, so use this before searching the internet yourself.
+
+    Args:
+        city: The city to research
+        start_date: First day of the stay in YYYY-MM-DD format
+        end_date: Last day of the stay in YYYY-MM-DD format
+        kind: One of "weather", "events", "attractions", "restaurants"
+
+    Returns:
+        The findings, or a message that nothing was found
+    """
+    if kind not in RESEARCH_KINDS:
+        return f"Unknown kind '{kind}', use one of: {', '.join(RESEARCH_KINDS)}"
+    findings = await research_store.get(city, start_date, end_date, kind)
+    if findings is None:
+        return f"No {kind} found for {city}"
+    return format_findings(city, kind, findings)
+
+
+def stored_research(city: str, start_date: str, end_date: str, kinds: Optional[List[str]] = None) -> str:
+    """Whatever research is already stored for a destination, for flows that should not wait on new searches."""
+    sections = []
+    for kind in kinds or list(RESEARCH_KINDS):
+        findings = research_store.peek(city, start_date, end_date, kind)
+        if findings is not None:
+            sections.append(format_findings(city, kind, findings))
+    return "\n\n".join(sections)
@@ -0,0 +1,75 @@
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, Tuple, TypeVar
+
+from trip_planner.llm_scheduler import SharedPriority, current_priority, llm_priority
+from trip_planner.metrics import SharedEndpoint, endpoint, endpoint_name
+
+T = TypeVar("T")
+
+
+def canonical_key(kind: str, payload: Any) -> str:
+    """
+    Stable key for a request, strings are stripped and case-folded so trivial differences
+    in how clients spell the same city still coalesce.
+    """
+
+    def normalize(value: Any) -> Any:
+        if isinstance(value, str):
+            return " ".join(value.split()).casefold()
+        if isinstance(value, (list, tuple)):
+            return [normalize(item) for item in value]
+        if isinstance(value, dict):
+            return {key: normalize(item) for key, item in value.items()}
+        return value
+
+    serialized = json.dumps([kind, normalize(payload)], sort_keys=True, default=str)
+    return f"{kind}:{hashlib.sha256(serialized.encode('utf-8')).hexdigest()}"
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls into one.
+
+    The first caller for a key starts the call; everyone who asks for the same key while
+    it is running waits for that call and gets the same result or exception. The call is
+    shielded, so a caller that disconnects does not cancel it for the others.
+
+    The call runs for all of its callers, not the first one: its model calls take the
+    priority of the most urgent caller and their usage is attributed to that caller's
+    endpoint, so an interactive request that joins a background job's call is not
+    queued or billed as the job.
+    """
+
+    def __init__(self) -> None:
+        self._in_flight: Dict[str, Tuple["asyncio.Task[Any]", SharedPriority, SharedEndpoint]] = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        flight = self._in_flight.get(key)
+        if flight is None:
+            priority, name = SharedPriority(current_priority()), SharedEndpoint(endpoint_name())
+            # The task copies the context here, so its calls see the shared priority and endpoint
+            with llm_priority(priority), endpoint(name):
+                task = asyncio.ensure_future(fn())
+            self._in_flight[key] = (task, priority, name)
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            task, priority, name = flight
+            if priority.raise_to(current_priority()):
+                name.name = endpoint_name()
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: "asyncio.Task[Any]") -> None:
+        self._in_flight.pop(key, None)
+        # Every waiter may have gone away, retrieve the exception so it is not reported as lost
+        if not task.cancelled():
+            task.exception()
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+
+crew_calls = SingleFlight()
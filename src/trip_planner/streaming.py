@@ -0,0 +1,99 @@
+import json
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Tuple, Union
+
+PathPart = Union[str, int]
+
+
+@dataclass
+class _Frame:
+    kind: str  # "object" or "array"
+    start: int
+    key: Optional[str] = None
+    index: int = 0
+    expect_key: bool = True
+
+
+@dataclass
+class CompletedObject:
+    path: Tuple[PathPart, ...]
+    value: Any
+
+
+@dataclass
+class IncrementalJSONObjects:
+    """
+    Finds JSON objects that are complete while the surrounding document is still being streamed.
+
+    Feed it the text chunks of a streamed JSON response and it returns every object whose
+    path matches one of `patterns` as soon as its closing brace arrives. Patterns are tuples of
+    keys where "*" matches any array index, e.g. ("city_plans", "*") for each city plan.
+    """
+
+    patterns: List[Tuple[str, ...]]
+    _buffer: str = ""
+    _position: int = 0
+    _stack: List[_Frame] = field(default_factory=list)
+    _in_string: bool = False
+    _escaped: bool = False
+    _string_start: int = 0
+
+    def feed(self, chunk: str) -> List[CompletedObject]:
+        self._buffer += chunk
+        completed = []
+        while self._position < len(self._buffer):
+            char = self._buffer[self._position]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    self._end_string()
+            elif char == '"':
+                self._in_string = True
+                self._string_start = self._position
+            elif char in "{[":
+                self._stack.append(_Frame(kind="object" if char == "{" else "array", start=self._position))
+            elif char in "}]":
+                if self._stack:
+                    frame = self._stack.pop()
+                    if frame.kind == "object":
+                        path = self._path()
+                        if self._matches(path):
+                            try:
+                                value = json.loads(self._buffer[frame.start:self._position + 1])
+                                completed.append(CompletedObject(path=path, value=value))
+                            except json.JSONDecodeError:
+                                pass
+            elif char == ":":
+                if self._stack and self._stack[-1].kind == "object":
+                    self._stack[-1].expect_key = False
+            elif char == ",":
+                if self._stack:
+                    top = self._stack[-1]
+                    if top.kind == "object":
+                        top.expect_key = True
+                    else:
+                        top.index += 1
+            self._position += 1
+        return completed
+
+    def _end_string(self) -> None:
+        if self._stack and self._stack[-1].kind == "object" and self._stack[-1].expect_key:
+            self._stack[-1].key = json.loads(self._buffer[self._string_start:self._position + 1])
+
+    def _path(self) -> Tuple[PathPart, ...]:
+        path: List[PathPart] = []
+        for frame in self._stack:
+            path.append(frame.key if frame.kind == "object" else frame.index)  # type: ignore[arg-type]
+        return tuple(path)
+
+    def _matches(self, path: Tuple[PathPart, ...]) -> bool:
+        for pattern in self.patterns:
+            if len(pattern) != len(path):
+                continue
+            if all(part == "*" and isinstance(step, int) or part == step for part, step in zip(pattern, path)):
+                return True
+        return False
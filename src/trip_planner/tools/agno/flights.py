@@ -1,12 +1,27 @@
 import os
-from typing import Any, Type, Optional
+from datetime import date, datetime
+from typing import Any, Type, Optional, Union
 
 from agno.tools import tool
 from pydantic import BaseModel, Field
-from serpapi import GoogleSearch
 
 from enum import Enum
 
+from trip_planner.airports import resolve_airport_codes
+from trip_planner.cache import TieredCache
+from trip_planner.http_clients import sync_client
+
+FLIGHTS_CACHE_TTL_SECONDS = float(os.getenv("FLIGHTS_CACHE_TTL_SECONDS", str(6 * 60 * 60)))
+FLIGHTS_CACHE_MEMORY_ENTRIES = int(os.getenv("FLIGHTS_CACHE_MEMORY_ENTRIES", "512"))
+DEFAULT_CURRENCY = "USD"
+SERPAPI_URL = os.getenv("SERPAPI_URL", "https://serpapi.com/search")
+
+flights_cache = TieredCache(
+    "flights",
+    ttl=FLIGHTS_CACHE_TTL_SECONDS,
+    memory_entries=FLIGHTS_CACHE_MEMORY_ENTRIES,
+)
+
 class FlightType(Enum):
     ROUND_TRIP = "ROUND_TRIP"
     ONE_WAY = "ONE_WAY"
@@ -26,7 +41,7 @@ class Flight(BaseModel):
     name="FlightsSearchTool",
     description="Given a departure and arrival airport, departure and return date, returns available flights.",
     show_result=True,
-    cache_results=False
+    cache_results=False,  # search_flights has its own shared cache
 )
 def get_flights(
     departure_airport: str,
@@ -42,8 +57,8 @@ def get_flights(
     If you use ONE_WAY type of flight, then return_date MUST be None.
 
     Args:
-        departure_airport (str): The departure airport IATA code
-        arrival_airport (str): The arrival airport IATA code
+        departure_airport (str): The departure airport IATA code or city name
+        arrival_airport (str): The arrival airport IATA code or city name
         departure_date (str): The departure date
         return_date (str): The return date
         flight_type (FlightType): The type of flight
@@ -51,18 +66,99 @@ def get_flights(
     Returns:
         dict: The search results
     """
+    return search_flights(departure_airport, arrival_airport, departure_date, flight_type, return_date)
+
+
+def _normalize_date(value: Optional[Union[str, date]]) -> Optional[str]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, date):
+        return value.isoformat()
+    value = value.strip()
+    try:
+        return datetime.fromisoformat(value).date().isoformat()
+    except ValueError:
+        return value
+
+
+def flights_cache_key(
+    departure_airport: str,
+    arrival_airport: str,
+    departure_date: Union[str, date],
+    flight_type: FlightType,
+    return_date: Optional[Union[str, date]] = None,
+    currency: str = DEFAULT_CURRENCY,
+) -> str:
+    """Build a cache key that is stable across casing, whitespace and date formatting."""
+    flight_type = FlightType(flight_type)
+    parts = [
+        departure_airport.strip().upper(),
+        arrival_airport.strip().upper(),
+        _normalize_date(departure_date) or "",
+        # One way searches ignore the return date, do not let it split the cache
+        (_normalize_date(return_date) or "") if flight_type == FlightType.ROUND_TRIP else "",
+        flight_type.value,
+        currency.strip().upper(),
+    ]
+    return "|".join(parts)
+
+
+def search_flights(
+    departure_airport: str,
+    arrival_airport: str,
+    departure_date: Union[str, date],
+    flight_type: FlightType,
+    return_date: Optional[Union[str, date]] = None,
+    currency: str = DEFAULT_CURRENCY,
+) -> dict:
+    """
+    Search Google Flights through SerpAPI, serving repeated searches from the flights cache.
+
+    Airports can be given as IATA codes or city names, cities are resolved offline to
+    their busiest airports. Error responses, and cities the index does not know, are
+    returned to the caller as errors and never cached.
+    """
+    flight_type = FlightType(flight_type)
+    departure_codes = resolve_airport_codes(departure_airport)
+    arrival_codes = resolve_airport_codes(arrival_airport)
+    unknown = [airport for airport, codes in [(departure_airport, departure_codes), (arrival_airport, arrival_codes)] if not codes]
+    if unknown:
+        return {"error": f"Unknown airport {', '.join(unknown)}, search with its IATA code instead"}
+    departure_airport, arrival_airport = departure_codes, arrival_codes
+    key = flights_cache_key(departure_airport, arrival_airport, departure_date, flight_type, return_date, currency)
+    cached = flights_cache.get(key)
+    if cached is not None:
+        return cached
 
     params = {
             "engine": "google_flights",
             "type": flight_type.type_int,
-            "departure_id": departure_airport,
-            "arrival_id": arrival_airport,
-            "outbound_date": departure_date,
-            "return_date": return_date,
-            "currency": "USD",
+            "departure_id": departure_airport.strip().upper(),
+            "arrival_id": arrival_airport.strip().upper(),
+            "outbound_date": _normalize_date(departure_date),
+            "return_date": _normalize_date(return_date) if flight_type == FlightType.ROUND_TRIP else None,
+            "currency": currency.strip().upper(),
             "hl": "en",
             "api_key": os.getenv("SERPAPI_KEY")
         }
 
-    search_results = GoogleSearch(params)
-    return search_results.get_dict()
\ No newline at end of file
+    search_results = serpapi_search(params)
+    if "error" not in search_results:
+        flights_cache.set(key, search_results)
+    return search_results
+
+def serpapi_search(params: dict) -> dict:
+    """
+    Run a SerpAPI search over the shared connection pool.
+
+    Same result as `GoogleSearch(params).get_dict()`: the JSON response, including the
+    `error` SerpAPI returns with failed searches.
+    """
+    response = sync_client().get(
+        SERPAPI_URL,
+        params={"source": "python", "output": "json", **{key: value for key, value in params.items() if value is not None}},
+    )
+    try:
+        return response.json()
+    except ValueError:
+        return {"error": f"SerpAPI returned {response.status_code}: {response.text[:200]}"}
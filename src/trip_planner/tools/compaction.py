@@ -0,0 +1,150 @@
+import json
+import os
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+from trip_planner.metrics import TOOL_OUTPUT_BYTES
+from trip_planner.tools.flights_parser import parse_option
+
+FLIGHTS_TOOL_TOP_K = int(os.getenv("FLIGHTS_TOOL_TOP_K", "5"))
+# "price", "duration" or "stops", the other two break ties
+FLIGHTS_TOOL_SORT = os.getenv("FLIGHTS_TOOL_SORT", "price")
+HOTELS_TOOL_TOP_K = int(os.getenv("HOTELS_TOOL_TOP_K", "8"))
+# "relevance" keeps Airbnb's order, "price" or "rating" re-rank the listings
+HOTELS_TOOL_SORT = os.getenv("HOTELS_TOOL_SORT", "relevance")
+
+
+def _serialized(value: Any) -> str:
+    return value if isinstance(value, str) else json.dumps(value, default=str)
+
+
+def _number(text: Optional[str]) -> Optional[float]:
+    match = re.search(r"\d[\d,]*(?:\.\d+)?", text or "")
+    return float(match.group().replace(",", "")) if match else None
+
+
+def _flight_sort_key(option: Dict[str, Any], sort_by: str) -> tuple:
+    price = option.get("price") if option.get("price") is not None else float("inf")
+    duration = option.get("total_duration") or float("inf")
+    stops = len(option.get("flights") or [])
+    keys = {"price": price, "duration": duration, "stops": stops}
+    primary = keys.pop(sort_by, price)
+    return (primary, *keys.values())
+
+
+def compact_flights_result(
+    search_results: Dict[str, Any],
+    top_k: int = FLIGHTS_TOOL_TOP_K,
+    sort_by: str = FLIGHTS_TOOL_SORT,
+) -> Dict[str, Any]:
+    """
+    Project a google_flights response to the top-K options as Flight fields.
+
+    Price insights, airport metadata, carbon emissions, logos and the long tail of
+    alternatives are dropped. Error responses are returned unchanged.
+    """
+    if "error" in search_results:
+        return search_results
+    currency = (search_results.get("search_parameters") or {}).get("currency", "USD")
+    booking_link = (search_results.get("search_metadata") or {}).get("google_flights_url") or ""
+    options = (search_results.get("best_flights") or []) + (search_results.get("other_flights") or [])
+    options.sort(key=lambda option: _flight_sort_key(option, sort_by))
+    flights = []
+    for option in options:
+        flight = parse_option(option, currency, booking_link)
+        if flight is not None:
+            flights.append(flight.model_dump(exclude={"booking_token"}))
+        if len(flights) >= top_k:
+            break
+    return {"flights": flights, "total_options": len(options)}
+
+
+def _texts(value: Any) -> List[str]:
+    """Every string inside a nested JSON value, in order."""
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, dict):
+        return [text for item in value.values() for text in _texts(item)]
+    if isinstance(value, list):
+        return [text for item in value for text in _texts(item)]
+    return []
+
+
+def airbnb_listing(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Project one airbnb_search result to the fields of AirbnbListing plus the rating."""
+    listing = item.get("demandStayListing") or {}
+    name = ((listing.get("description") or {}).get("name") or {}).get("localizedStringWithTranslationPreference")
+    display_price = item.get("structuredDisplayPrice") or {}
+    price = (display_price.get("primaryLine") or {}).get("accessibilityLabel")
+    return {
+        "name": name or item.get("name"),
+        "description": ", ".join(dict.fromkeys(_texts(item.get("structuredContent")) + _texts(item.get("badges")))),
+        "price": price,
+        "rating": item.get("avgRatingA11yLabel"),
+        "url": item.get("url"),
+    }
+
+
+def rank_airbnb_listings(listings: List[Dict[str, Any]], sort_by: str = HOTELS_TOOL_SORT) -> List[Dict[str, Any]]:
+    if sort_by == "price":
+        return sorted(listings, key=lambda listing: _number(listing["price"]) or float("inf"))
+    if sort_by == "rating":
+        return sorted(listings, key=lambda listing: -(_number(listing["rating"]) or 0))
+    return listings
+
+
+def compact_airbnb_search_result(
+    text: str,
+    top_k: int = HOTELS_TOOL_TOP_K,
+    sort_by: str = HOTELS_TOOL_SORT,
+) -> str:
+    """
+    Project an airbnb_search response to the top-K listings as AirbnbListing fields.
+
+    Text that is not a JSON search response (errors, other server versions) is returned unchanged.
+    """
+    try:
+        payload = json.loads(text)
+    except ValueError:
+        return text
+    if not isinstance(payload, dict) or not isinstance(payload.get("searchResults"), list):
+        return text
+    listings = rank_airbnb_listings(
+        [airbnb_listing(item) for item in payload["searchResults"] if isinstance(item, dict)],
+        sort_by,
+    )
+    return json.dumps({"searchUrl": payload.get("searchUrl"), "listings": listings[:top_k]}, ensure_ascii=False)
+
+
+COMPACTORS: Dict[str, Callable[[Any], Any]] = {
+    "FlightsSearchTool": compact_flights_result,
+    "airbnb_search": compact_airbnb_search_result,
+}
+
+
+def compact(function_name: str, result: Any) -> Any:
+    """Compact the output of a known tool and record its size before and after."""
+    compactor = COMPACTORS.get(function_name)
+    if compactor is None:
+        return result
+    try:
+        compacted = compactor(result)
+    except Exception as e:
+        # An unexpected payload shape must never break the tool call, the model gets the original
+        print(f"Could not compact {function_name} output: {e!r}")
+        return result
+
+    TOOL_OUTPUT_BYTES.labels(tool=function_name, stage="original").inc(len(_serialized(result).encode()))
+    TOOL_OUTPUT_BYTES.labels(tool=function_name, stage="compacted").inc(len(_serialized(compacted).encode()))
+    return compacted
+
+
+async def compact_tool_output(function_name: str, function_call: Callable, arguments: Dict[str, Any]) -> Any:
+    """
+    agno tool hook that compacts tool results before they are sent to the model.
+
+    Pass it as `tool_hooks=[compact_tool_output]` to an Agent, it applies to function
+    tools and MCP toolkit functions alike.
+    """
+    result = await function_call(**arguments)
+    return compact(function_name, result)
@@ -1,9 +1,13 @@
+# Legacy crewai tool, superseded by tools/agno/flights.py. The API does not import it, keep it that way:
+# crewai_tools alone takes seconds to import.
 import os
 from typing import Any, Type
 
 from crewai_tools import BaseTool
 from pydantic import BaseModel, Field
-from serpapi import GoogleSearch
+
+from trip_planner.airports import resolve_airport_codes
+from trip_planner.tools.agno.flights import serpapi_search
 
 from enum import Enum
 
@@ -18,8 +22,8 @@ class FlightType(Enum):
 
 
 class FlightSearchToolSchema(BaseModel):
-    departure_airport: str = Field(..., description="The departure airport IATA code")
-    arrival_airport: str = Field(..., description="The arrival airport IATA code")
+    departure_airport: str = Field(..., description="The departure airport IATA code or city name")
+    arrival_airport: str = Field(..., description="The arrival airport IATA code or city name")
     departure_date: str = Field(..., description="The departure date")
     return_date: str = Field(..., description="The return date")
     flight_type: FlightType = Field(FlightType.ONE_WAY, description="The type of flight")
@@ -34,8 +38,10 @@ class FlightsSearchTool(BaseTool):
     args_schema: Type[BaseModel] = FlightSearchToolSchema
 
     def _run(self, **kwargs: Any) -> Any:
-        departure_airport = kwargs.get("departure_airport")
-        arrival_airport = kwargs.get("arrival_airport")
+        departure_airport = resolve_airport_codes(kwargs.get("departure_airport"))
+        arrival_airport = resolve_airport_codes(kwargs.get("arrival_airport"))
+        if not departure_airport or not arrival_airport:
+            return {"error": "Unknown airport, search with its IATA code instead"}
         departure_date = kwargs.get("departure_date")
         return_date = kwargs.get("return_date")
         flight_type = FlightType(kwargs.get("flight_type"))
@@ -52,5 +58,4 @@ class FlightsSearchTool(BaseTool):
             "api_key": os.getenv("SERPAPI_KEY")
         }
 
-        search_results = GoogleSearch(params)
-        return search_results.get_dict()
+        return serpapi_search(params)
@@ -0,0 +1,90 @@
+from typing import Any, Dict, List, Optional
+
+from trip_planner.models.flights import Flight, FlightsPlan
+
+MISSING = "N/A"
+
+
+def format_duration(minutes: Optional[int]) -> str:
+    if minutes is None:
+        return MISSING
+    hours, minutes = divmod(int(minutes), 60)
+    return f"{hours}h {minutes}m" if hours else f"{minutes}m"
+
+
+def _unique(values: List[str]) -> List[str]:
+    return list(dict.fromkeys(value for value in values if value))
+
+
+def parse_option(option: Dict[str, Any], currency: str, booking_link: str) -> Optional[Flight]:
+    """
+    Map one google_flights option (a row of best_flights/other_flights) to a Flight.
+
+    An option is a whole journey, so connections are folded into one Flight: airports and
+    times of the first and last segment, the total duration, and the airlines, flight
+    numbers and aircraft of every segment. Returns None for options without segments.
+    """
+    segments = option.get("flights") or []
+    if not segments:
+        return None
+    first, last = segments[0], segments[-1]
+    departure = first.get("departure_airport") or {}
+    arrival = last.get("arrival_airport") or {}
+    price = option.get("price")
+    return Flight(
+        departure_airport=departure.get("id") or departure.get("name") or MISSING,
+        arrival_airport=arrival.get("id") or arrival.get("name") or MISSING,
+        departure_timestamp=departure.get("time") or MISSING,
+        arrival_timestamp=arrival.get("time") or MISSING,
+        duration=format_duration(option.get("total_duration") or sum(segment.get("duration") or 0 for segment in segments)),
+        airline=", ".join(_unique([segment.get("airline") for segment in segments])) or MISSING,
+        flight_number=" / ".join(_unique([segment.get("flight_number") for segment in segments])) or MISSING,
+        price=f"{price} {currency}" if price is not None else MISSING,
+        aircraft=", ".join(_unique([segment.get("airplane") for segment in segments])) or MISSING,
+        booking_link=booking_link,
+        # Round trip outbound options only carry a departure_token, which fetches return flights and books nothing
+        booking_token=option.get("booking_token"),
+        stops=len(segments) - 1,
+    )
+
+
+def parse_flights(search_results: Dict[str, Any], limit: Optional[int] = None) -> List[Flight]:
+    """
+    Flights of a google_flights search, Google's best flights first and then the rest by price.
+
+    Identical journeys listed in both sections are kept once.
+    """
+    currency = (search_results.get("search_parameters") or {}).get("currency", "USD")
+    booking_link = (search_results.get("search_metadata") or {}).get("google_flights_url") or MISSING
+    other_flights = sorted(
+        search_results.get("other_flights") or [],
+        key=lambda option: option.get("price") if option.get("price") is not None else float("inf"),
+    )
+    flights = []
+    seen = set()
+    for option in (search_results.get("best_flights") or []) + other_flights:
+        flight = parse_option(option, currency, booking_link)
+        if flight is None:
+            continue
+        key = (flight.flight_number, flight.departure_timestamp)
+        if key in seen:
+            continue
+        seen.add(key)
+        flights.append(flight)
+        if limit is not None and len(flights) >= limit:
+            break
+    return flights
+
+
+def parse_flights_plan(
+    search_results: Dict[str, Any],
+    departure_city: str,
+    arrival_city: str,
+    limit: Optional[int] = None,
+) -> FlightsPlan:
+    """FlightsPlan for one route straight from the SerpAPI response, with no model in the loop."""
+    return FlightsPlan(
+        flights=parse_flights(search_results, limit),
+        departure_city=departure_city,
+        arrival_city=arrival_city,
+    )
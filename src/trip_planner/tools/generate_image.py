@@ -1,34 +1,104 @@
+import asyncio
+import base64
+import hashlib
+import json
 import os
-import requests
+from typing import Dict
 
-url = "https://api.getimg.ai/v1/flux-schnell/text-to-image"
+from trip_planner.http_clients import async_client
+from trip_planner.image_store import IMAGE_ID_LENGTH, get_image_store
+from trip_planner.metrics import IMAGE_GENERATION_SECONDS, timed
+
+url = os.getenv("GETIMG_URL", "https://api.getimg.ai/v1/flux-schnell/text-to-image")
 BEARER_KEY = os.environ.get("GETIMG_API_KEY")
 
+IMAGE_TIMEOUT_SECONDS = float(os.getenv("IMAGE_TIMEOUT_SECONDS", "30"))
+
+# Generations already running, so concurrent requests for the same image share one API call
+_in_flight: Dict[str, "asyncio.Future[str]"] = {}
+
 
-def generate_image(
+def _payload(
     image_prompt: str,
     height: int = 512,
     width: int = 1024,
     steps: int = 4,
     output_format: str = "jpeg",
-    response_format: str = "b64"
-) -> str:
-    payload = {
+) -> dict:
+    return {
         "prompt": image_prompt,
         "height": height,
         "width": width,
         "steps": steps,
         "output_format": output_format,
-        "response_format": response_format,
+        "response_format": "b64",
     }
+
+
+def image_generation_id(image_prompt: str, **params) -> str:
+    """
+    ID of the image that `generate_image` produces for these arguments.
+
+    It is known before the image exists and resolves to the stored image once the
+    generation finishes, so it can be handed out for images that are still pending.
+    """
+    payload = _payload(image_prompt, **params)
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()[:IMAGE_ID_LENGTH]
+
+
+async def generate_image(
+    image_prompt: str,
+    height: int = 512,
+    width: int = 1024,
+    steps: int = 4,
+    output_format: str = "jpeg",
+) -> str:
+    """
+    Generate an image and put it in the image store.
+
+    Returns:
+        str: Content ID of the stored image
+    """
+    payload = _payload(image_prompt, height=height, width=width, steps=steps, output_format=output_format)
+    generation_id = image_generation_id(image_prompt, height=height, width=width, steps=steps, output_format=output_format)
+    store = get_image_store()
+    stored_id = await asyncio.to_thread(store.resolve, generation_id)
+    if stored_id is not None:
+        return stored_id
+
+    if generation_id in _in_flight:
+        return await asyncio.shield(_in_flight[generation_id])
+
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[generation_id] = future
+    try:
+        image = await _request_image(payload)
+        # Writing and evicting touches the disk, keep it off the event loop
+        stored_id = await asyncio.to_thread(store.put, image)
+        await asyncio.to_thread(store.set_alias, generation_id, stored_id)
+        future.set_result(stored_id)
+        return stored_id
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # Nobody else may be waiting, do not let the loop complain about an unretrieved exception
+        future.exception()
+        raise
+    finally:
+        _in_flight.pop(generation_id, None)
+
+
+async def _request_image(payload: dict) -> bytes:
     headers = {
         "accept": "application/json",
         "content-type": "application/json",
         "authorization": f"Bearer {BEARER_KEY}"
     }
 
-    response = requests.post(url, json=payload, headers=headers)
-
-    return response.json()["image"]
-
+    with timed(IMAGE_GENERATION_SECONDS):
+        response = await async_client().post(url, json=payload, headers=headers, timeout=IMAGE_TIMEOUT_SECONDS)
+        response.raise_for_status()
 
+    return base64.b64decode(response.json()["image"])
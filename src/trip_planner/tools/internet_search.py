@@ -1,18 +1,107 @@
-from concurrent.futures import ThreadPoolExecutor
-from functools import partial
+import asyncio
+import hashlib
+import os
+import re
+import time
+from contextlib import asynccontextmanager
 from textwrap import dedent
-from typing import Any, Dict, List, Optional
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
 
+import httpx
 from agno.tools import tool
-from crewai_tools import ScrapeWebsiteTool, SerperDevTool
-from litellm import completion
 
-MAX_WORKERS = 10
+from trip_planner.cache import TieredCache
+from trip_planner.http_clients import async_client
+from trip_planner.llm_cache import cached_acompletion
+from trip_planner.metrics import SCRAPE_SECONDS, SUMMARIZE_SECONDS, timed
+from trip_planner.tools.page_chunking import ChunkSelection, extract_main_text, select_relevant_chunks
+
 DEFAULT_SEARCH_RESULTS = 5
 DEFAULT_MODEL = "groq/meta-llama/llama-4-scout-17b-16e-instruct"
+SERPER_URL = os.getenv("SERPER_URL", "https://google.serper.dev/search")
+
+MAX_CONCURRENT_SCRAPES = int(os.getenv("SEARCH_MAX_CONCURRENT_SCRAPES", "20"))
+MAX_CONCURRENT_SCRAPES_PER_HOST = int(os.getenv("SEARCH_MAX_CONCURRENT_SCRAPES_PER_HOST", "2"))
+MAX_CONCURRENT_SUMMARIES = int(os.getenv("SEARCH_MAX_CONCURRENT_SUMMARIES", "10"))
+SEARCH_TIMEOUT_SECONDS = float(os.getenv("SEARCH_TIMEOUT_SECONDS", "10"))
+SCRAPE_TIMEOUT_SECONDS = float(os.getenv("SCRAPE_TIMEOUT_SECONDS", "10"))
+SUMMARIZE_TIMEOUT_SECONDS = float(os.getenv("SUMMARIZE_TIMEOUT_SECONDS", "30"))
+TOOL_DEADLINE_SECONDS = float(os.getenv("SEARCH_TOOL_DEADLINE_SECONDS", "45"))
+MAX_PAGE_BYTES = int(os.getenv("SCRAPE_MAX_PAGE_BYTES", str(2 * 1024 * 1024)))
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", "2000"))
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "200"))
+
+PAGE_CACHE_FRESH_SECONDS = float(os.getenv("PAGE_CACHE_FRESH_SECONDS", str(60 * 60)))
+PAGE_CACHE_TTL_SECONDS = float(os.getenv("PAGE_CACHE_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+PAGE_CACHE_MAX_BYTES = int(os.getenv("PAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+SUMMARY_CACHE_TTL_SECONDS = float(os.getenv("SUMMARY_CACHE_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+SUMMARY_CACHE_MAX_BYTES = int(os.getenv("SUMMARY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Raw page text by URL, revalidated with ETag/Last-Modified once it is older than PAGE_CACHE_FRESH_SECONDS
+page_cache = TieredCache(
+    "pages",
+    ttl=PAGE_CACHE_TTL_SECONDS,
+    memory_entries=128,
+    disk_entries=100_000,
+    disk_bytes=PAGE_CACHE_MAX_BYTES,
+)
+# Summaries by content hash and normalized query, so a page that did not change is never summarized twice
+summary_cache = TieredCache(
+    "summaries",
+    ttl=SUMMARY_CACHE_TTL_SECONDS,
+    memory_entries=1024,
+    disk_entries=100_000,
+    disk_bytes=SUMMARY_CACHE_MAX_BYTES,
+)
+
+SCRAPE_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+
+
+class _Limits:
+    """
+    Concurrency limits shared by every search running on an event loop.
+
+    asyncio primitives are bound to the loop they are first used on, so they are rebuilt
+    if the tool is ever called from a different loop. Connections come from the shared
+    pool in http_clients.
+    """
+
+    def __init__(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.scrapes = asyncio.Semaphore(MAX_CONCURRENT_SCRAPES)
+        self.summaries = asyncio.Semaphore(MAX_CONCURRENT_SUMMARIES)
+        # Semaphore and number of scrapes using it per host, dropped once no scrape does
+        self.hosts: Dict[str, Tuple[asyncio.Semaphore, List[int]]] = {}
+
+    @asynccontextmanager
+    async def host(self, host: str) -> AsyncIterator[None]:
+        """Hold one of the host's scrape slots for the duration of the block."""
+        if host not in self.hosts:
+            self.hosts[host] = (asyncio.Semaphore(MAX_CONCURRENT_SCRAPES_PER_HOST), [0])
+        semaphore, users = self.hosts[host]
+        users[0] += 1
+        try:
+            async with semaphore:
+                yield
+        finally:
+            users[0] -= 1
+            if not users[0]:
+                del self.hosts[host]
+
+
+_limits: Optional[_Limits] = None
 
 
-_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+def _get_limits() -> _Limits:
+    global _limits
+    if _limits is None or _limits.loop is not asyncio.get_running_loop():
+        _limits = _Limits()
+    return _limits
 
 
 @tool(
@@ -20,119 +109,212 @@ _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
     description="Get top search results from the internet with scraped content",
     show_result=True,
 )
-def get_top_internet_search_results(search_query: str) -> str:
+async def get_top_internet_search_results(search_query: str) -> str:
     """
     Get top search results from the internet and scrape their content.
 
     Args:
         search_query: The search query to execute
-        num_results: Number of search results to fetch and scrape, max 5
 
     Returns:
-        List of dictionaries containing search results with scraped content
+        Summaries of the scraped search results relevant to the query
     """
+    search_results = await _search(search_query, n_results=DEFAULT_SEARCH_RESULTS)
+    summaries = await _collect_summaries(search_results, search_query, deadline=TOOL_DEADLINE_SECONDS)
+    return "".join(f"{summary}\n\n" for summary in summaries)
+
+
+async def _collect_summaries(search_results: List[Dict[str, str]], search_query: str, deadline: float) -> List[str]:
+    """
+    Scrape and summarize all results concurrently, keeping summaries in the order they finish.
+
+    Sites that are still running when the deadline passes are cancelled and left out,
+    so one slow site cannot hold back the whole tool call.
+    """
+    tasks = [
+        asyncio.create_task(_scrape_and_summarize_site(result, search_query))
+        for result in search_results
+    ]
+    summaries = []
     try:
-        search_results = SerperDevTool()._run(search_query=search_query, n_results=DEFAULT_SEARCH_RESULTS)
-        parsed_results = _parse_search_results(search_results)
-
-        scrape_partial = partial(_scrape_and_summarize_site, search_query=search_query)
-        scraped_contents = list(_executor.map(scrape_partial, parsed_results))
-
-        output_content = ""
-        for i, content in enumerate(scraped_contents):
-            if content:
-                # parsed_results[i]["scraped_content"] = content
-                output_content += f"{content}\n\n"
-            # else:
-                # parsed_results[i]["scraped_content"] = ""
-
-        return output_content
-        
-    except Exception as e:
-        raise e
-
-def _parse_search_results(search_results: str) -> List[Dict[str, str]]:
+        for next_done in asyncio.as_completed(tasks, timeout=deadline):
+            summary = await next_done
+            if summary:
+                summaries.append(summary)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+    return summaries
+
+
+async def _search(search_query: str, n_results: int = DEFAULT_SEARCH_RESULTS) -> List[Dict[str, str]]:
     """
-    Parse search results string into structured data.
-    
+    Run a Google search through the Serper API.
+
     Args:
-        search_results: Raw search results string from SerperDevTool
-        
+        search_query: The search query to execute
+        n_results: Number of organic results to return
+
     Returns:
-        List of dictionaries with parsed search result data
+        List of dictionaries with the title, link and snippet of every result
     """
-    if not search_results:
-        return []
-        
-    clean_results = search_results.replace("Search results: ", "")
-    sites_info = clean_results.split("---")
-    
-    parsed_results = []
-    for site in sites_info:
-        site_mapping = {}
-        for line in site.split("\n"):
-            if not line.strip():
-                continue
-                
-            try:
-                key, value = line.split(": ", 1)
-                site_mapping[key.lower().strip()] = value.strip()
-            except ValueError:
-                continue
-                
-        if site_mapping:
-            parsed_results.append(site_mapping)
-            
-    return parsed_results
-
-
-def _scrape_and_summarize_site(search_result: Dict[str, str], search_query: str) -> Optional[str]:
+    response = await async_client().post(
+        SERPER_URL,
+        json={"q": search_query, "num": n_results},
+        headers={"X-API-KEY": os.getenv("SERPER_API_KEY", ""), "Content-Type": "application/json"},
+        timeout=SEARCH_TIMEOUT_SECONDS,
+    )
+    response.raise_for_status()
+    organic = response.json().get("organic", [])
+    return [
+        {
+            "title": result.get("title", ""),
+            "link": result.get("link", ""),
+            "snippet": result.get("snippet", ""),
+        }
+        for result in organic[:n_results]
+        if result.get("link")
+    ]
+
+
+async def _scrape_and_summarize_site(search_result: Dict[str, str], search_query: str) -> Optional[str]:
     """
     Scrape a website and summarize its content relevant to the search query.
-    
+
     Args:
         search_result: Dictionary containing search result data including 'link'
         search_query: Original search query for context
-        
+
     Returns:
         Summarized content or None if scraping fails
     """
     url = search_result.get("link")
     if not url:
         return None
-        
+
     try:
-        scraped_content = ScrapeWebsiteTool()._run(website_url=url)
-        
+        with timed(SCRAPE_SECONDS):
+            scraped_content = await _scrape(url)
+
         if not scraped_content:
             return None
-            
-        summary = _summarize_content(scraped_content, search_query)
 
-        print("-" * 40)
-        print(summary)
-        print("-" * 40)
+        summary_key = f"{_content_hash(scraped_content)}:{_normalize_query(search_query)}"
+        summary = await asyncio.to_thread(summary_cache.get, summary_key)
+        if summary is not None:
+            return summary
 
+        with timed(SUMMARIZE_SECONDS):
+            summary = await _summarize_content(scraped_content, search_query)
+        if summary is None:
+            return None
+        await asyncio.to_thread(summary_cache.set, summary_key, summary)
         return summary
-        
+
     except Exception:
         return None
 
 
-def _summarize_content(content: str, search_query: str) -> Optional[str]:
+def _content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _normalize_query(search_query: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", search_query.lower()).split())
+
+
+async def _scrape(url: str) -> Optional[str]:
+    """
+    Download a page and extract its visible text, going through the page cache.
+
+    Fresh cache entries are returned without touching the network. Stale entries are
+    revalidated with a conditional request and reused when the server answers 304.
+
+    Args:
+        url: Page to scrape
+
+    Returns:
+        Page text with collapsed whitespace or None if the page could not be fetched
+    """
+    # The disk tier is a SQLite file, keep its reads and writes off the event loop like the parsing below
+    cached = await asyncio.to_thread(page_cache.get, url)
+    if cached is not None and time.time() - cached["fetched_at"] < PAGE_CACHE_FRESH_SECONDS:
+        return cached["text"]
+
+    headers = {}
+    if cached is not None:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    limits = _get_limits()
+    host = urlparse(url).netloc
+    async with limits.scrapes, limits.host(host):
+        async with async_client().stream(
+            "GET",
+            url,
+            headers={**SCRAPE_HEADERS, **headers},
+            follow_redirects=True,
+            timeout=SCRAPE_TIMEOUT_SECONDS,
+        ) as response:
+            if response.status_code == 304 and cached is not None:
+                await asyncio.to_thread(page_cache.set, url, {**cached, "fetched_at": time.time()})
+                return cached["text"]
+            if response.status_code >= 400:
+                return None
+            html = await _read_capped(response, MAX_PAGE_BYTES)
+
+    # HTML parsing is CPU bound, keep it off the event loop
+    text = await asyncio.to_thread(extract_main_text, html)
+    if text:
+        await asyncio.to_thread(page_cache.set, url, {
+            "text": text,
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+            "fetched_at": time.time(),
+        })
+    return text
+
+
+async def _read_capped(response: httpx.Response, max_bytes: int) -> str:
+    """Read at most `max_bytes` of the response body, huge pages are cut instead of downloaded in full."""
+    body = bytearray()
+    async for data in response.aiter_bytes():
+        body.extend(data)
+        if len(body) >= max_bytes:
+            break
+    return bytes(body[:max_bytes]).decode(response.encoding or "utf-8", errors="replace")
+
+
+def _select_content(content: str, search_query: str) -> ChunkSelection:
+    return select_relevant_chunks(
+        content,
+        search_query,
+        token_budget=SUMMARY_TOKEN_BUDGET,
+        chunk_tokens=SUMMARY_CHUNK_TOKENS,
+    )
+
+
+async def _summarize_content(content: str, search_query: str) -> Optional[str]:
     """
     Summarize website content using AI model.
-    
+
+    Only the chunks of the page most relevant to the query are sent, within SUMMARY_TOKEN_BUDGET.
+
     Args:
         content: Raw website content
         search_query: Original search query for context
-        
+
     Returns:
         Summarized content or None if summarization fails
     """
+    content = _select_content(content, search_query).text
     prompt = dedent(f"""\
         Summarize this website content related to the search query: "{search_query}"
-        
+
         Focus on extracting information about events, restaurants, or landmarks.
         Filter out information not related to the search query (irrelevant dates, locations, etc.)
 
@@ -143,23 +325,27 @@ def _summarize_content(content: str, search_query: str) -> Optional[str]:
         **Price:** [Cost/pricing range]
         **Type:** [Category - event type, cuisine style, landmark type]
         **Key Details:** [1-2 most important features/highlights]
-                    
+
         Website content:
         {content}
-        
+
         Return the summary in markdown format. If no relevant information is found, return "No relevant information found."
     """)
 
     try:
-        response = completion(
-            model=DEFAULT_MODEL,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that summarizes travel-related website content."},
-                {"role": "user", "content": prompt}
-            ],
-        )
-        
+        async with _get_limits().summaries:
+            response = await asyncio.wait_for(
+                cached_acompletion(
+                    model=DEFAULT_MODEL,
+                    messages=[
+                        {"role": "system", "content": "You are a helpful assistant that summarizes travel-related website content."},
+                        {"role": "user", "content": prompt}
+                    ],
+                ),
+                timeout=SUMMARIZE_TIMEOUT_SECONDS,
+            )
+
         return response.choices[0].message.content # type: ignore
-        
+
     except Exception:
         return None
@@ -0,0 +1,187 @@
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import List, Optional
+
+from bs4 import BeautifulSoup
+
+# Elements that almost never carry the content we summarize
+BOILERPLATE_TAGS = [
+    "script", "style", "noscript", "template", "svg", "canvas", "iframe",
+    "nav", "footer", "aside", "form", "button", "select", "option",
+]
+# A <header> is page chrome unless it heads content, "<article><header><h1>" holds the title
+CONTENT_TAGS = ["article", "main"]
+# Words in class and id names of page chrome, matched against whole name parts so that
+# "nav-links" and "cookie-banner" go but "unavailable" and "shareholder" stay
+BOILERPLATE_WORDS = frozenset("""
+cookie cookies consent banner newsletter subscribe breadcrumb breadcrumbs sidebar menu footer header
+nav navbar navigation social share sharing popup modal advert ads promo
+""".split())
+# Words that also name parts of content ("card-header", "menu-section" of a restaurant),
+# only matched as the whole name or after a page-level qualifier
+AMBIGUOUS_BOILERPLATE_WORDS = frozenset({"header", "menu", "banner"})
+PAGE_QUALIFIERS = frozenset({"site", "page", "main", "global", "top", "primary", "secondary", "mobile", "sticky"})
+
+STOP_WORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were will with
+what when where which who how best top near your you our we i me my
+""".split())
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+# Put between selected chunks that were not next to each other on the page
+CHUNK_SEPARATOR = "\n...\n"
+
+
+@dataclass
+class ChunkSelection:
+    text: str
+    original_tokens: int
+    selected_tokens: int
+    chunks_total: int
+    chunks_selected: int
+
+    @property
+    def reduction(self) -> float:
+        if not self.original_tokens:
+            return 0.0
+        return 1 - self.selected_tokens / self.original_tokens
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count, about four characters per token for English text."""
+    return (len(text) + 3) // 4
+
+
+def is_boilerplate_name(name: Optional[str]) -> bool:
+    """Whether a single class or id value names page chrome, e.g. "site-header" but not "card-header"."""
+    if not name:
+        return False
+    parts = [part for part in re.split(r"[-_]+", name.lower()) if part]
+    if not parts:
+        return False
+    if parts[0] in BOILERPLATE_WORDS:
+        return parts[0] not in AMBIGUOUS_BOILERPLATE_WORDS or len(parts) == 1
+    return len(parts) == 2 and parts[0] in PAGE_QUALIFIERS and parts[1] in BOILERPLATE_WORDS
+
+
+def extract_main_text(html: str) -> str:
+    """
+    Extract readable text from HTML, dropping scripts, navigation and other page chrome.
+
+    Args:
+        html: Raw HTML of the page
+
+    Returns:
+        Text with one block per line and collapsed whitespace
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    for element in soup(BOILERPLATE_TAGS):
+        element.decompose()
+    for element in soup("header"):
+        if not element.decomposed and element.find_parent(CONTENT_TAGS) is None:
+            element.decompose()
+    # Class names are checked one at a time, "event card-header" is judged by each of its classes
+    chrome = soup.find_all(class_=is_boilerplate_name) + soup.find_all(id=is_boilerplate_name)
+    for element in chrome:
+        # Only drop small containers, a content wrapper may be named like page chrome
+        if element.decomposed or len(element.get_text(" ", strip=True)) > 2000:
+            continue
+        element.decompose()
+
+    text = soup.get_text("\n")
+    lines = (" ".join(line.split()) for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def split_into_chunks(text: str, chunk_tokens: int = 200) -> List[str]:
+    """
+    Split text into chunks of roughly `chunk_tokens` tokens along line boundaries.
+
+    Lines longer than a chunk are split on sentence boundaries first and on words as a last resort.
+    """
+    max_chars = chunk_tokens * 4
+    pieces: List[str] = []
+    for line in text.splitlines():
+        if len(line) <= max_chars:
+            pieces.append(line)
+            continue
+        for sentence in re.split(r"(?<=[.!?])\s+", line):
+            while len(sentence) > max_chars:
+                cut = sentence.rfind(" ", 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                pieces.append(sentence[:cut])
+                sentence = sentence[cut:].lstrip()
+            if sentence:
+                pieces.append(sentence)
+
+    chunks: List[str] = []
+    current: List[str] = []
+    current_chars = 0
+    for piece in pieces:
+        if current and current_chars + len(piece) > max_chars:
+            chunks.append("\n".join(current))
+            current, current_chars = [], 0
+        current.append(piece)
+        current_chars += len(piece) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def _tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+def bm25_scores(query: str, chunks: List[str], k1: float = 1.5, b: float = 0.75) -> List[float]:
+    """Okapi BM25 score of every chunk against the query, the chunks themselves are the corpus."""
+    query_terms = set(_tokenize(query))
+    if not chunks or not query_terms:
+        return [0.0] * len(chunks)
+
+    tokenized = [_tokenize(chunk) for chunk in chunks]
+    avg_length = sum(len(tokens) for tokens in tokenized) / len(tokenized) or 1.0
+    document_frequency = Counter(term for tokens in tokenized for term in set(tokens) if term in query_terms)
+
+    scores = []
+    for tokens in tokenized:
+        frequencies = Counter(tokens)
+        score = 0.0
+        for term in query_terms:
+            frequency = frequencies.get(term)
+            if not frequency:
+                continue
+            idf = math.log(1 + (len(chunks) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            score += idf * frequency * (k1 + 1) / (frequency + k1 * (1 - b + b * len(tokens) / avg_length))
+        scores.append(score)
+    return scores
+
+
+def select_relevant_chunks(text: str, query: str, token_budget: int, chunk_tokens: int = 200) -> ChunkSelection:
+    """
+    Keep the chunks of `text` that are most relevant to `query` within `token_budget` tokens.
+
+    Chunks are ranked with BM25 and the selected ones are returned in their original
+    page order, so the summarizer still sees a coherent excerpt.
+    """
+    original_tokens = estimate_tokens(text)
+    chunks = split_into_chunks(text, chunk_tokens=chunk_tokens)
+    if original_tokens <= token_budget:
+        return ChunkSelection(text, original_tokens, original_tokens, len(chunks), len(chunks))
+
+    scores = bm25_scores(query, chunks)
+    ranked = sorted(range(len(chunks)), key=lambda i: (-scores[i], i))
+
+    selected = []
+    used_tokens = 0
+    for index in ranked:
+        # Every chunk after the first also brings a separator
+        chunk_size = estimate_tokens(chunks[index]) + (estimate_tokens(CHUNK_SEPARATOR) if selected else 0)
+        if used_tokens + chunk_size > token_budget:
+            continue
+        selected.append(index)
+        used_tokens += chunk_size
+
+    selected_text = CHUNK_SEPARATOR.join(chunks[i] for i in sorted(selected))
+    return ChunkSelection(selected_text, original_tokens, estimate_tokens(selected_text), len(chunks), len(selected))
@@ -0,0 +1,38 @@
+import os
+from typing import Any, Optional
+
+# "off" (default) or "phoenix", which sends traces of agent runs and model calls to a Phoenix collector
+TRACING = os.getenv("TRACING", "off")
+PHOENIX_COLLECTOR_ENDPOINT = os.getenv("PHOENIX_COLLECTOR_ENDPOINT", "http://localhost:6006/v1/traces")
+PHOENIX_PROJECT_NAME = os.getenv("PHOENIX_PROJECT_NAME", "agno_trip_planner")
+
+_tracer_provider: Optional[Any] = None
+
+
+def setup_tracing() -> Optional[Any]:
+    """
+    Register the Phoenix tracer and instrument agno when tracing is enabled, once per process.
+
+    Spans are exported in batches from a background thread, so a slow or missing collector
+    does not hold up requests.
+    """
+    global _tracer_provider
+    if TRACING != "phoenix" or _tracer_provider is not None:
+        return _tracer_provider
+    from phoenix.otel import register
+
+    _tracer_provider = register(
+        endpoint=PHOENIX_COLLECTOR_ENDPOINT,
+        project_name=PHOENIX_PROJECT_NAME,
+        batch=True,
+        auto_instrument=True,
+    )
+    return _tracer_provider
+
+
+def shutdown_tracing() -> None:
+    """Flush the spans still queued for export."""
+    global _tracer_provider
+    if _tracer_provider is not None:
+        _tracer_provider.shutdown()
+        _tracer_provider = None
@@ -0,0 +1,9 @@
+import os
+import tempfile
+
+# litellm fetches its model price list on import unless told to use the bundled copy
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+# Caches start empty and stay out of the working tree, a warm cache would skip recorded calls
+os.environ.setdefault("TRIP_PLANNER_CACHE_DIR", tempfile.mkdtemp(prefix="trip_planner_tests_"))
+# agno reports every run to its API otherwise
+os.environ.setdefault("AGNO_TELEMETRY", "false")
@@ -0,0 +1,51 @@
+import pytest
+
+from trip_planner.airports import AirportIndex, get_airport_index, resolve_airport_codes
+
+
+@pytest.fixture(scope="module")
+def index() -> AirportIndex:
+    return get_airport_index()
+
+
+def test_lookup_ranks_airports_of_a_city_by_traffic(index):
+    assert [airport.iata for airport in index.lookup("Paris")] == ["CDG", "ORY", "BVA"]
+
+
+def test_lookup_filters_by_country(index):
+    assert [airport.iata for airport in index.lookup("Paris, FR")] == ["CDG", "ORY", "BVA"]
+
+
+def test_lookup_with_other_country_finds_nothing(index):
+    assert index.lookup("Paris, US") == ()
+
+
+def test_lookup_keeps_names_containing_a_comma(index):
+    assert {airport.iata for airport in index.lookup("Washington, DC")} == {"IAD", "DCA"}
+
+
+@pytest.mark.parametrize("name", ["Kyiv", "Kiev"])
+def test_aliases_find_every_airport_of_the_city(index, name):
+    assert [airport.iata for airport in index.lookup(name)] == ["KBP", "IEV"]
+
+
+@pytest.mark.parametrize("name, codes", [("Newark", ["EWR"]), ("Burbank", ["BUR"]), ("Ciampino", ["CIA"])])
+def test_airport_aliases_find_only_their_airport(index, name, codes):
+    assert [airport.iata for airport in index.lookup(name)] == codes
+
+
+def test_city_wide_aliases_find_every_listed_airport(index):
+    assert [airport.iata for airport in index.lookup("NYC")] == ["JFK", "EWR", "LGA"]
+
+
+def test_lookup_matches_misspelled_names(index):
+    assert index.lookup("Pariss")[0].iata == "CDG"
+
+
+def test_airport_codes_keeps_known_codes(index):
+    assert index.airport_codes("LHR") == "LHR"
+
+
+def test_unknown_city_has_no_codes(index):
+    assert index.airport_codes("Springfield") is None
+    assert resolve_airport_codes("Springfield") == ""
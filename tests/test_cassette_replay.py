@@ -0,0 +1,89 @@
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+import httpx
+
+from trip_planner.cassette import use_cassette
+
+REPO_DIR = Path(__file__).parent.parent
+# A /plan_itinerary run recorded with CASSETTE_MODE=record against benchmarks/fake_services.py
+# and the stub MCP servers: the day allocation and the planning team of each city
+PLAN_ITINERARY_CASSETTE = Path(__file__).parent / "fixtures" / "plan_itinerary.jsonl"
+PLAN_ITINERARY_INTERACTIONS = 5
+
+PLAN_ITINERARY_REQUEST = {
+    "traveler_input": {
+        "country": "Portugal",
+        "cities": ["Lisbon", "Porto"],
+        "arrival_date": "2025-06-12",
+        "departure_date": "2025-06-15",
+        "age": 30,
+        "preferences": ["food", "music"],
+    }
+}
+
+
+
+
+def stub_servers(monkeypatch) -> None:
+    # MCP servers still start on replay, their tool calls are answered from the cassette
+    monkeypatch.setenv("GOOGLE_MAPS_MCP_COMMAND", f"{sys.executable} {REPO_DIR / 'benchmarks' / 'stub_mcp.py'} maps")
+    monkeypatch.setenv("OPENAI_API_KEY", "unused")
+    monkeypatch.setenv("GROQ_API_KEY", "unused")
+
+
+def sse_events(body: str) -> list:
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+async def post(path: str, payload: dict) -> httpx.Response:
+    from deploy.api import app
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test", timeout=300) as client:
+        return await client.post(path, json=payload)
+
+
+def test_plan_itinerary_replays_from_cassette(monkeypatch):
+    stub_servers(monkeypatch)
+
+    with use_cassette(str(PLAN_ITINERARY_CASSETTE), "replay", speed="instant") as cassette:
+        response = asyncio.run(post("/plan_itinerary", PLAN_ITINERARY_REQUEST))
+
+    assert response.status_code == 200, response.text
+    city_plans = response.json()["itinerary"]["city_plans"]
+    assert [(plan["city"], plan["arrival_date"], plan["departure_date"]) for plan in city_plans] == [
+        ("Lisbon", "2025-06-12", "2025-06-14"),
+        ("Porto", "2025-06-14", "2025-06-15"),
+    ]
+    # The recorded Lisbon plan has no 2025-06-13 and a 2025-06-14 outside the stay, which the merge drops
+    assert [[day_plan["date"] for day_plan in plan["day_plans"]] for plan in city_plans] == [
+        ["2025-06-12"],
+        ["2025-06-14", "2025-06-15"],
+    ]
+    # Every recorded interaction was replayed once and nothing else was called
+    assert cassette.replayed == PLAN_ITINERARY_INTERACTIONS
+    assert len(cassette) == 0
+
+
+def test_plan_itinerary_stream_runs_the_same_planner(monkeypatch):
+    stub_servers(monkeypatch)
+
+    with use_cassette(str(PLAN_ITINERARY_CASSETTE), "replay", speed="instant") as cassette:
+        response = asyncio.run(post("/plan_itinerary/stream", PLAN_ITINERARY_REQUEST))
+
+    assert response.status_code == 200, response.text
+    events = sse_events(response.text)
+    assert [name for name, _ in events][0] == "progress"
+    assert sorted(data["city_plan"]["city"] for name, data in events if name == "city_plan") == ["Lisbon", "Porto"]
+    name, itinerary = events[-1]
+    assert name == "itinerary"
+    assert [plan["city"] for plan in itinerary["city_plans"]] == ["Lisbon", "Porto"]
+    # The same recorded calls as /plan_itinerary, so both endpoints plan the same way
+    assert cassette.replayed == PLAN_ITINERARY_INTERACTIONS
+    assert len(cassette) == 0
@@ -0,0 +1,84 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from trip_planner.tools.flights_parser import MISSING, parse_flights, parse_flights_plan
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def load(name: str) -> dict:
+    return json.loads((FIXTURES / f"{name}.json").read_text())
+
+
+@pytest.fixture
+def one_way() -> dict:
+    return load("google_flights_one_way")
+
+
+@pytest.fixture
+def round_trip() -> dict:
+    return load("google_flights_round_trip")
+
+
+def test_best_flights_first_then_other_flights_by_price(one_way):
+    flights = parse_flights(one_way)
+
+    assert [flight.flight_number for flight in flights] == [
+        "LH 1173 / LH 1490",
+        "LO 436 / LO 751",
+        "TK 1760 / TK 1633 / LH 2544",
+        "OS 380 / OS 761",
+    ]
+
+
+def test_journey_listed_twice_is_kept_once(one_way):
+    flights = parse_flights(one_way)
+
+    lufthansa = [flight for flight in flights if flight.flight_number == "LH 1173 / LH 1490"]
+    assert len(lufthansa) == 1
+    assert lufthansa[0].price == "243 EUR"
+
+
+def test_multi_leg_layovers_are_folded_into_one_flight(one_way):
+    flight = parse_flights(one_way)[2]
+
+    assert flight.departure_airport == "LIS"
+    assert flight.arrival_airport == "IEV"
+    assert flight.departure_timestamp == "2025-06-12 13:20"
+    assert flight.arrival_timestamp == "2025-06-13 10:25"
+    assert flight.duration == "21h 5m"
+    assert flight.airline == "Turkish Airlines, Lufthansa CityLine"
+    assert flight.aircraft == "Airbus A321neo, Airbus A320, Canadair RJ 900"
+    assert flight.stops == 2
+    assert flight.price == "198 EUR"
+    assert flight.booking_token == "WyJDalJJYlVKSWFYWk5lRXBy...TK1760TK1633LH2544"
+    assert flight.booking_link == one_way["search_metadata"]["google_flights_url"]
+
+
+def test_missing_price_and_token(one_way):
+    flight = parse_flights(one_way)[-1]
+
+    assert flight.price == MISSING
+    assert flight.booking_token is None
+
+
+def test_departure_token_is_not_a_booking_token(round_trip):
+    flights = parse_flights(round_trip)
+
+    assert [flight.flight_number for flight in flights] == ["BA 178", "VS 4"]
+    assert all(flight.booking_token is None for flight in flights)
+    assert flights[0].price == "812 USD"
+    assert flights[0].stops == 0
+
+
+def test_limit(one_way):
+    plan = parse_flights_plan(one_way, "Lisbon", "Kyiv", limit=2)
+
+    assert [flight.flight_number for flight in plan.flights] == ["LH 1173 / LH 1490", "LO 436 / LO 751"]
+    assert (plan.departure_city, plan.arrival_city) == ("Lisbon", "Kyiv")
+
+
+def test_options_without_segments_are_skipped():
+    assert parse_flights({"best_flights": [{"price": 100, "booking_token": "token"}], "other_flights": []}) == []
@@ -0,0 +1,62 @@
+import asyncio
+import os
+
+import httpx
+
+from trip_planner import image_store
+from trip_planner.image_store import ImageStore, content_id
+
+
+def alias_of(i: int) -> str:
+    return content_id(f"request {i}".encode())
+
+
+def test_evicted_images_take_their_aliases_with_them(tmp_path):
+    store = ImageStore(str(tmp_path), max_bytes=2500)
+    for i in range(4):
+        store.set_alias(alias_of(i), store.put(bytes([i]) * 1000))
+
+    assert [store.resolve(alias_of(i)) is not None for i in range(4)] == [False, False, True, True]
+    assert sorted(os.listdir(tmp_path / "aliases")) == sorted([alias_of(2), alias_of(3)])
+
+
+def test_aliases_count_towards_the_size_budget(tmp_path):
+    store = ImageStore(str(tmp_path))
+    image_id = store.put(b"x" * 1000)
+    store.set_alias(alias_of(0), image_id)
+    store.set_alias(alias_of(0), image_id)
+
+    assert store._total == 1000 + len(image_id)
+
+
+def test_rescan_removes_aliases_of_images_evicted_elsewhere(tmp_path):
+    store = ImageStore(str(tmp_path))
+    image_id = store.put(b"x" * 1000)
+    store.set_alias(alias_of(0), image_id)
+    # Another worker evicted the image
+    os.remove(store._object_path(image_id))
+
+    ImageStore(str(tmp_path)).put(b"y" * 10)
+
+    assert os.listdir(tmp_path / "aliases") == []
+
+
+def test_image_evicted_after_it_was_resolved_is_not_found(tmp_path, monkeypatch):
+    from deploy.api import app
+
+    store = ImageStore(str(tmp_path))
+    image_id = store.put(b"x" * 1000)
+    read = store.read
+
+    def evicted_meanwhile(image_id: str) -> bytes:
+        os.remove(store._object_path(image_id))
+        return read(image_id)
+
+    monkeypatch.setattr(store, "read", evicted_meanwhile)
+    monkeypatch.setattr(image_store, "_store", store)
+
+    async def get() -> httpx.Response:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get(f"/images/{image_id}")
+
+    assert asyncio.run(get()).status_code == 404
@@ -0,0 +1,66 @@
+import asyncio
+import os
+import shlex
+import signal
+import sys
+from pathlib import Path
+
+import pytest
+from mcp import StdioServerParameters
+
+from trip_planner.mcp_pool import MCPServerPool
+
+STUB_MCP = Path(__file__).parent.parent / "benchmarks" / "stub_mcp.py"
+
+
+def stub_server_params(pid_file: Path) -> StdioServerParameters:
+    # The shell records its pid and execs the stub, so the pid is the server process to kill
+    command = f"echo $$ > {shlex.quote(str(pid_file))} && exec {shlex.quote(sys.executable)} {shlex.quote(str(STUB_MCP))} maps"
+    return StdioServerParameters(command="sh", args=["-c", command], env={**os.environ})
+
+
+async def kill_server(pid_file: Path) -> None:
+    os.kill(int(pid_file.read_text()), signal.SIGKILL)
+    # Let the stdio transport notice the closed pipes
+    await asyncio.sleep(0.5)
+
+
+async def list_tools(pool: MCPServerPool) -> list:
+    async with pool.session() as tools:
+        result = await tools.session.list_tools()
+    return [tool.name for tool in result.tools]
+
+
+def test_health_check_replaces_a_crashed_server(tmp_path):
+    pid_file = tmp_path / "server.pid"
+
+    async def run() -> None:
+        pool = MCPServerPool("maps", stub_server_params(pid_file), size=1, health_check_interval=3600)
+        await pool.start()
+        try:
+            old_pid = pid_file.read_text()
+            await kill_server(pid_file)
+            await pool.check()
+            assert pid_file.read_text() != old_pid
+            assert "maps_geocode" in await list_tools(pool)
+        finally:
+            await pool.stop()
+
+    asyncio.run(run())
+
+
+def test_failed_call_replaces_a_crashed_server(tmp_path):
+    pid_file = tmp_path / "server.pid"
+
+    async def run() -> None:
+        pool = MCPServerPool("maps", stub_server_params(pid_file), size=1, health_check_interval=3600)
+        await pool.start()
+        try:
+            await kill_server(pid_file)
+            with pytest.raises(Exception):
+                await list_tools(pool)
+            assert "maps_geocode" in await list_tools(pool)
+        finally:
+            await pool.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,126 @@
+import pytest
+
+from trip_planner.tools.page_chunking import (
+    bm25_scores,
+    estimate_tokens,
+    extract_main_text,
+    is_boilerplate_name,
+    select_relevant_chunks,
+    split_into_chunks,
+)
+
+EVENTS_PAGE = """
+<html>
+<head><title>What's on in Lisbon</title><script>window.dataLayer = [];</script></head>
+<body>
+  <div id="cookie-banner">We use cookies to improve your experience. <a href="#">Accept</a></div>
+  <header><a href="/">Visit Lisbon</a></header>
+  <div class="main-menu"><a href="/events">Events</a> <a href="/food">Food</a></div>
+  <ul class="breadcrumbs"><li>Home</li><li>Events</li></ul>
+  <main id="content">
+    <article class="event-card">
+      <header><h1>Fado night at Clube de Fado</h1></header>
+      <p class="event-description">Traditional fado in Alfama, doors open at 20:00.</p>
+      <p class="promotion-dates">Tickets on sale from 1 to 15 June</p>
+    </article>
+    <article class="event-card sold-out">
+      <div class="card-header"><h2>Live jazz at Hot Clube</h2></div>
+      <p class="unavailable">Sold out, join the waiting list at the door.</p>
+    </article>
+    <section class="restaurant-menu">
+      <h3>Pairing menu at Taberna da Rua</h3>
+      <p>Petiscos and vinho verde before the show.</p>
+    </section>
+    <p class="shareholder-note">Run by the shareholders of the Lisbon Cultural Trust.</p>
+  </main>
+  <div class="share-buttons">Share on Facebook Share on X</div>
+  <div class="newsletter-signup">Subscribe to our newsletter</div>
+  <footer>Copyright Visit Lisbon</footer>
+</body>
+</html>
+"""
+
+
+def test_extract_main_text_keeps_content_named_like_page_chrome():
+    text = extract_main_text(EVENTS_PAGE)
+
+    for content in [
+        "Fado night at Clube de Fado",
+        "Traditional fado in Alfama, doors open at 20:00.",
+        "Tickets on sale from 1 to 15 June",
+        "Live jazz at Hot Clube",
+        "Sold out, join the waiting list at the door.",
+        "Pairing menu at Taberna da Rua",
+        "Run by the shareholders of the Lisbon Cultural Trust.",
+    ]:
+        assert content in text
+
+
+def test_extract_main_text_drops_page_chrome():
+    text = extract_main_text(EVENTS_PAGE)
+
+    for chrome in ["We use cookies", "Visit Lisbon", "Home", "Share on Facebook", "Subscribe", "Copyright", "dataLayer"]:
+        assert chrome not in text
+
+
+@pytest.mark.parametrize("name", ["nav", "navbar", "nav-links", "site-header", "main-menu", "cookie-banner", "social_icons", "footer"])
+def test_is_boilerplate_name_matches_chrome(name):
+    assert is_boilerplate_name(name)
+
+
+@pytest.mark.parametrize("name", ["card-header", "restaurant-menu", "unavailable", "shareholder", "promotion-dates", "menu-section", "canvas-nav-wrapper"])
+def test_is_boilerplate_name_keeps_content(name):
+    assert not is_boilerplate_name(name)
+
+
+def test_bm25_scores_rank_chunks_mentioning_the_query_first():
+    chunks = [
+        "Opening hours of the museum and ticket prices.",
+        "Fado houses in Alfama host fado nights every evening.",
+        "Parking near the station is limited.",
+    ]
+
+    scores = bm25_scores("fado nights in Alfama", chunks)
+
+    assert scores.index(max(scores)) == 1
+    assert scores[0] == scores[2] == 0.0
+
+
+def test_split_into_chunks_respects_the_chunk_size():
+    text = "\n".join(f"Line {i} about the old town and its viewpoints." for i in range(100))
+    text += "\n" + "A very long sentence without an end " * 100
+
+    chunks = split_into_chunks(text, chunk_tokens=50)
+
+    assert all(len(chunk) <= 50 * 4 for chunk in chunks)
+    assert " ".join(" ".join(chunks).split()) == " ".join(text.split())
+
+
+def test_select_relevant_chunks_keeps_relevant_chunks_within_the_budget():
+    filler = [f"Paragraph {i} about parking, weather and opening hours of shops." for i in range(40)]
+    relevant = "The best fado night is at Clube de Fado in Alfama, book a table."
+    text = "\n".join(filler[:20] + [relevant] + filler[20:])
+
+    selection = select_relevant_chunks(text, "fado night Alfama", token_budget=60, chunk_tokens=20)
+
+    assert relevant in selection.text
+    assert selection.selected_tokens <= 60
+    assert selection.chunks_selected < selection.chunks_total
+    assert selection.reduction > 0.5
+
+
+@pytest.mark.parametrize("token_budget", [5, 17, 40, 101])
+def test_select_relevant_chunks_counts_separators_in_the_budget(token_budget):
+    text = "\n".join(f"Fado {i}" for i in range(200))
+
+    selection = select_relevant_chunks(text, "fado", token_budget=token_budget, chunk_tokens=2)
+
+    assert 0 < selection.selected_tokens <= token_budget
+
+
+def test_select_relevant_chunks_keeps_short_pages_whole():
+    text = "Fado in Alfama.\nParking is limited."
+
+    selection = select_relevant_chunks(text, "fado", token_budget=estimate_tokens(text))
+
+    assert selection.text == text
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from trip_planner import refinement
+from trip_planner.models.general import TravelerInput
+from trip_planner.models.itinerary import Activity, CityPlan, DayPlan, Itinerary
+from trip_planner.refinement import DayChange, RefinementScope, refine_itinerary
+
+TRAVELER = TravelerInput(
+    country="Portugal", cities=["Lisbon"], arrival_date="2025-06-12", departure_date="2025-06-14", age=30
+)
+
+
+def day(date: str, activity: str) -> DayPlan:
+    return DayPlan(
+        date=date,
+        activities=[Activity(name=activity, location="Lisbon", description=activity, why_its_suitable="")],
+    )
+
+
+ITINERARY = Itinerary(
+    name="Fado and pastries",
+    city_plans=[
+        CityPlan(
+            city="Lisbon",
+            arrival_date="2025-06-12",
+            departure_date="2025-06-14",
+            day_plans=[day("2025-06-12", "Alfama walk"), day("2025-06-13", "Belem tower"), day("2025-06-14", "LX Factory")],
+        )
+    ],
+)
+
+
+@pytest.fixture
+def planner(monkeypatch):
+    """Stubs the model calls: the scope to return and the days whose re-plan fails."""
+    calls = {"scope": None, "failing": set(), "team": 0}
+
+    async def locate_changes(itinerary, user_feedback):
+        return calls["scope"]
+
+    async def replan_day(traveler_input, itinerary, position, instruction, user_feedback):
+        date = itinerary.city_plans[position[0]].day_plans[position[1]].date
+        if date in calls["failing"]:
+            raise ValueError(f"Could not re-plan Lisbon on {date}")
+        return day(date, instruction)
+
+    async def refine_with_team(traveler_input, itinerary, user_feedback):
+        calls["team"] += 1
+        return itinerary
+
+    monkeypatch.setattr(refinement, "REFINEMENT_MODE", "days")
+    monkeypatch.setattr(refinement, "locate_changes", locate_changes)
+    monkeypatch.setattr(refinement, "replan_day", replan_day)
+    monkeypatch.setattr(refinement, "refine_with_team", refine_with_team)
+    return calls
+
+
+def activities(itinerary: Itinerary) -> list:
+    return [day_plan.activities[0].name for day_plan in itinerary.city_plans[0].day_plans]
+
+
+def test_feedback_changing_no_day_keeps_the_itinerary(planner):
+    planner["scope"] = RefinementScope(replan_all=False, days=[])
+
+    refined = asyncio.run(refine_itinerary(TRAVELER, ITINERARY, "Looks great, thanks!"))
+
+    assert refined == ITINERARY
+    assert planner["team"] == 0
+
+
+def test_only_days_in_scope_are_replanned(planner):
+    planner["scope"] = RefinementScope(
+        replan_all=False, days=[DayChange(city="Lisbon", date="2025-06-13", instruction="Oceanarium")]
+    )
+
+    refined = asyncio.run(refine_itinerary(TRAVELER, ITINERARY, "Aquarium instead of Belem"))
+
+    assert activities(refined) == ["Alfama walk", "Oceanarium", "LX Factory"]
+    assert planner["team"] == 0
+
+
+def test_failed_day_keeps_its_plan(planner):
+    planner["scope"] = RefinementScope(
+        replan_all=False,
+        days=[
+            DayChange(city="Lisbon", date="2025-06-12", instruction="Tram 28"),
+            DayChange(city="Lisbon", date="2025-06-14", instruction="Sintra"),
+        ],
+    )
+    planner["failing"] = {"2025-06-14"}
+
+    refined = asyncio.run(refine_itinerary(TRAVELER, ITINERARY, "Tram on day one, Sintra on the last day"))
+
+    assert activities(refined) == ["Tram 28", "Belem tower", "LX Factory"]
+
+
+def test_every_day_failing_is_an_error(planner):
+    planner["scope"] = RefinementScope(
+        replan_all=False, days=[DayChange(city="Lisbon", date="2025-06-14", instruction="Sintra")]
+    )
+    planner["failing"] = {"2025-06-14"}
+
+    with pytest.raises(ValueError):
+        asyncio.run(refine_itinerary(TRAVELER, ITINERARY, "Sintra on the last day"))
+
+
+@pytest.mark.parametrize(
+    "scope",
+    [
+        None,
+        RefinementScope(replan_all=True, days=[]),
+        RefinementScope(replan_all=False, days=[DayChange(city="Porto", date="2025-06-13", instruction="Port wine")]),
+    ],
+)
+def test_feedback_beyond_known_days_replans_the_trip(planner, scope):
+    planner["scope"] = scope
+
+    asyncio.run(refine_itinerary(TRAVELER, ITINERARY, "Add Porto"))
+
+    assert planner["team"] == 1